@@ -4,6 +4,9 @@ Functions in this module correspond more or less to the functions described
 in the HFSS Scripting Guide, Section "Analysis Setup Module Script Commands"
 
 At last count there were 4 functions implemented out of 20.
+
+setup_parameters() builds the parameters array of a driven setup without
+inserting it.
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 
@@ -75,10 +78,65 @@ def insert_frequency_sweep(oDesign,
                                          "ExtrapToDC:=", ExtrapToDC])
 
 
+def setup_parameters(Frequency,
+                     PortsOnly=True,
+                     MaxDeltaS=0.02,
+                     Name='Setup1',
+                     UseMatrixConv=False,
+                     MaximumPasses=20,
+                     MinimumPasses=2,
+                     MinimumConvergedPasses=2,
+                     PercentRefinement=30,
+                     IsEnabled=True,
+                     BasisOrder=2,
+                     UseIterativeSolver=False,
+                     DoLambdaRefine=True,
+                     DoMaterialLambda=True,
+                     SetLambdaTarget=True,
+                     Target=0.6667,
+                     UseMaxTetIncrease=False,
+                     PortAccuracy=2,
+                     UseABCOnPort=False,
+                     SetPortMinMaxTri=False,
+                     EnableSolverDomains=False,
+                     ThermalFeedback=False,
+                     NoAdditionalRefinementOnImport=False):
+    """
+    Return the parameters array of an HFSS driven analysis setup, as passed
+    to InsertSetup() by insert_analysis_setup().
+
+    The array can also serve as a fingerprint of the setup, e.g. for
+    variationcache.VariationCache.
+    """
+    return ["NAME:" + Name,
+            "Frequency:=", str(Frequency) +"Hz",
+            "PortsOnly:=", PortsOnly,
+            "MaxDeltaS:=", MaxDeltaS,
+            "UseMatrixConv:=", UseMatrixConv,
+            "MaximumPasses:=", MaximumPasses,
+            "MinimumPasses:=", MinimumPasses,
+            "MinimumConvergedPasses:=", MinimumConvergedPasses,
+            "PercentRefinement:=", PercentRefinement,
+            "IsEnabled:=", IsEnabled,
+            "BasisOrder:=", BasisOrder,
+            "UseIterativeSolver:=", UseIterativeSolver,
+            "DoLambdaRefine:=", DoLambdaRefine,
+            "DoMaterialLambda:=", DoMaterialLambda,
+            "SetLambdaTarget:=", SetLambdaTarget,
+            "Target:=", Target,
+            "UseMaxTetIncrease:=", UseMaxTetIncrease,
+            "PortAccuracy:=", PortAccuracy,
+            "UseABCOnPort:=", UseABCOnPort,
+            "SetPortMinMaxTri:=", SetPortMinMaxTri,
+            "EnableSolverDomains:=", EnableSolverDomains,
+            "ThermalFeedback:=", ThermalFeedback,
+            "NoAdditionalRefinementOnImport:=", NoAdditionalRefinementOnImport]
+
+
 def insert_analysis_setup(oDesign, 
                           Frequency,
                           PortsOnly=True,
-                          MaxDeltaS=0.02,                       
+                          MaxDeltaS=0.02,
                           Name='Setup1',
                           UseMatrixConv=False,
                           MaximumPasses=20,
@@ -98,36 +156,36 @@ def insert_analysis_setup(oDesign,
                           SetPortMinMaxTri=False,
                           EnableSolverDomains=False,
                           ThermalFeedback=False,
-                          hNoAdditionalRefinementOnImport=False):
+                          NoAdditionalRefinementOnImport=False):
     """
     Insert an HFSS analysis setup.
     """
     oAnalysisSetup = get_module(oDesign, "AnalysisSetup")
-    oAnalysisSetup.InsertSetup( "HfssDriven", 
-                               ["NAME:" + Name, 
-                                "Frequency:=", str(Frequency) +"Hz", 
-                                "PortsOnly:=", PortsOnly, 
-                                "MaxDeltaS:=", MaxDeltaS, 
-                                "UseMatrixConv:=", UseMatrixConv, 
-                                "MaximumPasses:=", MaximumPasses, 
-                                "MinimumPasses:=", MinimumPasses, 
-                                "MinimumConvergedPasses:=", MinimumConvergedPasses, 
-                                "PercentRefinement:=", PercentRefinement, 
-                                "IsEnabled:=", IsEnabled, 
-                                "BasisOrder:=", BasisOrder, 
-                                "UseIterativeSolver:=", UseIterativeSolver, 
-                                "DoLambdaRefine:=", DoLambdaRefine, 
-                                "DoMaterialLambda:=", DoMaterialLambda, 
-                                "SetLambdaTarget:=", SetLambdaTarget, 
-                                "Target:=", Target, 
-                                "UseMaxTetIncrease:=", UseMaxTetIncrease, 
-                                "PortAccuracy:=", PortAccuracy, 
-                                "UseABCOnPort:=", UseABCOnPort, 
-                                "SetPortMinMaxTri:=", SetPortMinMaxTri, 
-                                "EnableSolverDomains:=", EnableSolverDomains, 
-                                "ThermalFeedback:=", ThermalFeedback, 
-                                "NoAdditionalRefinementOnImport:=", NoAdditionalRefinementOnImport])
-                                
+    oAnalysisSetup.InsertSetup("HfssDriven",
+                               setup_parameters(Frequency,
+                                                PortsOnly=PortsOnly,
+                                                MaxDeltaS=MaxDeltaS,
+                                                Name=Name,
+                                                UseMatrixConv=UseMatrixConv,
+                                                MaximumPasses=MaximumPasses,
+                                                MinimumPasses=MinimumPasses,
+                                                MinimumConvergedPasses=MinimumConvergedPasses,
+                                                PercentRefinement=PercentRefinement,
+                                                IsEnabled=IsEnabled,
+                                                BasisOrder=BasisOrder,
+                                                UseIterativeSolver=UseIterativeSolver,
+                                                DoLambdaRefine=DoLambdaRefine,
+                                                DoMaterialLambda=DoMaterialLambda,
+                                                SetLambdaTarget=SetLambdaTarget,
+                                                Target=Target,
+                                                UseMaxTetIncrease=UseMaxTetIncrease,
+                                                PortAccuracy=PortAccuracy,
+                                                UseABCOnPort=UseABCOnPort,
+                                                SetPortMinMaxTri=SetPortMinMaxTri,
+                                                EnableSolverDomains=EnableSolverDomains,
+                                                ThermalFeedback=ThermalFeedback,
+                                                NoAdditionalRefinementOnImport=NoAdditionalRefinementOnImport))
+
     return Name
 
 
@@ -5,15 +5,88 @@ in the HFSS Scripting Guide, Section "Ansoft Application Object Script
 Commands".
 
 At last count there were 1 functions implemented out of 15.
+
+setup_interface() gets its objects from a backend.  The default "com" 
+backend attaches to HFSS through pywin32, which is only imported when the 
+backend is used, so that the rest of hycohanz can be imported on hosts 
+without pywin32.  Other backends are added with register_backend().
+
+com_errors() returns the exception types with which the backends report 
+that HFSS failed an operation, so that callers can retry or recover from 
+those without hiding other errors.
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 
-import pywintypes
-import win32com.client
+import os
+
+# Backend used by setup_interface() when none is given.  Can be overridden 
+# with the HYCOHANZ_BACKEND environment variable.
+DEFAULT_BACKEND = os.environ.get('HYCOHANZ_BACKEND', 'com')
+
+_BACKENDS = {}
+
+# Exception types raised by the objects of the registered backends when 
+# HFSS fails an operation.
+_ERRORS = []
+
+def register_backend(name, factory, errors=()):
+    """
+    Register a backend for setup_interface().
+    
+    Parameters
+    ----------
+    name : str
+        Name of the backend, as passed to setup_interface().
+    factory : callable
+        Called with the keyword arguments given to setup_interface().  Must 
+        return [oAnsoftApp, oDesktop].
+    errors : sequence of exception types
+        The exceptions that the backend's objects raise when HFSS fails an 
+        operation, in place of pywintypes.com_error.
+        
+    Returns
+    -------
+    None
+    """
+    _BACKENDS[name] = factory
+    _ERRORS.extend(error for error in errors if error not in _ERRORS)
+
+def com_errors():
+    """
+    Return the exception types with which HFSS reports a failed operation: 
+    pywintypes.com_error, if pywin32 is installed, and the errors of the 
+    registered backends.
+    
+    Returns
+    -------
+    errors : tuple of exception types
+    """
+    errors = list(_ERRORS)
+    try:
+        import pywintypes
+    except ImportError:
+        pass
+    else:
+        errors.append(pywintypes.com_error)
+    return tuple(errors)
+
+def get_backends():
+    """
+    Return the names of the registered backends.
+    """
+    return sorted(_BACKENDS)
 
-def setup_interface():
+def setup_interface(backend=None, **options):
     """
-    Set up the COM interface to the running HFSS process.
+    Set up the interface to HFSS.
+    
+    Parameters
+    ----------
+    backend : str
+        Name of the backend to use.  Defaults to DEFAULT_BACKEND, normally 
+        "com", which attaches to the running HFSS process.
+    options
+        Passed to the backend.
     
     Returns
     -------
@@ -28,6 +101,22 @@ def setup_interface():
     >>> [oAnsoftApp, oDesktop] = hfss.setup_interface()
     
     """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    try:
+        factory = _BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Unknown backend {0!r}; registered backends are {1}'.format(
+                         backend, ', '.join(get_backends())))
+    return factory(**options)
+
+def _com_interface():
+    """
+    Attach to the running HFSS process through pywin32.
+    """
+    import pywintypes
+    import win32com.client
+
     # I'm still looking for a better way to do this.  This attaches to an 
     # existing HFSS process instead of creating a new one.  I would highly 
     # prefer that a new process is created.  Apparently 
@@ -43,3 +132,28 @@ def setup_interface():
     oDesktop = oAnsoftApp.GetAppDesktop()
 
     return [oAnsoftApp, oDesktop]
+
+register_backend('com', _com_interface)
+
+
+if __name__ == "__main__":
+    import subprocess
+    import sys
+
+    # Import hycohanz in fresh interpreters with pywin32 made unimportable, 
+    # as on a Linux post-processing host.
+    script = """
+import sys, time
+for name in ('pywintypes', 'pythoncom', 'win32com', 'win32com.client'):
+    sys.modules[name] = None
+t0 = time.time()
+import hycohanz
+t1 = time.time()
+print(t1 - t0, 'numpy' in sys.modules, 'win32com.client' in sys.modules and sys.modules['win32com.client'] is not None)
+"""
+    runs = []
+    for n in range(5):
+        output = subprocess.check_output([sys.executable, '-c', script]).split()
+        runs.append(float(output[0]))
+    print('import hycohanz without pywin32:  {0:.1f} ms (best of 5); numpy imported: {1}, '
+          'win32com imported: {2}'.format(1e3 * min(runs), output[1].decode(), output[2].decode()))
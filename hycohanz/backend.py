@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+"""
+Record the HFSS COM calls made by a script, and replay them without HFSS.
+
+record() wraps an HFSS object (oDesktop, oProject, oDesign, oEditor,
+oModule, ...) in a proxy that forwards every method call and logs it, with
+its marshalled arguments and return value, to a compact binary journal.
+Objects returned by the calls, e.g. the oProject returned by
+oDesktop.GetActiveProject(), are wrapped and logged too.
+
+replay() reads a journal back and returns proxies that serve the recorded
+return values, checking that the calls made are the recorded ones.  A
+replayed script runs all of its Python code, so its Python-side overhead
+can be profiled, and its call counts regression-tested, on hosts without
+HFSS.
+
+Both are also available as setup_interface() backends:
+
+>>> import hycohanz as hfss
+>>> [oAnsoftApp, oDesktop] = hfss.setup_interface('record', journal='run.hyj')
+>>> # ... later, on Linux:
+>>> [oAnsoftApp, oDesktop] = hfss.setup_interface('replay', journal='run.hyj')
+
+Journal format
+--------------
+A journal starts with the 4 bytes MAGIC, followed by records.  Each record
+is a header packed as '<BI' (record kind, payload length) followed by the
+payload.  A CALL payload encodes the tuple (object id, method name,
+arguments), a RETURN payload the return value, and an ERROR payload the
+message of the exception raised.  Values are encoded as a one-byte tag
+followed by the data:
+
+======  =================================================================
+Tag     Value
+======  =================================================================
+N T F   None, True, False
+i       int, packed as '<q'
+d       float, packed as '<d'
+s       str, as a '<I' length and UTF-8 bytes
+b       bytes, as a '<I' length and the bytes
+l t     list, tuple, as a '<I' item count and the items
+o       HFSS object, as a '<I' object id
+r       any other argument, as its repr() encoded like a str
+======  =================================================================
+
+Object ids are assigned in the order objects are first seen; the objects
+given to record() get the first ids.
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import atexit
+import collections
+import struct
+
+from hycohanz.appobject import register_backend, setup_interface
+
+MAGIC = b'HYJ\x01'
+
+CALL = 1
+RETURN = 2
+ERROR = 3
+
+_HEADER = struct.Struct('<BI')
+_COUNT = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+Call = collections.namedtuple('Call', ['objectid', 'name', 'args', 'result', 'error'])
+
+
+class JournalMismatch(RuntimeError):
+    """A replayed script made a call other than the recorded one."""
+
+
+class ReplayedError(RuntimeError):
+    """The recorded call raised an exception, with the recorded message."""
+
+
+def _encode(value, out, objectid):
+    if value is None:
+        out.append(b'N')
+    elif value is True:
+        out.append(b'T')
+    elif value is False:
+        out.append(b'F')
+    elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        out.append(b'i' + _INT.pack(value))
+    elif isinstance(value, float):
+        out.append(b'd' + _FLOAT.pack(value))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(b's' + _COUNT.pack(len(data)) + data)
+    elif isinstance(value, bytes):
+        out.append(b'b' + _COUNT.pack(len(value)) + value)
+    elif isinstance(value, (list, tuple)):
+        out.append((b'l' if isinstance(value, list) else b't') + _COUNT.pack(len(value)))
+        for item in value:
+            _encode(item, out, objectid)
+    else:
+        ident = objectid(value)
+        if ident is None:
+            data = repr(value).encode('utf-8')
+            out.append(b'r' + _COUNT.pack(len(data)) + data)
+        else:
+            out.append(b'o' + _COUNT.pack(ident))
+
+
+def encode(value, objectid=lambda value: None):
+    """
+    Encode a value in the journal format.
+
+    Parameters
+    ----------
+    value : object
+        The value to encode.
+    objectid : callable
+        Returns the object id of a value that isn't a plain value, or None
+        to encode its repr().
+
+    Returns
+    -------
+    data : bytes
+    """
+    out = []
+    _encode(value, out, objectid)
+    return b''.join(out)
+
+
+def _decode(data, pos, makeobject):
+    tag = data[pos:pos + 1]
+    pos += 1
+    if tag == b'N':
+        return None, pos
+    if tag == b'T':
+        return True, pos
+    if tag == b'F':
+        return False, pos
+    if tag == b'i':
+        return _INT.unpack_from(data, pos)[0], pos + _INT.size
+    if tag == b'd':
+        return _FLOAT.unpack_from(data, pos)[0], pos + _FLOAT.size
+
+    count = _COUNT.unpack_from(data, pos)[0]
+    pos += _COUNT.size
+    if tag in (b's', b'r'):
+        return data[pos:pos + count].decode('utf-8'), pos + count
+    if tag == b'b':
+        return bytes(data[pos:pos + count]), pos + count
+    if tag == b'o':
+        return makeobject(count), pos
+    if tag in (b'l', b't'):
+        items = []
+        for n in range(count):
+            item, pos = _decode(data, pos, makeobject)
+            items.append(item)
+        return (items if tag == b'l' else tuple(items)), pos
+    raise ValueError('Unknown journal tag {0!r}'.format(tag))
+
+
+def decode(data, makeobject=lambda ident: ident):
+    """
+    Decode a value encoded in the journal format.
+
+    Parameters
+    ----------
+    data : bytes
+    makeobject : callable
+        Called with the id of each object in the value, and returns the
+        object to put in its place.  By default the id is kept.
+    """
+    value, pos = _decode(data, 0, makeobject)
+    return value
+
+
+class Journal(object):
+    """
+    A journal file opened for writing.  It is closed when the interpreter
+    exits, if not before.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        atexit.register(self.close)
+
+    def write(self, kind, payload):
+        self.file.write(_HEADER.pack(kind, len(payload)))
+        self.file.write(payload)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_records(filename):
+    """
+    Yield the (kind, payload) records of a journal file.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('{0} is not a hycohanz journal'.format(filename))
+
+    pos = len(MAGIC)
+    while pos < len(data):
+        kind, length = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        yield kind, data[pos:pos + length]
+        pos += length
+
+
+def read_journal(filename):
+    """
+    Yield the calls recorded in a journal file, as Call tuples.  HFSS objects
+    are represented by their object ids.
+    """
+    call = None
+    for kind, payload in read_records(filename):
+        if kind == CALL:
+            call = decode(payload)
+        elif kind == RETURN:
+            yield Call(call[0], call[1], call[2], decode(payload), None)
+        else:
+            yield Call(call[0], call[1], call[2], None, decode(payload))
+
+
+def count_calls(filename):
+    """
+    Return a collections.Counter of the method names called in a journal.
+    """
+    return collections.Counter(call.name for call in read_journal(filename))
+
+
+class Recorder(object):
+    """
+    Writes the calls made on its RecordingProxy objects to a journal.
+
+    Parameters
+    ----------
+    journal : str or Journal
+        The journal, or the name of the journal file to create.
+    """
+    def __init__(self, journal):
+        if not isinstance(journal, Journal):
+            journal = Journal(journal)
+        self.journal = journal
+        self.nextid = 0
+
+    def wrap(self, target):
+        """Return a RecordingProxy for target with a new object id."""
+        proxy = RecordingProxy(target, self, self.nextid)
+        self.nextid += 1
+        return proxy
+
+    def _wrap_result(self, value):
+        """Wrap the HFSS objects in a return value."""
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._wrap_result(item) for item in value)
+        return self.wrap(value)
+
+    @staticmethod
+    def _objectid(value):
+        return value._ident if isinstance(value, RecordingProxy) else None
+
+    def call(self, proxy, name, args):
+        self.journal.write(CALL, encode((proxy._ident, name, args), self._objectid))
+        try:
+            result = getattr(proxy._target, name)(*_unwrap(args))
+        except Exception as e:
+            self.journal.write(ERROR, encode(str(e)))
+            raise
+        result = self._wrap_result(result)
+        self.journal.write(RETURN, encode(result, self._objectid))
+        return result
+
+
+def _unwrap(value):
+    """Replace the proxies in call arguments by the objects they wrap."""
+    if isinstance(value, RecordingProxy):
+        return value._target
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
+
+
+class RecordingProxy(object):
+    """
+    Stands in for an HFSS object, forwarding and recording its calls.
+    """
+    def __init__(self, target, recorder, ident):
+        self._target = target
+        self._recorder = recorder
+        self._ident = ident
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args):
+            return self._recorder.call(self, name, args)
+
+        return method
+
+
+class Replayer(object):
+    """
+    Serves the calls recorded in a journal to its ReplayProxy objects.
+
+    Parameters
+    ----------
+    journal : str
+        Name of the journal file.
+    strict : bool
+        If True, the arguments of each call must match the recorded ones.
+        Otherwise only the object and method name are checked.
+    """
+    def __init__(self, journal, strict=True):
+        self.records = read_records(journal)
+        self.strict = strict
+        self.proxies = {}
+        self.replayed = 0
+
+    def proxy(self, ident):
+        """Return the ReplayProxy for an object id."""
+        try:
+            return self.proxies[ident]
+        except KeyError:
+            proxy = self.proxies[ident] = ReplayProxy(self, ident)
+            return proxy
+
+    @staticmethod
+    def _objectid(value):
+        return value._ident if isinstance(value, ReplayProxy) else None
+
+    def _next(self):
+        try:
+            return next(self.records)
+        except StopIteration:
+            raise JournalMismatch('The journal has no more calls')
+
+    def call(self, proxy, name, args):
+        kind, payload = self._next()
+        if kind != CALL:
+            raise JournalMismatch('Corrupt journal: expected a call record')
+
+        if self.strict:
+            matches = payload == encode((proxy._ident, name, args), self._objectid)
+        else:
+            matches = decode(payload)[:2] == (proxy._ident, name)
+        if not matches:
+            ident, recordedname, recordedargs = decode(payload)
+            raise JournalMismatch('Call {0} on object {1} with {2!r} does not match the recorded call {3} '
+                                  'on object {4} with {5!r}'.format(name, proxy._ident, args,
+                                                                    recordedname, ident, recordedargs))
+
+        kind, payload = self._next()
+        self.replayed += 1
+        if kind == ERROR:
+            raise ReplayedError(decode(payload))
+        return decode(payload, self.proxy)
+
+
+class ReplayProxy(object):
+    """
+    Stands in for a recorded HFSS object, serving the recorded results.
+    """
+    def __init__(self, replayer, ident):
+        self._replayer = replayer
+        self._ident = ident
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args):
+            return self._replayer.call(self, name, args)
+
+        return method
+
+
+def record(targets, journal):
+    """
+    Wrap HFSS objects in proxies that record their calls to a journal.
+
+    Parameters
+    ----------
+    targets : list
+        The objects to wrap.  They get object ids 0, 1, ...
+    journal : str or Journal
+        The journal, or the name of the journal file to create.
+
+    Returns
+    -------
+    proxies : list of RecordingProxy
+    """
+    recorder = Recorder(journal)
+    return [recorder.wrap(target) for target in targets]
+
+
+def replay(journal, count=1, strict=True):
+    """
+    Return proxies that replay the calls recorded in a journal.
+
+    Parameters
+    ----------
+    journal : str
+        Name of the journal file.
+    count : int
+        Number of objects that were given to record().
+    strict : bool
+        See Replayer.
+
+    Returns
+    -------
+    proxies : list of ReplayProxy
+    """
+    replayer = Replayer(journal, strict)
+    return [replayer.proxy(ident) for ident in range(count)]
+
+
+def _record_interface(journal, target=None, **options):
+    """
+    The "record" backend: set up the interface with the target backend and
+    record all calls to journal.
+    """
+    return record(setup_interface(target, **options), journal)
+
+
+def _replay_interface(journal, strict=True):
+    """
+    The "replay" backend: replay a journal written by the "record" backend.
+    """
+    return replay(journal, 2, strict)
+
+
+register_backend('record', _record_interface)
+register_backend('replay', _replay_interface, errors=(ReplayedError,))
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import timeit
+
+    from hycohanz import modeler3d
+    from hycohanz.standin import RecordingEditor
+
+    def build_array(oEditor, N):
+        for n in range(N):
+            name = modeler3d.create_box(oEditor, "{0}mm".format(2 * n), 0, 0, "1mm", "1mm", "1mm",
+                                        Name="Element{0}".format(n))
+            modeler3d.assign_material(oEditor, [name], "copper")
+            modeler3d.get_face_ids(oEditor, name)
+
+    N = 2000
+    fd, filename = tempfile.mkstemp(suffix='.hyj')
+    os.close(fd)
+    try:
+        direct = timeit.timeit(lambda: build_array(RecordingEditor(), N), number=1)
+
+        [oEditor] = record([RecordingEditor()], filename)
+        recording = timeit.timeit(lambda: build_array(oEditor, N), number=1)
+        oEditor._recorder.journal.close()
+
+        def run_replay():
+            [oEditor] = replay(filename)
+            build_array(oEditor, N)
+        replaying = timeit.timeit(run_replay, number=1)
+
+        counts = count_calls(filename)
+        ncalls = sum(counts.values())
+        print('{0} calls ({1}), journal {2:.1f} bytes/call'.format(
+              ncalls, ', '.join('{0} {1}'.format(n, name) for name, n in sorted(counts.items())),
+              os.path.getsize(filename) / ncalls))
+        print('  against a stand-in editor:  {0:.1f} us/call'.format(1e6 * direct / ncalls))
+        print('  recording:                  {0:.1f} us/call'.format(1e6 * recording / ncalls))
+        print('  replaying:                  {0:.1f} us/call'.format(1e6 * replaying / ncalls))
+    finally:
+        os.remove(filename)
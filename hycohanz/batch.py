@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Batched access to the HFSS 3D Modeler editor.
+
+Every hycohanz modeler function makes one synchronous, cross-process COM
+call.  BatchEditor wraps an oEditor handle and queues the calls that don't
+return anything useful (Move, Rotate, AssignMaterial, Delete, ...) instead
+of sending them immediately.  When the queue is flushed, compatible
+operations on different parts are merged into a single multi-selection COM
+call.
+
+A BatchEditor can be passed anywhere an oEditor is expected:
+
+>>> import hycohanz as hfss
+>>> with hfss.BatchEditor(oEditor) as oBatch:
+...     for name in names:
+...         hfss.move(oBatch, [name], "1mm", 0, 0)
+...         hfss.assign_material(oBatch, [name], "copper")
+
+Any call that isn't queued (object creation, queries, ...) flushes the
+queue first.  Merging only reorders operations on disjoint parts, so the
+result seen by HFSS is the same as without batching.
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import functools
+
+# Editor methods whose first argument is a "NAME:Selections" array and whose
+# remaining arguments don't depend on the selection.  Calls with equal
+# remaining arguments on disjoint parts can be merged.
+MERGEABLE_OPERATIONS = ('Move',
+                        'Rotate',
+                        'Mirror',
+                        'Scale',
+                        'AssignMaterial',
+                        'Delete')
+
+
+def _split_selections(selections):
+    """
+    Split a "Selections:=" value into a list of part names.
+    """
+    return [part.strip() for part in selections.split(',') if part.strip()]
+
+
+def _selection_key(args):
+    """
+    Return (parts, key) for a selection-based call, where parts is the list
+    of selected part names and key identifies everything else about the call.
+    Return (None, None) if the call isn't selection-based.
+    """
+    if not args or not isinstance(args[0], list) or args[0][:1] != ["NAME:Selections"]:
+        return None, None
+
+    selectionsarray = args[0]
+    try:
+        n = selectionsarray.index("Selections:=")
+    except ValueError:
+        return None, None
+
+    others = tuple(selectionsarray[:n] + selectionsarray[n + 2:])
+    key = (others, repr(args[1:]))
+    return _split_selections(selectionsarray[n + 1]), key
+
+
+class BatchEditor(object):
+    """
+    Queue HFSS 3D Modeler calls and send them to HFSS in merged batches.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor to which the calls are eventually sent.
+    merge : bool
+        Whether to merge compatible operations on flush.  If False, queued
+        calls are replayed one by one.
+    maxqueue : int
+        The queue is flushed automatically once it holds this many calls.
+        0 disables automatic flushing.
+
+    Attributes
+    ----------
+    issued : int
+        Number of COM calls actually sent to oEditor.
+    recorded : int
+        Number of editor calls made on this object.
+    """
+    def __init__(self, oEditor, merge=True, maxqueue=0):
+        self.oEditor = oEditor
+        self.merge = merge
+        self.maxqueue = maxqueue
+        self.queue = []
+        self.issued = 0
+        self.recorded = 0
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name in MERGEABLE_OPERATIONS:
+            return functools.partial(self._enqueue, name)
+
+        return functools.partial(self._call, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, traceback):
+        self.flush()
+
+    def _enqueue(self, name, *args):
+        self.recorded += 1
+        self.queue.append((name, args))
+        if self.maxqueue and len(self.queue) >= self.maxqueue:
+            self.flush()
+
+    def _call(self, name, *args):
+        self.recorded += 1
+        self.flush()
+        self.issued += 1
+        return getattr(self.oEditor, name)(*args)
+
+    def _merged(self):
+        """
+        Return the queued calls as a list of (name, args), merging compatible
+        operations on disjoint parts into a single call.
+
+        A call is merged into an earlier call of the same kind only if none
+        of the calls in between touch any of its parts, so that moving it
+        forward doesn't change the result.  Calls that aren't selection-based
+        are never reordered.
+        """
+        groups = []
+        for name, args in self.queue:
+            parts, key = _selection_key(args)
+            if parts is None:
+                groups.append((name, None, None, None, args))
+                continue
+
+            target = None
+            for group in reversed(groups):
+                if group[1] is None or not group[3].isdisjoint(parts):
+                    break
+                if group[0] == name and group[1] == key:
+                    target = group
+                    break
+
+            if target is None:
+                groups.append((name, key, list(parts), set(parts), args))
+            else:
+                target[2].extend(parts)
+                target[3].update(parts)
+
+        return [(group[0], group[4]) if group[1] is None else self._build(group)
+                for group in groups]
+
+    @staticmethod
+    def _build(pending):
+        name, _, parts, _, args = pending
+        selectionsarray = list(args[0])
+        n = selectionsarray.index("Selections:=")
+        selectionsarray[n + 1] = ','.join(parts)
+        return name, (selectionsarray,) + tuple(args[1:])
+
+    def flush(self):
+        """
+        Send all queued calls to HFSS.
+
+        Returns
+        -------
+        ncalls : int
+            The number of COM calls issued by this flush.
+        """
+        if not self.queue:
+            return 0
+
+        if self.merge:
+            calls = self._merged()
+        else:
+            calls = list(self.queue)
+        del self.queue[:]
+
+        for name, args in calls:
+            getattr(self.oEditor, name)(*args)
+
+        self.issued += len(calls)
+        return len(calls)
+
+
+def count_round_trips(build, *args, **kwargs):
+    """
+    Run build(oEditor, *args, **kwargs) against a recording stand-in editor,
+    once directly and once through a BatchEditor, and count the COM calls.
+
+    Parameters
+    ----------
+    build : callable
+        A function that issues modeler calls on the editor it is given.
+
+    Returns
+    -------
+    direct : int
+        COM round-trips without batching.
+    batched : int
+        COM round-trips through a BatchEditor.
+    """
+    from hycohanz.standin import RecordingEditor
+
+    oEditor = RecordingEditor()
+    build(oEditor, *args, **kwargs)
+    direct = oEditor.round_trips
+
+    oEditor = RecordingEditor()
+    with BatchEditor(oEditor) as oBatch:
+        build(oBatch, *args, **kwargs)
+    batched = oEditor.round_trips
+
+    return direct, batched
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from hycohanz import modeler3d
+
+    def build_array(oEditor, N):
+        for n in range(N):
+            name = modeler3d.create_box(oEditor, 0, 0, 0, "1mm", "1mm", "1mm",
+                                        Name="Element{0}".format(n))
+        for n in range(N):
+            name = "Element{0}".format(n)
+            modeler3d.move(oEditor, [name], "{0}mm".format(2 * (n % 8)), 0, 0)
+            modeler3d.assign_material(oEditor, [name], "copper")
+
+    for N in (64, 1024, 4096):
+        direct, batched = count_round_trips(build_array, N)
+        print('N = {0:5d}:  {1:6d} COM calls direct, {2:6d} batched'.format(N, direct, batched))
+
+    t = timeit.timeit(lambda: count_round_trips(build_array, 1024), number=5) / 5
+    print('Python-side overhead for N = 1024 (both passes):  {0:.1f} ms'.format(1e3 * t))
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Unite and subtract large numbers of parts.
+
+modeler3d.unite() and subtract() pass all the parts in one selection
+string.  With thousands of parts that single operation is slow and can fail
+in HFSS, while uniting the parts one at a time takes N calls that each
+rebuild an ever larger body.
+
+unite_tree() unites the parts in chunks of chunk_size, then unites the
+results in chunks, and so on, a balanced tree of about N / (chunk_size - 1)
+calls in which no call handles more than chunk_size bodies.  Parts that are
+close to each other are put in the same chunk, when their bounding boxes
+are known, so that the intermediate bodies stay compact.  A chunk whose
+unite HFSS fails, with one of the appobject.com_errors(), is split in
+halves, which are united separately and then together.  Other errors, e.g.
+from bad arguments, are not retried.
+
+subtract_tree() unites the tool parts the same way and subtracts the
+result.
+
+Both return the names of the resulting bodies as listed by HFSS after the
+operation, rather than assuming that the first part keeps its name.
+
+Example Usage
+-------------
+>>> from hycohanz.boolean import BoundingBoxes, unite_tree
+>>> boxes = BoundingBoxes(oEditor)
+>>> name = unite_tree(oEditor, vias, chunk_size=32, bounds=boxes)
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+from hycohanz.appobject import com_errors
+from hycohanz.modeler3d import (unite,
+                                subtract,
+                                get_matched_object_name,
+                                get_vertex_ids,
+                                get_vertex_position)
+
+CHUNK_SIZE = 16
+
+
+class BoundingBoxes(object):
+    """
+    A client-side cache of part bounding boxes, in model units.
+
+    A missing box is computed from the part's vertices, which costs one COM
+    call per vertex, so boxes known from the creation parameters should be
+    stored with set() instead.  Vertices don't bound curved bodies: a
+    cylinder's give the line of its seam, which still places it well
+    enough for ordering, and a sphere has none, so looking it up raises
+    KeyError.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor.
+    """
+    def __init__(self, oEditor):
+        self.oEditor = oEditor
+        self.boxes = {}
+
+    def set(self, name, lower, upper):
+        """Store the box of a part, given its (x, y, z) corners."""
+        self.boxes[name] = (tuple(lower), tuple(upper))
+
+    def __contains__(self, name):
+        return name in self.boxes
+
+    def __getitem__(self, name):
+        try:
+            return self.boxes[name]
+        except KeyError:
+            pass
+        points = [get_vertex_position(self.oEditor, vertexid) for vertexid in get_vertex_ids(self.oEditor, name)]
+        if not points:
+            raise KeyError('{0} has no vertices'.format(name))
+        box = (tuple(min(p[k] for p in points) for k in range(3)),
+               tuple(max(p[k] for p in points) for k in range(3)))
+        self.boxes[name] = box
+        return box
+
+    def merge(self, name, names):
+        """Store the box of a body united from names."""
+        boxes = [self.boxes[part] for part in names if part in self.boxes]
+        if len(boxes) == len(names):
+            self.boxes[name] = (tuple(min(box[0][k] for box in boxes) for k in range(3)),
+                                tuple(max(box[1][k] for box in boxes) for k in range(3)))
+
+
+def _spatial_order(names, bounds):
+    """
+    Order names so that parts close to each other are close in the list,
+    by recursively splitting at the median along the longest axis.  Parts
+    without a bounding box go last, in their original order.
+    """
+    centers = {}
+    unbounded = []
+    for name in names:
+        try:
+            box = bounds[name]
+        except KeyError:
+            unbounded.append(name)
+            continue
+        centers[name] = tuple((lower + upper) / 2 for lower, upper in zip(*box))
+
+    def order(group):
+        if len(group) <= 2:
+            return group
+        spans = [max(centers[name][k] for name in group) - min(centers[name][k] for name in group)
+                 for k in range(3)]
+        axis = spans.index(max(spans))
+        group = sorted(group, key=lambda name: centers[name][axis])
+        half = len(group) // 2
+        return order(group[:half]) + order(group[half:])
+
+    return order([name for name in names if name in centers]) + unbounded
+
+
+def _unite_chunk(oEditor, chunk):
+    """
+    Unite a chunk, splitting it in halves if HFSS fails.  Returns the name
+    HFSS keeps for the result, the first part of the selection.  Errors
+    other than HFSS failures are raised as they are.
+    """
+    try:
+        unite(oEditor, chunk)
+    except com_errors():
+        if len(chunk) <= 2:
+            raise
+        half = len(chunk) // 2
+        first = _unite_chunk(oEditor, chunk[:half])
+        second = _unite_chunk(oEditor, chunk[half:])
+        unite(oEditor, [first, second])
+    return chunk[0]
+
+
+def _survivor(chunk, existing):
+    survivors = [name for name in chunk if name in existing]
+    if len(survivors) != 1:
+        raise RuntimeError('Uniting {0} left {1} bodies: {2}'.format(','.join(chunk), len(survivors),
+                                                                     ','.join(survivors)))
+    return survivors[0]
+
+
+def _reduce(oEditor, partlist, chunk_size, bounds, target):
+    """Unite partlist level by level until at most target bodies are left."""
+    if chunk_size < 2:
+        raise ValueError('chunk_size must be at least 2')
+    parts = list(partlist)
+    if bounds is not None:
+        parts = _spatial_order(parts, bounds)
+    while len(parts) > target:
+        chunks = [parts[n:n + chunk_size] for n in range(0, len(parts), chunk_size)]
+        for chunk in chunks:
+            if len(chunk) > 1:
+                _unite_chunk(oEditor, chunk)
+        existing = set(get_matched_object_name(oEditor, '*'))
+        parts = [_survivor(chunk, existing) if len(chunk) > 1 else chunk[0] for chunk in chunks]
+        if bounds is not None and hasattr(bounds, 'merge'):
+            for chunk, name in zip(chunks, parts):
+                bounds.merge(name, chunk)
+    return parts
+
+
+def unite_tree(oEditor, partlist, chunk_size=CHUNK_SIZE, bounds=None):
+    """
+    Unite parts in a balanced tree of chunked unite() calls.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    partlist : list of str
+        The parts to unite.  They are consumed.
+    chunk_size : int
+        Maximum number of bodies per unite() call.
+    bounds : BoundingBoxes or dict
+        Maps part names to their (lower, upper) bounding box corners.  If
+        given, neighbouring parts are united first.
+
+    Returns
+    -------
+    objname : str
+        Name of the united body, as listed by HFSS.
+    """
+    if not partlist:
+        raise ValueError('No parts to unite')
+    if len(partlist) == 1:
+        return partlist[0]
+    return _reduce(oEditor, partlist, chunk_size, bounds, 1)[0]
+
+
+def subtract_tree(oEditor, blanklist, toollist, chunk_size=CHUNK_SIZE, bounds=None):
+    """
+    Subtract many tool parts, united first with unite_tree(), from the
+    blank parts.
+
+    If HFSS fails the final subtract(), the tools are subtracted in halves.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    blanklist : list of str
+        The parts to subtract from.
+    toollist : list of str
+        The parts to subtract.  They are consumed.
+    chunk_size : int
+        Maximum number of bodies per unite() call, and number of tool bodies
+        left for the final subtract().
+    bounds : BoundingBoxes or dict
+        See unite_tree().
+
+    Returns
+    -------
+    names : list of str
+        The names of the blank bodies that exist after the subtraction.
+    """
+    if not toollist:
+        raise ValueError('No parts to subtract')
+    tools = _reduce(oEditor, toollist, chunk_size, bounds, chunk_size)
+
+    def subtract_tools(tools):
+        try:
+            subtract(oEditor, blanklist, tools)
+        except com_errors():
+            if len(tools) == 1:
+                raise
+            half = len(tools) // 2
+            subtract_tools(tools[:half])
+            subtract_tools(tools[half:])
+
+    subtract_tools(tools)
+    existing = set(get_matched_object_name(oEditor, '*'))
+    return [name for name in blanklist if name in existing]
+
+
+class _BooleanEditor(object):
+    """
+    A stand-in editor that keeps track of which parts exist.  Each operation
+    costs time in proportion to the number of original parts in the bodies
+    it handles, and operations on more than max_selection bodies fail.
+    """
+    def __init__(self, names, max_selection=None):
+        from hycohanz.standin import RecordingEditor
+
+        self.lumps = dict((name, 1) for name in names)
+        self.max_selection = max_selection
+        self.work = 0
+        self.oEditor = RecordingEditor({'Unite': self.unite,
+                                        'Subtract': self.subtract,
+                                        'GetMatchedObjectName': lambda pattern: list(self.lumps)})
+
+    def _select(self, names):
+        from hycohanz.standin import ComError
+
+        names = names.split(',')
+        if self.max_selection is not None and len(names) > self.max_selection:
+            raise ComError('Selection too large')
+        self.work += sum(self.lumps[name] for name in names)
+        return names
+
+    def unite(self, selections, parameters):
+        names = self._select(selections[2])
+        self.lumps[names[0]] = sum(self.lumps.pop(name) for name in names[1:]) + self.lumps[names[0]]
+
+    def subtract(self, selections, parameters):
+        blanks = self._select(selections[2])
+        tools = self._select(selections[4])
+        for name in tools:
+            del self.lumps[name]
+
+
+if __name__ == "__main__":
+    N = 4000
+    names = ['Via{0}'.format(n) for n in range(N)]
+    bounds = BoundingBoxes(None)
+    for n, name in enumerate(names):
+        x, y = 0.5 * (n % 64), 0.5 * (n // 64)
+        bounds.set(name, (x, y, 0), (x + 0.2, y + 0.2, 1.6))
+
+    sequential = _BooleanEditor(names)
+    result = names[0]
+    for name in names[1:]:
+        unite(sequential.oEditor, [result, name])
+
+    single = _BooleanEditor(names, max_selection=1000)
+    try:
+        unite(single.oEditor, names)
+        single_result = 'ok'
+    except RuntimeError as error:
+        single_result = 'failed: {0}'.format(error)
+
+    tree = _BooleanEditor(names, max_selection=1000)
+    unite_tree(tree.oEditor, names, chunk_size=16, bounds=bounds)
+    assert list(tree.lumps.values()) == [N]
+
+    print('Uniting {0} parts:'.format(N))
+    print('  one unite() call:      {0}'.format(single_result))
+    print('  sequential unite():    {0:5d} COM calls, work {1}'.format(sequential.oEditor.round_trips,
+                                                                       sequential.work))
+    print('  unite_tree(), 16/call: {0:5d} COM calls, work {1}'.format(tree.oEditor.round_trips, tree.work))
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Rebuild only the parts of a model that changed.
+
+A BuildGraph records modeler3d operations, e.g. create_box(), subtract()
+and fillet(), without performing them.  For each operation it knows which
+parts it creates, modifies, consumes (e.g. the tool parts of a subtract) or
+only reads, and it gives the operation a hash of its function, its
+arguments and the hashes of the operations that last changed the parts it
+uses.  An operation's hash therefore changes whenever the operation or
+anything upstream of it changes.
+
+A Builder applies graphs to an HFSS editor and remembers the graph it last
+applied.  Applying a new graph deletes only the parts affected by changed,
+added or removed operations, and replays only the operations that build
+those parts; everything else is left in the model as it is.  A dry run
+reports what would be deleted and executed without touching the model.
+
+Example Usage
+-------------
+>>> from hycohanz import modeler3d
+>>> from hycohanz.buildgraph import BuildGraph, Builder
+>>> builder = Builder(oEditor, statefile='antenna.build.json')
+>>> def model(slot_width):
+...     graph = BuildGraph()
+...     graph.add(modeler3d.create_box, 0, 0, 0, '40mm', '40mm', '0.035mm', Name='Ground')
+...     graph.add(modeler3d.create_box, '18mm', 0, 0, slot_width, '20mm', '0.035mm', Name='Slot')
+...     graph.add(modeler3d.subtract, ['Ground'], ['Slot'])
+...     graph.add(modeler3d.create_box, 0, 0, '-1.6mm', '40mm', '40mm', '1.6mm', Name='Substrate')
+...     return graph
+>>> builder.apply(model('1mm'))
+>>> print(builder.apply(model('1.2mm'), dry_run=True))
+delete Ground
+run create_box(Name=Ground)
+run create_box(Name=Slot)
+run subtract(['Ground'], ['Slot'])
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import collections
+import hashlib
+import inspect
+import json
+import os
+
+from hycohanz import modeler3d
+
+
+def _names(value):
+    """A part name or list of part names, as a list."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(name) for name in value]
+    return [str(value)]
+
+
+def _created(arguments):
+    name = arguments.get('Name')
+    if name is None:
+        name = arguments.get('attributes', {}).get('Name')
+    if name is None:
+        raise ValueError('Creation operations in a build graph need a Name')
+    return [str(name)], [], [], []
+
+
+def _boolean(blank, tool):
+    def effects(arguments):
+        blanks = _names(arguments[blank])
+        tools = _names(arguments[tool])
+        if arguments.get('KeepOriginals'):
+            return [], blanks, [], tools
+        return [], blanks, tools, []
+    return effects
+
+
+def _united(arguments):
+    parts = _names(arguments['partlist'])
+    if arguments.get('KeepOriginals'):
+        return [], parts[:1], [], parts[1:]
+    return [], parts[:1], parts[1:], []
+
+
+def _json_default(value):
+    """
+    Encode arguments json doesn't know for hashing: arrays by their full
+    content, anything else by str().
+    """
+    if hasattr(value, 'tobytes') and hasattr(value, 'dtype'):
+        return [str(value.dtype), list(value.shape), hashlib.sha256(value.tobytes()).hexdigest()]
+    return str(value)
+
+
+def _modified(parameter):
+    def effects(arguments):
+        return [], _names(arguments[parameter]), [], []
+    return effects
+
+
+# How modeler3d functions affect parts: maps function names to functions of
+# the bound arguments that return (created, modified, consumed, read) lists
+# of part names.  Use BuildGraph.add_operation() for other functions.
+EFFECTS = {
+    'create_box': _created,
+    'create_cylinder': _created,
+    'create_rectangle': _created,
+    'create_circle': _created,
+    'create_sphere': _created,
+    'create_polyline': _created,
+    'create_polyline_points': _created,
+    'create_EQbasedcurve': _created,
+    'subtract': _boolean('blanklist', 'toollist'),
+    'imprint': _boolean('blanklist', 'toollist'),
+    'unite': _united,
+    'connect': lambda arguments: ([], _names(arguments['partlist'])[:1], _names(arguments['partlist'])[1:], []),
+    'delete': lambda arguments: ([], [], _names(arguments['partlist']), []),
+    'rename_part': lambda arguments: (_names(arguments['newname']), [], _names(arguments['oldname']), []),
+    'move': _modified('partlist'),
+    'rotate': _modified('partlist'),
+    'mirror': _modified('partlist'),
+    'scale': _modified('partlist'),
+    'fillet': _modified('partlist'),
+    'sweep_along_vector': _modified('obj_name_list'),
+    'assign_material': _modified('partlist'),
+    'uncover_faces': _modified('partlist'),
+}
+
+
+class Operation(collections.namedtuple('Operation', ['function', 'args', 'kwargs', 'created', 'modified',
+                                                     'consumed', 'read', 'hash'])):
+    """
+    One recorded modeler operation.  function is called as
+    function(oEditor, *args, **kwargs).
+    """
+    __slots__ = ()
+
+    @property
+    def changed(self):
+        """The parts whose geometry the operation changes."""
+        return self.created + self.modified + self.consumed
+
+    def __str__(self):
+        if self.created:
+            return '{0}(Name={1})'.format(self.function.__name__, self.created[0])
+        return '{0}({1})'.format(self.function.__name__, ', '.join(repr(arg) for arg in self.args))
+
+
+Plan = collections.namedtuple('Plan', ['deletions', 'operations', 'skipped'])
+Plan.__doc__ = """
+What applying a graph does: the parts deleted, the operations executed, and
+the number of operations skipped because their parts are unaffected.
+"""
+Plan.__str__ = lambda self: '\n'.join(['delete {0}'.format(name) for name in self.deletions] +
+                                      ['run {0}'.format(operation) for operation in self.operations])
+
+
+class BuildGraph(object):
+    """
+    A recorded sequence of modeler operations, with their dependencies.
+
+    Attributes
+    ----------
+    operations : list of Operation
+        The operations, in the order they were added.
+    """
+    def __init__(self):
+        self.operations = []
+        # Part name -> hash of the operation that last changed it.
+        self.last = {}
+
+    def __len__(self):
+        return len(self.operations)
+
+    def add(self, function, *args, **kwargs):
+        """
+        Record a call of a modeler3d function, without the oEditor argument.
+
+        Returns
+        -------
+        name : str
+            The name of the part the operation creates or modifies.
+        """
+        try:
+            effects = EFFECTS[function.__name__]
+        except KeyError:
+            raise ValueError('The effects of {0}() are unknown; use add_operation()'.format(function.__name__))
+        arguments = inspect.signature(function).bind(None, *args, **kwargs)
+        arguments.apply_defaults()
+        created, modified, consumed, read = effects(arguments.arguments)
+        return self.add_operation(function, args, kwargs, created, modified, consumed, read)
+
+    def add_operation(self, function, args=(), kwargs=None, created=(), modified=(), consumed=(), read=()):
+        """
+        Record a call of any function of the editor, with its effects on
+        parts given explicitly.
+
+        Returns
+        -------
+        name : str
+            The first part created or modified, if any.
+        """
+        kwargs = dict(kwargs or {})
+        created, modified, consumed, read = list(created), list(modified), list(consumed), list(read)
+        digest = hashlib.sha256()
+        digest.update(json.dumps([function.__module__, function.__name__, list(args), sorted(kwargs.items())],
+                                 default=_json_default).encode('utf-8'))
+        for name in sorted(set(modified + consumed + read)):
+            digest.update('{0}={1};'.format(name, self.last.get(name, '')).encode('utf-8'))
+        operation = Operation(function, tuple(args), kwargs, created, modified, consumed, read,
+                              digest.hexdigest())
+        for name in operation.changed:
+            self.last[name] = operation.hash
+        self.operations.append(operation)
+        names = created + modified
+        return names[0] if names else None
+
+    def survivors(self):
+        """The parts that exist after all operations."""
+        alive = []
+        for operation in self.operations:
+            for name in operation.consumed:
+                if name in alive:
+                    alive.remove(name)
+            for name in operation.created:
+                if name not in alive:
+                    alive.append(name)
+        return alive
+
+
+class Builder(object):
+    """
+    Apply build graphs to an HFSS editor incrementally.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor.
+    statefile : str
+        A JSON file in which the last applied graph is kept, so that a later
+        script run can rebuild incrementally.  Without one, the state is kept
+        in memory only.
+
+    Notes
+    -----
+    The model must not be changed other than through the builder between
+    two apply() calls.
+    """
+    def __init__(self, oEditor, statefile=None):
+        self.oEditor = oEditor
+        self.statefile = statefile
+        # The last applied graph: operation hashes with the parts they
+        # changed, and the parts that exist.
+        self.state = {'operations': [], 'survivors': []}
+        if statefile is not None and os.path.exists(statefile):
+            with open(statefile) as f:
+                self.state = json.load(f)
+
+    def plan(self, graph):
+        """Return the Plan for applying a graph, without applying it."""
+        previous = dict((operationhash, changed) for operationhash, changed in self.state['operations'])
+        hashes = set(operation.hash for operation in graph.operations)
+        survivors = set(self.state['survivors'])
+
+        affected = set()
+        for operationhash, changed in previous.items():
+            if operationhash not in hashes:
+                affected.update(changed)
+        rerun = set(n for n, operation in enumerate(graph.operations) if operation.hash not in previous)
+
+        # Grow the affected parts and the operations to rerun together: an
+        # operation reruns if it changes an affected part, and a rerun
+        # operation affects every part it changes, and every part it reads
+        # that doesn't exist in the model.
+        grown = True
+        while grown:
+            grown = False
+            for n, operation in enumerate(graph.operations):
+                if n not in rerun and affected.intersection(operation.changed):
+                    rerun.add(n)
+                    grown = True
+                if n in rerun:
+                    new = set(operation.changed).union(name for name in operation.read if name not in survivors)
+                    if not new <= affected:
+                        affected.update(new)
+                        grown = True
+
+        deletions = [name for name in self.state['survivors'] if name in affected]
+        operations = [operation for n, operation in enumerate(graph.operations) if n in rerun]
+        return Plan(deletions, operations, len(graph.operations) - len(operations))
+
+    def apply(self, graph, dry_run=False):
+        """
+        Bring the model in line with a graph.
+
+        Parameters
+        ----------
+        graph : BuildGraph
+        dry_run : bool
+            Only return the plan.
+
+        Returns
+        -------
+        plan : Plan
+        """
+        plan = self.plan(graph)
+        if dry_run:
+            return plan
+        try:
+            if plan.deletions:
+                modeler3d.delete(self.oEditor, plan.deletions)
+            for operation in plan.operations:
+                operation.function(self.oEditor, *operation.args, **operation.kwargs)
+        except Exception:
+            # The model is in an unknown state: rebuild everything next time,
+            # after deleting whichever of the parts involved exist now.
+            existing = set(modeler3d.get_matched_object_name(self.oEditor, '*'))
+            involved = list(self.state['survivors'])
+            for operation in graph.operations:
+                involved.extend(name for name in operation.created if name not in involved)
+            self.state = {'operations': [], 'survivors': [name for name in involved if name in existing]}
+            self._save()
+            raise
+        self.state = {'operations': [[operation.hash, operation.changed] for operation in graph.operations],
+                      'survivors': graph.survivors()}
+        self._save()
+        return plan
+
+    def _save(self):
+        if self.statefile is not None:
+            with open(self.statefile + '.tmp', 'w') as f:
+                json.dump(self.state, f)
+            os.replace(self.statefile + '.tmp', self.statefile)
+
+
+if __name__ == "__main__":
+    from hycohanz.standin import RecordingEditor
+
+    def array(N, widths):
+        graph = BuildGraph()
+        graph.add(modeler3d.create_box, 0, 0, '-1.6mm', '{0}mm'.format(4 * N), '4mm', '1.6mm', Name='Substrate')
+        for n in range(N):
+            patch = graph.add(modeler3d.create_box, '{0}mm'.format(4 * n), 0, 0, widths.get(n, '2mm'), '2mm',
+                              '0.035mm', Name='Patch{0}'.format(n))
+            graph.add(modeler3d.create_cylinder, '{0}mm'.format(4 * n + 1), '1mm', '-1.6mm', '0.2mm', '1.6mm',
+                      Name='Via{0}'.format(n))
+            graph.add(modeler3d.create_box, '{0}mm'.format(4 * n + 0.8), '0.8mm', 0, '0.4mm', '0.4mm', '0.035mm',
+                      Name='Slot{0}'.format(n))
+            graph.add(modeler3d.subtract, [patch], ['Slot{0}'.format(n)])
+            graph.add(modeler3d.unite, [patch, 'Via{0}'.format(n)])
+        return graph
+
+    N = 100
+    oEditor = RecordingEditor()
+    builder = Builder(oEditor)
+    builder.apply(array(N, {}))
+    full = oEditor.round_trips
+
+    oEditor.reset()
+    print(builder.apply(array(N, {42: '2.5mm'}), dry_run=True))
+    plan = builder.apply(array(N, {42: '2.5mm'}))
+    print('{0}-element array: {1} COM calls to build, {2} to rebuild after changing one patch '
+          '({3} operations skipped)'.format(N, full, oEditor.round_trips, plan.skipped))
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Fields Calculator programs that are checked locally and reused.
+
+A CalculatorProgram records a sequence of Fields Calculator stack
+operations, the same ones issued by fieldscalculator.enter_qty(),
+calc_op(), enter_vol() and friends, and checks each one as it is added:
+stack underflow and operand type errors, e.g. integrating a vector field,
+are raised at once in Python instead of as an opaque COM error halfway
+through a sweep.
+
+A program with a name is saved in HFSS as a named expression the first time
+it is entered in a design, and entered with a single CopyNamedExprToStack()
+call from then on.  The named expression's name ends with a hash of the
+steps, so a changed program is never confused with an expression saved by
+an earlier version of it.  Programs can be converted to and from JSON.
+
+Example Usage
+-------------
+>>> from hycohanz.calculator import CalculatorProgram
+>>> program = CalculatorProgram('MaxE')
+>>> program.enter_qty('E').calc_op('Mag').enter_vol('Substrate').calc_op('Maximum')
+>>> program.result_type
+'number'
+>>> grid = hfss.evaluate_grid(oFieldsReporter, 'Setup1', 'LastAdaptive', freqs, build=program)
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import hashlib
+import json
+
+from hycohanz.fieldscalculator import (enter_qty,
+                                       enter_vol,
+                                       enter_surf,
+                                       enter_line,
+                                       enter_scalar,
+                                       calc_op,
+                                       calc_stack,
+                                       add_named_expression,
+                                       delete_named_expression,
+                                       copy_named_expr_to_stack)
+
+# Operand types.
+VECTOR = 'vector'
+SCALAR = 'scalar'
+NUMBER = 'number'
+GEOMETRY = 'geometry'
+
+# Field quantities that are vectors; other quantities are scalars.
+VECTOR_QUANTITIES = frozenset(['E', 'H', 'J', 'Jvol', 'Jsurf', 'Poynting', 'B', 'D'])
+
+_ARITHMETIC = {(SCALAR, SCALAR): SCALAR,
+               (SCALAR, NUMBER): SCALAR,
+               (NUMBER, SCALAR): SCALAR,
+               (NUMBER, NUMBER): NUMBER}
+_SUM = dict(_ARITHMETIC)
+_SUM[VECTOR, VECTOR] = VECTOR
+_QUOTIENT = dict(_ARITHMETIC)
+_QUOTIENT.update({(VECTOR, SCALAR): VECTOR, (VECTOR, NUMBER): VECTOR})
+_PRODUCT = dict(_QUOTIENT)
+_PRODUCT.update({(SCALAR, VECTOR): VECTOR, (NUMBER, VECTOR): VECTOR})
+_ELEMENTWISE = {(SCALAR,): SCALAR, (NUMBER,): NUMBER}
+_REDUCTION = {(SCALAR, GEOMETRY): NUMBER}
+
+# Maps calc_op() operation strings to signatures: dicts from the operand
+# types, bottom of the stack first, to the result type.  Add entries to
+# use other calculator buttons.
+OPERATIONS = {
+    '+': _SUM,
+    '-': _SUM,
+    '*': _PRODUCT,
+    '/': _QUOTIENT,
+    'Mag': {(VECTOR,): SCALAR},
+    'Dot': {(VECTOR, VECTOR): SCALAR},
+    'Cross': {(VECTOR, VECTOR): VECTOR},
+    'ScalarX': {(VECTOR,): SCALAR},
+    'ScalarY': {(VECTOR,): SCALAR},
+    'ScalarZ': {(VECTOR,): SCALAR},
+    'Conj': {(SCALAR,): SCALAR, (VECTOR,): VECTOR, (NUMBER,): NUMBER},
+    'Smooth': {(SCALAR,): SCALAR, (VECTOR,): VECTOR},
+    'Real': _ELEMENTWISE,
+    'Imag': _ELEMENTWISE,
+    'CmplxMag': _ELEMENTWISE,
+    'CmplxPhase': _ELEMENTWISE,
+    'Abs': _ELEMENTWISE,
+    'Neg': _ELEMENTWISE,
+    'Inv': _ELEMENTWISE,
+    'Sqrt': _ELEMENTWISE,
+    'Exp': _ELEMENTWISE,
+    'Ln': _ELEMENTWISE,
+    'Log': _ELEMENTWISE,
+    'Integrate': _REDUCTION,
+    'Maximum': _REDUCTION,
+    'Minimum': _REDUCTION,
+    'Mean': _REDUCTION,
+}
+
+# The steps a program can hold: step name -> (function, type pushed).
+_ENTRIES = {'enter_qty': (enter_qty, None),
+            'enter_vol': (enter_vol, GEOMETRY),
+            'enter_surf': (enter_surf, GEOMETRY),
+            'enter_line': (enter_line, GEOMETRY),
+            'enter_scalar': (enter_scalar, NUMBER)}
+
+
+class ProgramError(ValueError):
+    """A calculator program step doesn't fit the stack."""
+
+
+class CalculatorProgram(object):
+    """
+    A checked sequence of Fields Calculator stack operations.
+
+    The step methods return the program, so steps can be chained.  Calling
+    the program with a FieldsReporter module enters its expression onto the
+    calculator stack, so a program can be given as the build argument of
+    fieldscalculator.evaluate_grid().
+
+    Parameters
+    ----------
+    name : str
+        If given, the result is saved in HFSS as a named expression, named
+        expression_name, the first time the program is entered in a design,
+        and copied from there afterwards.  The program must then leave
+        exactly one entry on the stack.
+
+    Attributes
+    ----------
+    steps : list of tuple
+        (step name, argument) pairs, e.g. ('calc_op', 'Mag').
+    stack : list of str
+        The operand types on the stack after the steps, bottom first.
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.steps = []
+        self.stack = []
+
+    def __repr__(self):
+        return 'CalculatorProgram({0!r}, {1})'.format(self.name, self.steps)
+
+    def __eq__(self, other):
+        return isinstance(other, CalculatorProgram) and (self.name, self.steps) == (other.name, other.steps)
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def depth(self):
+        """The number of entries the program leaves on the stack."""
+        return len(self.stack)
+
+    @property
+    def expression_name(self):
+        """The name of the program's named expression in HFSS, or None."""
+        if self.name is None:
+            return None
+        digest = hashlib.sha256(json.dumps(self.steps).encode('utf-8')).hexdigest()
+        return '{0}_{1}'.format(self.name, digest[:8])
+
+    @property
+    def result_type(self):
+        """The type of the entry at the top of the stack, or None."""
+        return self.stack[-1] if self.stack else None
+
+    def _add(self, step, argument):
+        if step in _ENTRIES:
+            pushed = _ENTRIES[step][1]
+            if pushed is None:
+                pushed = VECTOR if argument in VECTOR_QUANTITIES else SCALAR
+            self.stack.append(pushed)
+        elif step == 'calc_op':
+            try:
+                signature = OPERATIONS[argument]
+            except KeyError:
+                raise ProgramError('Unknown calculator operation {0!r}'.format(argument))
+            arity = len(next(iter(signature)))
+            if len(self.stack) < arity:
+                raise ProgramError('{0!r} needs {1} operand(s) but the stack holds {2}'.format(
+                                   argument, arity, len(self.stack)))
+            operands = tuple(self.stack[len(self.stack) - arity:])
+            try:
+                result = signature[operands]
+            except KeyError:
+                raise ProgramError('{0!r} does not apply to {1}'.format(argument, ', '.join(operands)))
+            self.stack[len(self.stack) - arity:] = [result]
+        elif step == 'calc_stack':
+            if argument == 'clear':
+                del self.stack[:]
+            else:
+                needed = {'push': 1, 'pop': 1, 'exch': 2, 'rlup': 1, 'rldn': 1}.get(argument)
+                if needed is None:
+                    raise ProgramError('Unknown stack operation {0!r}'.format(argument))
+                if len(self.stack) < needed:
+                    raise ProgramError('{0!r} on a stack of {1}'.format(argument, len(self.stack)))
+                if argument == 'push':
+                    self.stack.append(self.stack[-1])
+                elif argument == 'pop':
+                    self.stack.pop()
+                elif argument == 'exch':
+                    self.stack[-2:] = self.stack[:-3:-1]
+                elif argument == 'rlup':
+                    self.stack.insert(0, self.stack.pop())
+                else:
+                    self.stack.append(self.stack.pop(0))
+        else:
+            raise ProgramError('Unknown program step {0!r}'.format(step))
+        self.steps.append((step, argument))
+        return self
+
+    def enter_qty(self, FieldQuantityString):
+        return self._add('enter_qty', FieldQuantityString)
+
+    def enter_vol(self, VolumeName):
+        return self._add('enter_vol', VolumeName)
+
+    def enter_surf(self, SurfaceName):
+        return self._add('enter_surf', SurfaceName)
+
+    def enter_line(self, LineName):
+        return self._add('enter_line', LineName)
+
+    def enter_scalar(self, Scalar):
+        return self._add('enter_scalar', Scalar)
+
+    def calc_op(self, OperationString):
+        return self._add('calc_op', OperationString)
+
+    def calc_stack(self, StackOperation):
+        return self._add('calc_stack', StackOperation)
+
+    def run(self, oFieldsReporter):
+        """Replay all the steps on a FieldsReporter module."""
+        for step, argument in self.steps:
+            if step == 'calc_op':
+                calc_op(oFieldsReporter, argument)
+            elif step == 'calc_stack':
+                calc_stack(oFieldsReporter, argument)
+            else:
+                _ENTRIES[step][0](oFieldsReporter, argument)
+
+    def __call__(self, oFieldsReporter):
+        """
+        Enter the program's expression onto the calculator stack.
+
+        A named program is copied from its named expression.  If the
+        design doesn't have it yet, the copy fails and the program is run
+        and saved as a named expression first, which clears the calculator
+        stack.
+        """
+        if self.name is None:
+            self.run(oFieldsReporter)
+            return
+        try:
+            copy_named_expr_to_stack(oFieldsReporter, self.expression_name)
+        except Exception:
+            self.install(oFieldsReporter)
+            copy_named_expr_to_stack(oFieldsReporter, self.expression_name)
+
+    def install(self, oFieldsReporter):
+        """
+        Save the program as a named expression, replacing any of the same
+        name, and clear the stack.
+        """
+        if self.name is None:
+            raise ProgramError('Only named programs can be saved as named expressions')
+        if self.depth != 1:
+            raise ProgramError('A named program must leave one entry on the stack, not {0}'.format(self.depth))
+        try:
+            delete_named_expression(oFieldsReporter, self.expression_name)
+        except Exception:
+            # There was none.
+            pass
+        self.run(oFieldsReporter)
+        add_named_expression(oFieldsReporter, self.expression_name)
+        calc_stack(oFieldsReporter, 'clear')
+
+    def to_json(self):
+        """Return the program as a JSON string."""
+        return json.dumps({'name': self.name, 'steps': [list(step) for step in self.steps]})
+
+    @classmethod
+    def from_json(cls, text):
+        """Build and check a program from a JSON string made by to_json()."""
+        data = json.loads(text)
+        program = cls(data.get('name'))
+        for step, argument in data['steps']:
+            program._add(step, argument)
+        return program
+
+
+if __name__ == "__main__":
+    import timeit
+
+    import numpy
+
+    from hycohanz.fieldscalculator import evaluate_grid
+    from hycohanz.standin import FakeFieldsReporter
+
+    def build(oFieldsReporter):
+        enter_qty(oFieldsReporter, 'E')
+        calc_op(oFieldsReporter, 'Mag')
+        enter_vol(oFieldsReporter, 'Substrate')
+        calc_op(oFieldsReporter, 'Maximum')
+
+    program = CalculatorProgram('MaxE')
+    program.enter_qty('E').calc_op('Mag').enter_vol('Substrate').calc_op('Maximum')
+    assert CalculatorProgram.from_json(program.to_json()) == program
+
+    freqs = numpy.linspace(1e9, 20e9, 20)
+    variations = [{'w': '{0}mm'.format(w)} for w in range(1, 51)]
+    oReplay, oNamed = FakeFieldsReporter(), FakeFieldsReporter()
+
+    # One evaluate_grid() per variation, as a sweep loop does.
+    t_replay = timeit.timeit(lambda: [evaluate_grid(oReplay, 'Setup1', 'LastAdaptive', freqs, [0], [v],
+                                                    build=build) for v in variations], number=1)
+    t_named = timeit.timeit(lambda: [evaluate_grid(oNamed, 'Setup1', 'LastAdaptive', freqs, [0], [v],
+                                                   build=program) for v in variations], number=1)
+    print('{0} variations, stack building calls:'.format(len(variations)))
+    print('  replayed steps:    {0}'.format(oReplay.round_trips - oReplay.count('GetTopEntryValue')))
+    print('  named expression:  {0}'.format(oNamed.round_trips - oNamed.count('GetTopEntryValue')))
+
+    try:
+        CalculatorProgram().enter_qty('E').enter_vol('Substrate').calc_op('Integrate')
+    except ProgramError as error:
+        print('Checked locally: {0}'.format(error))
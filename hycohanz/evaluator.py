@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluate HFSS expressions numerically in Python.
+
+HFSS evaluates expressions such as "0.010in * 2 + $gap" itself, which costs
+a COM round-trip through set_variable() or add_property().  This module
+evaluates them locally instead: numbers with HFSS units are converted to SI
+(meters, Hz, radians, seconds), variables are resolved from a mapping, and
+'^' is the power operator.
+
+Variable values may be NumPy arrays, in which case the result is an array
+evaluated element-wise, e.g. over all the points of a planned sweep.
+
+Example Usage
+-------------
+>>> import hycohanz as hfss
+>>> expr = hfss.Expression('0.010in') * 2 + '$gap'
+>>> hfss.evaluate(expr, {'$gap': '1mm'})
+0.001508
+>>> hfss.evaluate('w / 2', {'w': numpy.array([1, 2, 3])})
+array([0.5, 1. , 1.5])
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import math
+import re
+import sys
+
+from hycohanz.expression import Expression
+
+# Factors converting HFSS units to SI.  Unit lookup is case-insensitive.
+UNITS = {
+    # Length
+    'm': 1.0,
+    'meter': 1.0,
+    'km': 1e3,
+    'cm': 1e-2,
+    'mm': 1e-3,
+    'um': 1e-6,
+    'nm': 1e-9,
+    'mil': 25.4e-6,
+    'in': 25.4e-3,
+    'ft': 0.3048,
+    'uin': 25.4e-9,
+    # Frequency
+    'hz': 1.0,
+    'khz': 1e3,
+    'mhz': 1e6,
+    'ghz': 1e9,
+    'thz': 1e12,
+    # Angle
+    'rad': 1.0,
+    'deg': math.pi / 180,
+    # Time
+    's': 1.0,
+    'ms': 1e-3,
+    'us': 1e-6,
+    'ns': 1e-9,
+    'ps': 1e-12,
+}
+
+CONSTANTS = {
+    'pi': math.pi,
+    'c0': 299792458.0,
+    'e0': 8.8541878176e-12,
+    'u0': 4e-7 * math.pi,
+    'z0': 376.730313461,
+}
+
+
+# HFSS functions, with their math and NumPy implementations.  The NumPy
+# versions work element-wise on array-valued variables.
+_FUNCTIONS = {
+    'abs': (abs, 'abs'),
+    'sqrt': (math.sqrt, 'sqrt'),
+    'exp': (math.exp, 'exp'),
+    'ln': (math.log, 'log'),
+    'log10': (math.log10, 'log10'),
+    'sin': (math.sin, 'sin'),
+    'cos': (math.cos, 'cos'),
+    'tan': (math.tan, 'tan'),
+    'asin': (math.asin, 'arcsin'),
+    'acos': (math.acos, 'arccos'),
+    'atan': (math.atan, 'arctan'),
+    'atan2': (math.atan2, 'arctan2'),
+    'sinh': (math.sinh, 'sinh'),
+    'cosh': (math.cosh, 'cosh'),
+    'tanh': (math.tanh, 'tanh'),
+    'min': (min, 'minimum'),
+    'max': (max, 'maximum'),
+}
+
+
+def _function(name):
+    """
+    Return the implementation of an HFSS function.  NumPy isn't imported
+    here: if it hasn't been imported yet, no variable can be an array.
+    """
+    try:
+        function, numpyname = _FUNCTIONS[name.lower()]
+    except KeyError:
+        raise ValueError('Unknown function {0!r}'.format(name))
+
+    numpy = sys.modules.get('numpy')
+    if numpy is not None:
+        return getattr(numpy, numpyname)
+    return function
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?P<unit>[A-Za-z]+)?
+      | (?P<name>\$?[A-Za-z_]\w*)
+      | (?P<op>[-+*/^(),])
+    )""", re.VERBOSE)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError('Cannot parse expression {0!r} at {1!r}'.format(text, text[pos:]))
+        pos = match.end()
+        if match.group('number') is not None:
+            tokens.append(('number', _quantity(match.group('number'), match.group('unit'))))
+        elif match.group('name') is not None:
+            tokens.append(('name', match.group('name')))
+        else:
+            tokens.append(('op', match.group('op')))
+    return tokens
+
+
+def _quantity(number, unit):
+    value = float(number)
+    if unit is None:
+        return value
+    try:
+        return value * UNITS[unit.lower()]
+    except KeyError:
+        raise ValueError('Unknown unit {0!r}'.format(unit))
+
+
+class _Parser(object):
+    """
+    Recursive-descent evaluator for the text of an expression atom.
+
+        sum     := product (('+' | '-') product)*
+        product := unary (('*' | '/') unary)*
+        unary   := '-' unary | '+' unary | power
+        power   := primary ('^' unary)?
+        primary := number | name | name '(' sum (',' sum)* ')' | '(' sum ')'
+    """
+    def __init__(self, text, lookup):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.lookup = lookup
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self, op=None):
+        token = self.peek()
+        if op is not None and token != ('op', op):
+            raise ValueError('Expected {0!r} in expression {1!r}'.format(op, self.text))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        value = self.sum()
+        if self.pos != len(self.tokens):
+            raise ValueError('Unexpected {0!r} in expression {1!r}'.format(self.peek()[1], self.text))
+        return value
+
+    def sum(self):
+        value = self.product()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            if self.take()[1] == '+':
+                value = value + self.product()
+            else:
+                value = value - self.product()
+        return value
+
+    def product(self):
+        value = self.unary()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            if self.take()[1] == '*':
+                value = value * self.unary()
+            else:
+                value = value / self.unary()
+        return value
+
+    def unary(self):
+        if self.peek() == ('op', '-'):
+            self.take()
+            return -self.unary()
+        if self.peek() == ('op', '+'):
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        value = self.primary()
+        if self.peek() == ('op', '^'):
+            self.take()
+            value = value ** self.unary()
+        return value
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return value
+        if kind == 'name':
+            if self.peek() == ('op', '('):
+                self.take()
+                args = [self.sum()]
+                while self.peek() == ('op', ','):
+                    self.take()
+                    args.append(self.sum())
+                self.take(')')
+                return _function(value)(*args)
+            return self.lookup(value)
+        if (kind, value) == ('op', '('):
+            value = self.sum()
+            self.take(')')
+            return value
+        raise ValueError('Unexpected {0!r} in expression {1!r}'.format(value, self.text))
+
+
+class _Resolver(object):
+    """
+    Resolves variable names to values, evaluating variables whose values
+    are themselves expressions, and detecting circular definitions.
+    """
+    def __init__(self, variables):
+        self.variables = variables
+        self.values = {}
+        self.pending = set()
+
+    def __call__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            pass
+
+        if name not in self.variables:
+            lowered = name.lower()
+            if lowered in CONSTANTS:
+                return CONSTANTS[lowered]
+            raise KeyError('Undefined variable {0!r}'.format(name))
+
+        if name in self.pending:
+            raise ValueError('Circular definition of variable {0!r}'.format(name))
+
+        self.pending.add(name)
+        value = self.variables[name]
+        if isinstance(value, (str, Expression)):
+            value = self.evaluate(value)
+        self.pending.discard(name)
+
+        self.values[name] = value
+        return value
+
+    def evaluate(self, expr):
+        """
+        Evaluate an Expression tree bottom-up without recursion, evaluating
+        shared subexpressions once.
+        """
+        expr = Expression(expr)
+        results = {}
+        stack = [expr]
+        while stack:
+            node = stack[-1]
+            if id(node) in results:
+                stack.pop()
+                continue
+
+            if node.op == 'atom':
+                results[id(node)] = _Parser(node.args[0], self).parse()
+                stack.pop()
+                continue
+
+            pending = [arg for arg in node.args if id(arg) not in results]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            args = [results[id(arg)] for arg in node.args]
+            if node.op == '+':
+                value = args[0] + args[1]
+            elif node.op == '-':
+                value = args[0] - args[1]
+            elif node.op == '*':
+                value = args[0] * args[1]
+            elif node.op == '/':
+                value = args[0] / args[1]
+            elif node.op == '^':
+                value = args[0] ** args[1]
+            elif node.op == 'neg':
+                value = -args[0]
+            else:
+                value = abs(args[0])
+            results[id(node)] = value
+            stack.pop()
+
+        return results[id(expr)]
+
+
+def evaluate(expr, variables=None):
+    """
+    Evaluate an HFSS expression numerically.
+
+    Parameters
+    ----------
+    expr : Expression, str, or number
+        The expression to evaluate, e.g. "0.010in * 2 + $gap".
+    variables : dict
+        Maps design and project variable names (project variables include
+        the '$') to their values.  A value can be a number, a NumPy array,
+        or an expression string or Expression that refers to other
+        variables.
+
+    Returns
+    -------
+    value : float or numpy.ndarray
+        The value in SI units: meters, Hz, radians, seconds.  An array if
+        any of the variables used is an array.
+
+    Raises
+    ------
+    KeyError
+        If the expression uses a variable that isn't in variables.
+    ValueError
+        If the expression can't be parsed, or uses an unknown unit or
+        function, or variables are defined in terms of each other.
+    """
+    return _Resolver(variables or {}).evaluate(expr)
+
+
+if __name__ == "__main__":
+    import timeit
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    expr = Expression('0.010in') * 2 + '$gap'
+    print('{0} = {1}'.format(expr, evaluate(expr, {'$gap': '1mm'})))
+    print('sin(30deg) ^ 2 = {0}'.format(evaluate('sin(30deg) ^ 2')))
+
+    if numpy is not None:
+        widths = numpy.linspace(1e-3, 2e-3, 10000)
+        expr = Expression('width') / 2 + '0.5 * $gap'
+        n = 10
+        t = timeit.timeit(lambda: evaluate(expr, {'width': widths, '$gap': '1mm'}), number=n) / n
+        print('{0} over {1} points:  {2:.3f} ms'.format(expr, len(widths), 1e3 * t))
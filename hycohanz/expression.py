@@ -5,9 +5,27 @@ The HFSS expression generator.
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 
+import re
 import warnings
+import weakref
+
 warnings.simplefilter('default')
 
+# Operator precedences.  Atoms that are a single name or number bind tighter
+# than anything else; atoms made from arbitrary strings, and negations, are
+# parenthesized whenever they are operands.
+_ATOMIC = 100
+_POW = 40
+_MUL = 20
+_ADD = 10
+_NEG = 5
+_COMPOUND = 0
+
+_PRECEDENCE = {'+': _ADD, '-': _ADD, '*': _MUL, '/': _MUL, '^': _POW}
+
+_SIMPLE_ATOM = re.compile(r"""^(?:\$?[A-Za-z_]\w*
+                              |(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[A-Za-z]*)$""", re.VERBOSE)
+
 
 class Expression(object):
     """
@@ -17,14 +35,21 @@ class Expression(object):
     arithmetic operators, which is much more convenient than manipulating
     their string representation.
 
+    Expressions are immutable trees of operator nodes.  Identical
+    subexpressions are shared: building the same expression twice returns
+    the same object.  The string representation is only built when it is
+    first asked for, with no more parentheses than operator precedence
+    requires, and is then cached on the node.
+
     Parameters
     ----------
-    expr : str
-        Initialize the expression using its string representation.
+    expr : str, number, or Expression
+        Initialize the expression using its string representation.  If expr
+        is already an Expression it is returned unchanged.
 
     Attributes
     ----------
-    _raw_string : str
+    expr : str
         The string representation of the expression object.
 
     Raises
@@ -34,8 +59,108 @@ class Expression(object):
         Python 3 '//')
 
     """
-    def __init__(self, expr):
-        self.expr = str(expr)
+    __slots__ = ('op', 'args', 'precedence', '_expr', '__weakref__')
+
+    _nodes = weakref.WeakValueDictionary()
+
+    def __new__(cls, expr):
+        if isinstance(expr, Expression):
+            return expr
+
+        expr = str(expr)
+        precedence = _ATOMIC if _SIMPLE_ATOM.match(expr) else _COMPOUND
+        node = cls._node('atom', (expr,), precedence)
+        node._expr = expr
+        return node
+
+    @classmethod
+    def _node(cls, op, args, precedence):
+        """
+        Return the shared node for the given operator and operands, creating
+        it if it doesn't exist yet.
+        """
+        key = (op, args)
+        node = cls._nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node.op = op
+            node.args = args
+            node.precedence = precedence
+            node._expr = None
+            cls._nodes[key] = node
+        return node
+
+    def __reduce__(self):
+        return (Expression, (self.expr,))
+
+    @property
+    def expr(self):
+        """The string representation, built on first use and cached."""
+        if self._expr is None:
+            self._expr = self._render()
+        return self._expr
+
+    def _pieces(self):
+        """
+        Return the strings and operand nodes that make up this node's
+        string representation, with the parentheses required by precedence.
+        """
+        op = self.op
+        if op == 'abs':
+            return ['abs(', self.args[0], ')']
+
+        if op == 'neg':
+            operand = self.args[0]
+            if operand.precedence == _ATOMIC:
+                return ['-', operand]
+            return ['-(', operand, ')']
+
+        left, right = self.args
+        precedence = self.precedence
+
+        if left.precedence < precedence or (op == '^' and left.precedence == precedence):
+            pieces = ['(', left, ') ' + op + ' ']
+        else:
+            pieces = [left, ' ' + op + ' ']
+
+        if right.precedence < precedence or (right.precedence == precedence and op in '-/^'):
+            pieces += ['(', right, ')']
+        else:
+            pieces.append(right)
+
+        return pieces
+
+    def _render(self):
+        """
+        Build the string representation iteratively, so that very deep
+        expressions don't hit the recursion limit, and in a single join, so
+        that the cost is linear in the length of the result.
+        """
+        out = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, Expression):
+                out.append(item)
+            elif item._expr is not None:
+                out.append(item._expr)
+            else:
+                stack.extend(reversed(item._pieces()))
+        return ''.join(out)
+
+    def evaluate(self, variables=None):
+        """
+        Evaluate the expression numerically in SI units.  See
+        hycohanz.evaluator.evaluate() for details.
+        """
+        from hycohanz.evaluator import evaluate
+        return evaluate(self, variables)
+
+    def _binary(self, op, y, reflected=False):
+        if not isinstance(y, Expression):
+            y = Expression(y)
+        args = (y, self) if reflected else (self, y)
+        return Expression._node(op, args, _PRECEDENCE[op])
 
     def __str__(self):
         return self.expr
@@ -45,37 +170,37 @@ class Expression(object):
 
     def __abs__(self):
         """Overloads abs() function."""
-        return Expression('abs({0})'.format(str(self)))
+        return Expression._node('abs', (self,), _ATOMIC)
 
     def __add__(self, y):
         """Overloads the addition (+) operator."""
-        return Expression('({0}) + ({1})'.format(str(self), str(y)))
+        return self._binary('+', y)
 
     def __radd__(self, y):
-        return Expression('({1}) + ({0})'.format(str(self), str(y)))
+        return self._binary('+', y, reflected=True)
 
     def __sub__(self, y):
         """Overloads the subtraction (-) operator."""
-        return Expression('({0}) - ({1})'.format(str(self), str(y)))
+        return self._binary('-', y)
 
     def __rsub__(self, y):
-        return Expression('({1}) - ({0})'.format(str(self), str(y)))
+        return self._binary('-', y, reflected=True)
 
     def __mul__(self, y):
         """Overloads the multiplication (*) operator."""
-        return Expression('({0}) * ({1})'.format(str(self), str(y)))
+        return self._binary('*', y)
 
     def __rmul__(self, y):
         """Overloads the multiplication (*) operator."""
-        return Expression('({1}) * ({0})'.format(str(self), str(y)))
+        return self._binary('*', y, reflected=True)
 
     def __truediv__(self, y):
         """Overloads the Python 3 division (/) operator."""
-        return Expression('({0}) / ({1})'.format(str(self), str(y)))
+        return self._binary('/', y)
 
     def __rtruediv__(self, y):
         """Overloads the Python 3 division (/) operator."""
-        return Expression('{1} / ({0})'.format(str(self), str(y)))
+        return self._binary('/', y, reflected=True)
 
     def __div__(self, y):
         """Overloads the Python 3 floor division (//) operator."""
@@ -89,15 +214,15 @@ design.  Please use from __future__ import division in the calling code.""")
 
     def __neg__(self):
         """Overloads the negation (-) operator."""
-        return Expression('-({0})'.format(str(self)))
+        return Expression._node('neg', (self,), _NEG)
 
     def __pow__(self, y):
         """Overloads the power (**_ operator."""
-        return Expression('({0}) ^ ({1})'.format(str(self), str(y)))
+        return self._binary('^', y)
 
     def __rpow__(self, y):
         """Overloads the power (**_ operator."""
-        return Expression('({1}) ^ ({0})'.format(str(self), str(y)))
+        return self._binary('^', y, reflected=True)
 
 if __name__ == "__main__":
     a = Expression('0.010in')
@@ -112,4 +237,27 @@ if __name__ == "__main__":
     print(c)
     print(d)
     print(e)
-    print(f)
\ No newline at end of file
+    print(f)
+
+    import time
+
+    def concatenated(x, y, op):
+        return '({0}) {1} ({2})'.format(x, op, y)
+
+    for N in (10000, 40000):
+        t0 = time.time()
+        s = '0.010in'
+        for n in range(N):
+            s = concatenated(s, n, '+*'[n % 2])
+        t1 = time.time()
+        x = Expression('0.010in')
+        for n in range(N):
+            x = x + n if n % 2 == 0 else x * n
+        t2 = time.time()
+        x.expr
+        t3 = time.time()
+
+        print('{0} operations deep:'.format(N))
+        print('  string concatenation:  {0:.3f} s, {1} characters'.format(t1 - t0, len(s)))
+        print('  expression tree:       {0:.3f} s to build, {1:.3f} s to serialize, {2} characters'.format(
+              t2 - t1, t3 - t2, len(x.expr)))
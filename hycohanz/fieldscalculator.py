@@ -4,11 +4,23 @@ HFSS Fields Calculator functions. Functions in this module correspond more or
 less to the functions described in the HFSS Scripting Guide, Section "Fields 
 Calculator Script Commands".
 
-At last count there were 5 functions implemented out of 28.
+At last count there were 11 functions implemented out of 28.
+
+evaluate_grid() evaluates the expression at the top of the stack over a
+whole grid of frequencies, phases and design variations, building the stack
+only once but still making one GetTopEntryValue() call per grid point.
 """
 
 from __future__ import division, print_function, unicode_literals, absolute_import
 
+import json
+import os
+
+from hycohanz.log import get_logger
+from hycohanz.utils import canonical_value
+
+_logger = get_logger(__name__)
+
 def enter_vol(oFieldsReporter, VolumeName):
     """
     Enters a volume defined in the 3D Modeler editor into the Fields Calculator.
@@ -80,8 +92,8 @@ def clc_eval(oFieldsReporter, setupname, sweepname, freq, phase, variablesdict):
     for key in variablesdict:
         variablesarray += [str(key) + ':=', str(variablesdict[key])]
         
-    print('solutionname: ' + str(solutionname))
-    print('variablesarray: ' + str(variablesarray))
+    _logger.debug('solutionname: %s', solutionname)
+    _logger.debug('variablesarray: %s', variablesarray)
     
     oFieldsReporter.ClcEval(solutionname, variablesarray)
     
@@ -139,13 +151,372 @@ def get_top_entry_value(oModule, setupname, sweepname, freq, phase, variablesdic
     for key in variablesdict:
         variablesarray += [str(key) + ':=', str(variablesdict[key])]
         
-    print('solutionname: ' + str(solutionname))
-    print('variablesarray: ' + str(variablesarray))
+    _logger.debug('solutionname: %s', solutionname)
+    _logger.debug('variablesarray: %s', variablesarray)
     
     result = oModule.GetTopEntryValue(solutionname, variablesarray)
 
     return result
 
+def enter_surf(oFieldsReporter, SurfaceName):
+    """
+    Enters a surface defined in the 3D Modeler editor into the Fields
+    Calculator.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    SurfaceName : str
+        Name of a surface defined in the 3D Modeler editor.
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.EnterSurf(SurfaceName)
+
+
+
+def enter_line(oFieldsReporter, LineName):
+    """
+    Enters a line defined in the 3D Modeler editor into the Fields Calculator.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    LineName : str
+        Name of a line defined in the 3D Modeler editor.
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.EnterLine(LineName)
+
+
+
+def enter_scalar(oFieldsReporter, Scalar):
+    """
+    Enters a scalar constant onto the Fields Calculator stack.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    Scalar : float
+        The constant.
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.EnterScalar(Scalar)
+
+
+
+def calc_stack(oFieldsReporter, StackOperation):
+    """
+    Performs a stack operation in the Fields Calculator.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    StackOperation : str
+        One of "push", "pop", "rlup", "rldn", "exch" or "clear".
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.CalcStack(StackOperation)
+
+
+
+def add_named_expression(oFieldsReporter, Name, FieldType="Fields"):
+    """
+    Saves the expression at the top of the Fields Calculator stack as a
+    named expression.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    Name : str
+        Name of the named expression.
+    FieldType : str
+        The solution type of the expression, e.g. "Fields".
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.AddNamedExpression(Name, FieldType)
+
+
+
+def delete_named_expression(oFieldsReporter, Name):
+    """
+    Deletes a named expression.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    Name : str
+        Name of the named expression.
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.DeleteNamedExpr(Name)
+
+
+
+def copy_named_expr_to_stack(oFieldsReporter, Name):
+    """
+    Enters a named expression onto the Fields Calculator stack.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    Name : str
+        Name of the named expression.
+
+    Returns
+    -------
+    None
+    """
+    oFieldsReporter.CopyNamedExprToStack(Name)
+
+
+
+def _variation_array(variablesdict):
+    """The "name:=", "value" pairs of a design variation."""
+    variablesarray = []
+    for key in variablesdict:
+        variablesarray += [str(key) + ':=', str(variablesdict[key])]
+    return variablesarray
+
+
+def _top_entry_float(result):
+    """Convert a GetTopEntryValue() result, a sequence of strings, to a float."""
+    if isinstance(result, (list, tuple)):
+        result = result[0]
+    return float(result)
+
+
+class FieldGrid(object):
+    """
+    Calculator results over a grid, with labeled axes.
+
+    Attributes
+    ----------
+    values : numpy.ndarray
+        The results, indexed [variation, frequency, phase].  Points not
+        evaluated yet are NaN.
+    axes : list of tuple
+        (axis name, labels) for each dimension: ('variation', list of
+        variable dicts), ('freq', frequencies in Hz), ('phase', phases in
+        degrees).
+    done : numpy.ndarray
+        Boolean array, True where the point has been evaluated.
+    """
+    def __init__(self, values, axes, done):
+        self.values = values
+        self.axes = axes
+        self.done = done
+
+    @property
+    def dims(self):
+        return [name for name, labels in self.axes]
+
+    def sel(self, variation=None, freq=None, phase=None):
+        """
+        Select by label instead of position, e.g. sel(freq=2e9), and return
+        the array of the remaining axes.
+        """
+        index = []
+        for (name, labels), label in zip(self.axes, (variation, freq, phase)):
+            if label is None:
+                index.append(slice(None))
+            else:
+                index.append(list(labels).index(label))
+        return self.values[tuple(index)]
+
+    def __repr__(self):
+        return 'FieldGrid({0})'.format(', '.join('{0}: {1}'.format(name, len(labels))
+                                                 for name, labels in self.axes))
+
+
+def evaluate_grid(oFieldsReporter, setupname, sweepname, freqs, phases=(0,), variations=({},),
+                  build=None, chunk_size=1000, progress=None, checkpoint=None,
+                  parse=_top_entry_float):
+    """
+    Evaluates the expression at the top of the Fields Calculator stack at
+    every point of a grid of frequencies, phases and design variations.
+
+    Only building the stack is amortized: it is built once, by calling
+    build(oFieldsReporter) if given, and each point still costs one
+    GetTopEntryValue() call, since the Fields Calculator evaluates the stack
+    at a single frequency and phase at a time.  Compared with calling
+    get_top_entry_value() per point, that saves the calls that rebuild the
+    stack.  Points are evaluated variation by variation, so that HFSS loads
+    each variation's solution once.
+
+    Parameters
+    ----------
+    oFieldsReporter : pywin32 COMObject
+        An HFSS "FieldsReporter" module
+    setupname : str
+        Name of HFSS setup to use, for example "Setup1"
+    sweepname : str
+        Name of HFSS sweep to use, for example "LastAdaptive"
+    freqs : list of float
+        Frequencies in Hz.
+    phases : list of float
+        Phases in degrees.
+    variations : list of dict
+        Design variations, each a dict of variable values except 'Freq' and
+        'Phase', as for get_top_entry_value().
+    build : callable
+        Called once as build(oFieldsReporter) to enter the expression onto
+        the stack, e.g. with enter_qty() and calc_op().
+    chunk_size : int
+        Number of points evaluated between calls to progress and saves of
+        the checkpoint.
+    progress : callable
+        Called as progress(done, total) after every chunk.
+    checkpoint : str
+        Name of a .npz file in which the results evaluated so far are saved
+        after every chunk and when an evaluation fails, together with the
+        solution name and the grid's frequencies, phases and variations.  If
+        the file exists, the points already in it are not evaluated again,
+        so an interrupted run resumes where it stopped.  A checkpoint of a
+        different grid raises ValueError.
+    parse : callable
+        Converts a GetTopEntryValue() result to a float.
+
+    Returns
+    -------
+    grid : FieldGrid
+    """
+    import numpy
+
+    freqs = list(freqs)
+    phases = list(phases)
+    variations = [dict(variables) for variables in variations]
+    shape = (len(variations), len(freqs), len(phases))
+    values = numpy.full(shape, numpy.nan)
+    done = numpy.zeros(shape, dtype=bool)
+
+    solutionname = setupname + " : " + sweepname
+    freqstrings = [str(freq) + 'Hz' for freq in freqs]
+    phasestrings = [str(phase) + 'deg' for phase in phases]
+    # What the checkpoint's values are the values of.
+    grid = json.dumps({'solution': solutionname,
+                       'freqs': freqstrings,
+                       'phases': phasestrings,
+                       'variations': [sorted((str(name), canonical_value(value)) for name, value in variables.items())
+                                      for variables in variations]},
+                      sort_keys=True)
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with numpy.load(checkpoint) as saved:
+            if 'grid' not in saved or str(saved['grid']) != grid:
+                raise ValueError('Checkpoint {0} holds a different grid; remove it or choose another '
+                                 'file'.format(checkpoint))
+            values[...] = saved['values']
+            done[...] = saved['done']
+
+    def save():
+        if checkpoint is not None:
+            with open(checkpoint + '.tmp', 'wb') as f:
+                numpy.savez(f, values=values, done=done, grid=numpy.array(grid))
+            os.replace(checkpoint + '.tmp', checkpoint)
+
+    if build is not None:
+        build(oFieldsReporter)
+
+    total = values.size
+    count = int(done.sum())
+    unsaved = 0
+    try:
+        for i, variables in enumerate(variations):
+            if done[i].all():
+                continue
+            variablesarray = _variation_array(variables)
+            for j, freqstring in enumerate(freqstrings):
+                for k, phasestring in enumerate(phasestrings):
+                    if done[i, j, k]:
+                        continue
+                    result = oFieldsReporter.GetTopEntryValue(
+                        solutionname, ["Freq:=", freqstring, "Phase:=", phasestring] + variablesarray)
+                    values[i, j, k] = parse(result)
+                    done[i, j, k] = True
+                    count += 1
+                    unsaved += 1
+                    if unsaved >= chunk_size:
+                        save()
+                        unsaved = 0
+                        if progress is not None:
+                            progress(count, total)
+    except BaseException:
+        save()
+        raise
+
+    if unsaved:
+        save()
+        if progress is not None:
+            progress(count, total)
+
+    axes = [('variation', variations), ('freq', freqs), ('phase', phases)]
+    return FieldGrid(values, axes, done)
+
+
 if __name__ == "__main__":
+    import contextlib
     import doctest
-    doctest.testmod()
\ No newline at end of file
+    import io
+    import timeit
+
+    doctest.testmod()
+
+    import numpy
+
+    from hycohanz.standin import RecordingEditor
+
+    freqs = numpy.linspace(1e9, 20e9, 200)
+    phases = range(0, 360, 10)
+    variations = [{'w': '{0}mm'.format(w)} for w in (1, 2, 3)]
+
+    def per_point(oFieldsReporter):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for variables in variations:
+                for freq in freqs:
+                    for phase in phases:
+                        enter_qty(oFieldsReporter, 'E')
+                        calc_op(oFieldsReporter, 'Mag')
+                        enter_vol(oFieldsReporter, 'Substrate')
+                        calc_op(oFieldsReporter, 'Maximum')
+                        float(get_top_entry_value(oFieldsReporter, 'Setup1', 'LastAdaptive',
+                                                  freq, phase, variables)[0])
+
+    def build(oFieldsReporter):
+        enter_qty(oFieldsReporter, 'E')
+        calc_op(oFieldsReporter, 'Mag')
+        enter_vol(oFieldsReporter, 'Substrate')
+        calc_op(oFieldsReporter, 'Maximum')
+
+    returns = {'GetTopEntryValue': ['1.5']}
+    oLoop, oGrid = RecordingEditor(returns), RecordingEditor(returns)
+    t_loop = timeit.timeit(lambda: per_point(oLoop), number=1)
+    t_grid = timeit.timeit(lambda: evaluate_grid(oGrid, 'Setup1', 'LastAdaptive', freqs, phases,
+                                                 variations, build=build), number=1)
+    print('{0} points:'.format(len(freqs) * len(phases) * len(variations)))
+    print('  get_top_entry_value() loop:  {0:.3f} s, {1} COM calls'.format(t_loop, oLoop.round_trips))
+    print('  evaluate_grid():             {0:.3f} s, {1} COM calls'.format(t_grid, oGrid.round_trips))
\ No newline at end of file
@@ -0,0 +1,800 @@
+# -*- coding: utf-8 -*-
+"""
+Read HFSS project (.hfss) files without HFSS.
+
+An .hfss file is a text file made of nested blocks::
+
+    $begin 'Materials'
+        $begin 'vacuum'
+            permittivity='1'
+        $end 'vacuum'
+    $end 'Materials'
+
+The file is scanned once, line by line, to build a tree of blocks that only
+holds the block names and their byte offsets.  The tree is saved to a
+sidecar index file so that later opens of the same, unchanged project skip
+the scan.  The items of a block (the key=value lines, VariableProp(...)
+lines, etc.) are parsed only when they are asked for, from slices of the
+memory-mapped file.  Embedded
+binary data (base64 thumbnails, $begin_cdata$ sections) is skipped during the
+scan and returned as a BinarySection placeholder that reads the data on
+request.
+
+Example Usage
+-------------
+>>> import hycohanz.hfssfile as hfssfile
+>>> project = hfssfile.HFSSFile('WR284.hfss')
+>>> project.get_top_design_list()
+['HFSSDesign1']
+>>> project.get_variables('HFSSDesign1')
+OrderedDict([('width_WG', '0.072136'), ('height_WG', '0.034036')])
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import collections
+import json
+import mmap
+import os
+import re
+import warnings
+
+BEGIN = b"$begin '"
+END = b"$end '"
+CDATA_BEGIN = b'$begin_cdata$'
+CDATA_END = b'$end_cdata$'
+
+ENCODING = 'utf-8'
+
+# Sidecar index files are named <project>.hfss + INDEX_SUFFIX.
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+Call = collections.namedtuple('Call', 'name args kwargs')
+Call.__doc__ = """A function-style item such as Faces(22, 23) or Soln(N='x', I=1)."""
+
+
+class HFSSFormatError(ValueError):
+    """Raised when an .hfss file is not well formed."""
+
+
+class BinarySection(object):
+    """
+    Placeholder for embedded binary data (a base64 blob or a cdata section)
+    that was skipped while parsing.
+
+    Attributes
+    ----------
+    start : int
+        Byte offset of the first byte of the value.
+    end : int
+        Byte offset one past the last byte of the value.
+    """
+    __slots__ = ('start', 'end', '_source')
+
+    def __init__(self, source, start, end):
+        self._source = source
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return '<BinarySection {0} bytes at {1}>'.format(self.end - self.start, self.start)
+
+    def read(self):
+        """Return the raw bytes of the value, as stored in the file."""
+        return self._source.read(self.start, self.end)
+
+
+class Block(object):
+    """
+    A $begin/$end block of an .hfss file.
+
+    Attributes
+    ----------
+    name : str
+        The block name.
+    start : int
+        Byte offset of the $begin line.
+    end : int
+        Byte offset one past the end of the $end line.
+    parent : Block or None
+        The enclosing block.
+    children : list of Block
+        The blocks nested directly inside this one, in file order.
+    """
+    __slots__ = ('name', 'start', 'end', 'parent', 'children', '_source', '_items')
+
+    def __init__(self, source, name, start, parent=None):
+        self._source = source
+        self.name = name
+        self.start = start
+        self.end = None
+        self.parent = parent
+        self.children = []
+        self._items = None
+
+    def __repr__(self):
+        return '<Block {0!r} [{1}:{2}]>'.format(self.name, self.start, self.end)
+
+    @property
+    def path(self):
+        """The '/'-separated names of this block and its ancestors."""
+        names = []
+        block = self
+        while block is not None:
+            names.append(block.name)
+            block = block.parent
+        return '/'.join(reversed(names))
+
+    def items(self):
+        """
+        Return the items of this block as a list of (key, value) pairs, in
+        file order.  Items of nested blocks are not included.
+        """
+        if self._items is None:
+            self._items = self._source.parse_items(self)
+        return self._items
+
+    def get(self, key, default=None):
+        """Return the value of the first item with the given key."""
+        for k, v in self.items():
+            if k == key:
+                return v
+        return default
+
+    def getall(self, key):
+        """Return the values of all items with the given key."""
+        return [v for k, v in self.items() if k == key]
+
+    def to_dict(self):
+        """
+        Return the items and nested blocks as nested dicts.  Repeated keys
+        keep their last value.
+        """
+        result = collections.OrderedDict(self.items())
+        for child in self.children:
+            result[child.name] = child.to_dict()
+        return result
+
+    def block(self, name):
+        """Return the first nested block with the given name, or None."""
+        for child in self.children:
+            if child.name == name:
+                return child
+        return None
+
+    def blocks(self, name=None):
+        """Return the nested blocks, optionally only those with the given name."""
+        if name is None:
+            return list(self.children)
+        return [child for child in self.children if child.name == name]
+
+    def find(self, path):
+        """
+        Return the first block below this one matching a '/'-separated path
+        of block names, or None.
+        """
+        block = self
+        for name in path.split('/'):
+            block = block.block(name)
+            if block is None:
+                return None
+        return block
+
+
+class _Scanner(object):
+    """
+    Line scanner over a binary file object that tracks byte offsets and
+    skips over binary continuation values and cdata sections.
+    """
+    def __init__(self, lines, offset=0):
+        self.lines = iter(lines)
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.lines)
+        start = self.offset
+        self.offset += len(line)
+        return start, line
+
+    next = __next__
+
+    def skip_continuation(self, line):
+        """
+        Skip the remaining lines of a value whose first line is given.
+        Return the byte offset one past the end of the value.
+        """
+        if CDATA_BEGIN in line:
+            if CDATA_END in line[line.index(CDATA_BEGIN):]:
+                return self.offset
+            for _, line in self:
+                if CDATA_END in line:
+                    break
+        else:
+            while line.rstrip(b'\r\n').endswith(b'\\'):
+                try:
+                    _, line = next(self)
+                except StopIteration:
+                    break
+        return self.offset
+
+
+def _is_binary_start(line):
+    """Whether an item line starts a multi-line or cdata value."""
+    if CDATA_BEGIN in line:
+        return True
+    return line.rstrip(b'\r\n').endswith(b'\\')
+
+
+def _block_name(line, prefix):
+    stripped = line.strip()
+    name = stripped[len(prefix):]
+    if not name.endswith(b"'"):
+        raise HFSSFormatError('Malformed block line: {0!r}'.format(stripped))
+    return name[:-1].decode(ENCODING, 'replace')
+
+
+def scan(fileobj, source=None, skip_binary=True):
+    """
+    Scan a binary .hfss file object and return its top-level blocks.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        A file opened in binary mode, positioned at the beginning.
+    source : HFSSFile
+        The object that the blocks use to read their items back.
+    skip_binary : bool
+        Whether to skip base64 and cdata values without looking at their
+        contents.  If False, their lines are scanned for block markers
+        like any other line.
+
+    Returns
+    -------
+    blocks : list of Block
+    """
+    roots = []
+    stack = []
+    scanner = _Scanner(fileobj)
+
+    for start, line in scanner:
+        stripped = line.lstrip(b' \t')
+        if stripped.startswith(BEGIN):
+            parent = stack[-1] if stack else None
+            block = Block(source, _block_name(stripped, BEGIN), start, parent)
+            if parent is None:
+                roots.append(block)
+            else:
+                parent.children.append(block)
+            stack.append(block)
+        elif stripped.startswith(END):
+            name = _block_name(stripped, END)
+            if not stack or stack[-1].name != name:
+                raise HFSSFormatError("Unexpected $end '{0}' at byte {1}".format(name, start))
+            stack.pop().end = scanner.offset
+        elif skip_binary and _is_binary_start(stripped):
+            scanner.skip_continuation(stripped)
+
+    if stack:
+        raise HFSSFormatError("Missing $end '{0}'".format(stack[-1].name))
+
+    return roots
+
+
+def iter_blocks(blocks):
+    """
+    Yield the given blocks and all blocks nested in them, in file order.
+    """
+    stack = list(reversed(blocks))
+    while stack:
+        block = stack.pop()
+        yield block
+        stack.extend(reversed(block.children))
+
+
+def index_filename(filename):
+    """Return the name of the sidecar index file of an .hfss file."""
+    return filename + INDEX_SUFFIX
+
+
+def write_index(filename, stat, blocks, skip_binary=True):
+    """
+    Write the sidecar index file of an .hfss file.
+
+    The index records the file's modification time and size, and the depth,
+    name, start and end offset of every block in file order.  Failure to
+    write the index (e.g. in a read-only archive) only issues a warning.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the .hfss file.
+    stat : os.stat_result
+        The status of the .hfss file when it was scanned.
+    blocks : list of Block
+        The top-level blocks returned by scan().
+    skip_binary : bool
+        The skip_binary setting used for the scan.
+    """
+    depths = {}
+    layout = []
+    for block in iter_blocks(blocks):
+        depth = depths[id(block.parent)] + 1 if block.parent is not None else 0
+        depths[id(block)] = depth
+        layout.append([depth, block.name, block.start, block.end])
+
+    index = {'version': INDEX_VERSION,
+             'mtime': stat.st_mtime,
+             'size': stat.st_size,
+             'skip_binary': skip_binary,
+             'blocks': layout}
+
+    try:
+        with open(index_filename(filename), 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+    except (IOError, OSError) as e:
+        warnings.warn('Cannot write index for {0}: {1}'.format(filename, e))
+
+
+def load_index(filename, stat, source=None, skip_binary=True):
+    """
+    Load the block tree of an .hfss file from its sidecar index file.
+
+    Returns
+    -------
+    blocks : list of Block or None
+        The top-level blocks, or None if the index is missing, unreadable,
+        or doesn't match the file's current modification time and size.
+    """
+    try:
+        with open(index_filename(filename)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if (index.get('version') != INDEX_VERSION
+            or index.get('mtime') != stat.st_mtime
+            or index.get('size') != stat.st_size
+            or index.get('skip_binary') != skip_binary):
+        return None
+
+    roots = []
+    stack = []
+    for depth, name, start, end in index['blocks']:
+        del stack[depth:]
+        parent = stack[-1] if stack else None
+        block = Block(source, name, start, parent)
+        block.end = end
+        if parent is None:
+            roots.append(block)
+        else:
+            parent.children.append(block)
+        stack.append(block)
+    return roots
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.]))
+      | (?P<word>[^\s'"(),=\[\]:]+)
+      | (?P<punct>[(),=\[\]:])
+    )""", re.VERBOSE)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise HFSSFormatError('Cannot parse {0!r}'.format(text))
+        pos = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _unquote(s):
+    return re.sub(r'\\(.)', r'\1', s[1:-1])
+
+
+def _number(s):
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+class _Parser(object):
+    """Recursive-descent parser for the right-hand side of an item line."""
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, punct):
+        kind, value = self.take()
+        if kind != 'punct' or value != punct:
+            raise HFSSFormatError('Expected {0!r}, got {1!r}'.format(punct, value))
+
+    def name(self):
+        kind, value = self.take()
+        if kind == 'string':
+            return _unquote(value)
+        if kind in ('word', 'number'):
+            return value
+        raise HFSSFormatError('Expected a name, got {0!r}'.format(value))
+
+    def value(self):
+        kind, value = self.peek()
+        if kind == 'string':
+            self.take()
+            if self.peek() == ('punct', '('):
+                return self.call(_unquote(value))
+            return _unquote(value)
+        if kind == 'number':
+            self.take()
+            return _number(value)
+        if kind == 'punct' and value == '[':
+            return self.array()
+        if kind == 'word':
+            self.take()
+            if self.peek() == ('punct', '('):
+                return self.call(value)
+            if value == 'true':
+                return True
+            if value == 'false':
+                return False
+            return value
+        raise HFSSFormatError('Unexpected {0!r}'.format(value))
+
+    def call(self, name):
+        self.expect('(')
+        args = []
+        kwargs = collections.OrderedDict()
+        while self.peek() != ('punct', ')'):
+            following = self.tokens[self.pos + 1:self.pos + 2]
+            if following == [('punct', '=')]:
+                key = self.name()
+                self.take()
+                kwargs[key] = self.value()
+            elif following == [('punct', '[')]:
+                key = self.name()
+                kwargs[key] = self.array()
+            else:
+                args.append(self.value())
+            if self.peek() == ('punct', ','):
+                self.take()
+        self.expect(')')
+        return Call(name, args, kwargs)
+
+    def array(self):
+        self.expect('[')
+        if self.peek()[0] == 'number' and self.tokens[self.pos + 1:self.pos + 2] == [('punct', ':')]:
+            self.pos += 2
+        values = []
+        while self.peek() != ('punct', ']'):
+            values.append(self.value())
+            if self.peek() == ('punct', ','):
+                self.take()
+        self.expect(']')
+        return values
+
+
+def parse_item(text):
+    """
+    Parse one item line of an .hfss block.
+
+    Parameters
+    ----------
+    text : str
+        The line, without leading whitespace.
+
+    Returns
+    -------
+    key : str
+        The item key.
+    value : object
+        The parsed value: str, int, float, bool, list, or a Call for
+        function-style items like Faces(22, 23).
+    """
+    parser = _Parser(_tokenize(text))
+    key = parser.name()
+    kind, punct = parser.peek()
+    if (kind, punct) == ('punct', '='):
+        parser.take()
+        value = parser.value()
+    elif (kind, punct) == ('punct', '('):
+        value = parser.call(key)
+    elif (kind, punct) == ('punct', '['):
+        value = parser.array()
+    elif kind is None:
+        value = None
+    else:
+        raise HFSSFormatError('Cannot parse {0!r}'.format(text))
+    return key, value
+
+
+class HFSSFile(object):
+    """
+    An .hfss project file opened for reading without HFSS.
+
+    The file is memory-mapped, and block contents are served as slices of
+    the mapping, so looking up one block doesn't read the rest of the file.
+    The block layout is stored in a sidecar index file next to the project
+    (see INDEX_SUFFIX), keyed by the project's modification time and size.
+    When the sidecar is current the project isn't scanned at all.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the .hfss file.
+    skip_binary : bool
+        Whether embedded base64 and cdata values are skipped during the
+        scan and returned as BinarySection placeholders.
+    sidecar : bool
+        Whether to load the block layout from the sidecar index file, and to
+        write one after scanning if it is missing or stale.
+
+    Attributes
+    ----------
+    blocks : list of Block
+        The top-level blocks, normally 'AnsoftProject' and 'ProjectPreview'.
+    index : dict
+        Maps each block path (e.g. 'AnsoftProject/Definitions/Materials') to
+        the list of (start, end) byte ranges of the blocks with that path.
+    """
+    def __init__(self, filename, skip_binary=True, sidecar=True):
+        self.filename = filename
+        self.skip_binary = skip_binary
+
+        self._file = open(filename, 'rb')
+        try:
+            stat = os.fstat(self._file.fileno())
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+
+            self.blocks = load_index(filename, stat, self, skip_binary) if sidecar else None
+            if self.blocks is None:
+                self._file.seek(0)
+                self.blocks = scan(self._file, self, skip_binary)
+                if sidecar:
+                    write_index(filename, stat, self.blocks, skip_binary)
+        except Exception:
+            self.close()
+            raise
+
+        self.index = self._build_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, traceback):
+        self.close()
+
+    def close(self):
+        """Release the memory mapping and the file handle."""
+        if hasattr(self._mmap, 'close'):
+            self._mmap.close()
+        self._file.close()
+
+    def _build_index(self):
+        index = {}
+        for block in iter_blocks(self.blocks):
+            index.setdefault(block.path, []).append((block.start, block.end))
+        return index
+
+    def read(self, start, end):
+        """Return the raw bytes in the given byte range of the file."""
+        return self._mmap[start:end]
+
+    def block_bytes(self, path, n=0):
+        """
+        Return the raw bytes of a block, including its $begin and $end
+        lines, sliced from the memory-mapped file.
+
+        Parameters
+        ----------
+        path : str
+            The '/'-separated block path, as in the index.
+        n : int
+            Which of the blocks with that path to return.
+
+        Raises
+        ------
+        KeyError
+            If there is no such block.
+        """
+        try:
+            start, end = self.index[path][n]
+        except IndexError:
+            raise KeyError('{0}[{1}]'.format(path, n))
+        return self._mmap[start:end]
+
+    def parse_items(self, block):
+        """
+        Parse the items of the given block from the file.  Only the byte
+        ranges between the nested blocks are read.
+
+        Returns
+        -------
+        items : list of (key, value) pairs
+        """
+        bounds = [block.start]
+        for child in block.children:
+            bounds += (child.start, child.end)
+        bounds.append(block.end)
+
+        items = []
+        for n in range(0, len(bounds), 2):
+            lines = self.read(bounds[n], bounds[n + 1]).splitlines(True)
+            offset = bounds[n]
+            if n == 0:
+                # The $begin line.
+                offset += len(lines[0])
+                lines = lines[1:]
+            if n == len(bounds) - 2:
+                # The $end line.
+                lines = lines[:-1]
+
+            scanner = _Scanner(lines, offset)
+            for start, line in scanner:
+                stripped = line.strip()
+                if not stripped:
+                    continue
+
+                if _is_binary_start(stripped):
+                    items.append(self._binary_item(scanner, start, line))
+                    continue
+
+                items.append(parse_item(stripped.decode(ENCODING, 'replace')))
+
+        return items
+
+    def _binary_item(self, scanner, start, line):
+        """
+        Return the (key, value) pair of an item whose value spans several
+        lines or is a cdata section, leaving scanner after its last line.
+        """
+        indent = len(line) - len(line.lstrip(b' \t'))
+        stripped = line.strip()
+        eq = stripped.find(b'=')
+        key = stripped[:eq].strip(b"'").decode(ENCODING, 'replace')
+        section = BinarySection(self, start + indent + eq + 1, scanner.skip_continuation(stripped))
+        if self.skip_binary:
+            return key, section
+
+        data = section.read().strip()
+        if data.startswith(CDATA_BEGIN):
+            data = data[len(CDATA_BEGIN):data.rindex(CDATA_END)]
+        else:
+            data = re.sub(br'\\\r?\n', b'', data).strip(b"'")
+        return key, data.decode(ENCODING, 'replace')
+
+    def find(self, path):
+        """
+        Return the first block matching a '/'-separated path of block names,
+        starting at the top level, or None.
+        """
+        first, _, rest = path.partition('/')
+        for block in self.blocks:
+            if block.name == first:
+                return block.find(rest) if rest else block
+        return None
+
+    @property
+    def project(self):
+        """The top-level 'AnsoftProject' block."""
+        return self.find('AnsoftProject')
+
+    def designs(self):
+        """
+        Return the design blocks (e.g. 'HFSSModel') of the project.
+        """
+        return [block for block in self.project.children
+                if block.block('ModelSetup') is not None]
+
+    def design(self, designname):
+        """
+        Return the design block with the given name.
+
+        Raises
+        ------
+        KeyError
+            If there is no such design.
+        """
+        for block in self.designs():
+            if block.get('Name') == designname:
+                return block
+        raise KeyError(designname)
+
+    def get_top_design_list(self):
+        """
+        Return the names of the designs in the project, like
+        project.get_top_design_list().
+        """
+        return [block.get('Name') for block in self.designs()]
+
+    def get_variables(self, designname=None):
+        """
+        Return the project variables, or the local variables of the given
+        design, as an ordered dict mapping names to value strings.
+        """
+        if designname is None:
+            properties = self.project.block('Properties')
+        else:
+            properties = self.design(designname).find('ModelSetup/Properties')
+
+        variables = collections.OrderedDict()
+        if properties is not None:
+            for value in properties.getall('VariableProp'):
+                variables[value.args[0]] = value.args[-1]
+        return variables
+
+    def get_materials(self):
+        """
+        Return the project materials as an ordered dict mapping material
+        names to dicts of their properties.
+        """
+        materials = self.find('AnsoftProject/Definitions/Materials')
+        if materials is None:
+            return collections.OrderedDict()
+        return collections.OrderedDict((block.name, block.to_dict())
+                                       for block in materials.children)
+
+    def get_setups(self, designname):
+        """
+        Return the analysis setups of the given design as an ordered dict
+        mapping setup names to dicts of their parameters.
+        """
+        setups = self.design(designname).find('AnalysisSetup/SolveSetups')
+        if setups is None:
+            return collections.OrderedDict()
+        return collections.OrderedDict((block.name, block.to_dict())
+                                       for block in setups.children)
+
+    def get_boundaries(self, designname):
+        """
+        Return the boundaries and excitations of the given design as an
+        ordered dict mapping boundary names to dicts of their parameters.
+        """
+        boundaries = self.design(designname).find('BoundarySetup/Boundaries')
+        if boundaries is None:
+            return collections.OrderedDict()
+        return collections.OrderedDict((block.name, block.to_dict())
+                                       for block in boundaries.children)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    filenames = sys.argv[1:]
+    t0 = time.time()
+    for filename in filenames:
+        with HFSSFile(filename) as project:
+            print(filename)
+            print('  materials:  {0}'.format(', '.join(project.get_materials())))
+            print('  variables:  {0}'.format(dict(project.get_variables())))
+            for designname in project.get_top_design_list():
+                print('  design {0}'.format(designname))
+                print('    variables:   {0}'.format(dict(project.get_variables(designname))))
+                print('    setups:      {0}'.format(', '.join(project.get_setups(designname))))
+                print('    boundaries:  {0}'.format(', '.join(project.get_boundaries(designname))))
+    print('{0} files in {1:.3f} s'.format(len(filenames), time.time() - t0))
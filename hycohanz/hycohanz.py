@@ -18,7 +18,14 @@ import warnings
 
 warnings.simplefilter('default')
 
-from hycohanz.appobject import setup_interface
+from hycohanz.log import get_logger
+
+_logger = get_logger(__name__)
+
+from hycohanz.appobject import (setup_interface,
+                                register_backend,
+                                get_backends,
+                                com_errors)
 
 from hycohanz.desktop import (quit_application, 
                               new_project, 
@@ -35,19 +42,37 @@ from hycohanz.project import *
 
 from hycohanz.property import ( add_property,
                                 set_variable,
+                                change_variables,
+                                add_properties,
+                                set_variables,
+                                forget_variables,
                                 )
 
 from hycohanz.design import (get_module,
                              set_active_editor)
 
 from hycohanz.expression import Expression
+from hycohanz.evaluator import evaluate
 from hycohanz.modeler3d import *
+from hycohanz.batch import BatchEditor
+from hycohanz.shadow import ShadowEditor
+from hycohanz.spatial import FaceIndex, EdgeIndex
+from hycohanz.solver import Solver, SolveCancelled, SolveTimeout
+from hycohanz.pool import WorkerPool, HFSSBackend, StandinBackend
+from hycohanz.backend import record, replay
+from hycohanz.resultstore import ResultStore
+from hycohanz.variationcache import VariationCache
+from hycohanz.buildgraph import BuildGraph, Builder
+from hycohanz.boolean import BoundingBoxes, unite_tree, subtract_tree
+from hycohanz.template import Template
+from hycohanz.hfssfile import HFSSFile
 from hycohanz.material import ( add_material,
                                 does_material_exist,
                                 )
 
 from hycohanz.analysis_setup import (insert_frequency_sweep,
                                      insert_analysis_setup,
+                                     setup_parameters,
                                      get_setups,
                                      get_sweeps)
 
@@ -60,9 +85,19 @@ from hycohanz.fieldscalculator import (enter_vol,
                                        calc_op,
                                        clc_eval,
                                        enter_qty,
-                                       get_top_entry_value)
+                                       get_top_entry_value,
+                                       enter_surf,
+                                       enter_line,
+                                       enter_scalar,
+                                       calc_stack,
+                                       add_named_expression,
+                                       delete_named_expression,
+                                       copy_named_expr_to_stack,
+                                       evaluate_grid)
+from hycohanz.calculator import CalculatorProgram
 
 from hycohanz.reporter import  (export_to_file,
+                                export_reports,
                                 get_all_report_names,
                                 create_report,
                                 add_traces,
@@ -85,7 +120,7 @@ class App():
            has the oDesktop.QuitApplication() method that we can use to 
            unwind the dispatch call.
         """
-        print('__enter__()')
+        _logger.debug('__enter__()')
         self.oAnsoftApp, self.oDesktop = setup_interface()
         
         return self
@@ -108,7 +143,7 @@ class App():
         del self.oDesktop
         del self.oAnsoftApp
         
-        print('__exit__()')
+        _logger.debug('__exit__()')
         
 class OpenProject():
     """
@@ -173,7 +208,7 @@ class SetActiveDesign():
     def __enter__(self):
         self.oDesign_orig = self.oProject.GetActiveDesign()
         
-        print(self.oDesign_orig)
+        _logger.debug('%s', self.oDesign_orig)
         
         if self.oDesign_orig is not None:
             self.designname_orig = self.oDesign_orig.GetName()
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Measure where the time goes in hycohanz scripts.
+
+enable() replaces the public functions of the COM-facing hycohanz modules,
+and the public methods of their classes, with wrappers that record every
+call: its duration, and the size of its arguments once marshalled.  The
+statistics are available as a text summary, and the individual calls as a
+Chrome trace (chrome://tracing or https://ui.perfetto.dev), in which nested
+calls show how much of a modeler function is spent building arrays in
+utils and how much in the COM call itself.
+
+disable() puts the original functions back, so that instrumentation costs
+nothing when it's not enabled.
+
+Example Usage
+-------------
+>>> from hycohanz import instrument
+>>> instrument.enable()
+>>> build_model(oEditor)
+>>> print(instrument.summary())
+>>> instrument.write_trace('build_model.json')
+>>> instrument.disable()
+
+Only calls made through module attributes are seen, e.g.
+hfss.create_box(...) or modeler3d.create_box(...).  Functions imported with
+"from hycohanz.modeler3d import create_box" before enable() was called keep
+pointing to the original function.
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+from hycohanz.backend import encode
+
+# Modules whose functions and class methods are instrumented by default.
+DEFAULT_MODULES = ('hycohanz.modeler3d',
+                   'hycohanz.boundarysetup',
+                   'hycohanz.reporter',
+                   'hycohanz.fieldscalculator',
+                   'hycohanz.analysis_setup',
+                   'hycohanz.utils')
+
+# Maximum number of calls kept for the trace.  Statistics are kept for all
+# calls.
+MAX_EVENTS = 1000000
+
+_clock = time.perf_counter
+
+# Installed wrappers, as (namespace, attribute name, original) tuples.
+_patches = []
+_stats = {}
+_events = []
+_start = None
+_lock = threading.Lock()
+
+
+class CallStats(object):
+    """
+    Statistics of the calls to one function.
+
+    Attributes
+    ----------
+    count : int
+        Number of calls.
+    total : float
+        Total duration, in seconds.
+    shortest, longest : float
+        Shortest and longest durations, in seconds.
+    histogram : list of int
+        histogram[k] counts the calls that took between 2**(k-1) and 2**k
+        microseconds (histogram[0] counts calls under 1 us).
+    payload : int
+        Total size of the marshalled arguments, in bytes.
+    """
+    __slots__ = ('count', 'total', 'shortest', 'longest', 'histogram', 'payload')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.shortest = float('inf')
+        self.longest = 0.0
+        self.histogram = []
+        self.payload = 0
+
+    def add(self, duration, payload):
+        self.count += 1
+        self.total += duration
+        self.shortest = min(self.shortest, duration)
+        self.longest = max(self.longest, duration)
+        bucket = int(duration * 1e6).bit_length()
+        if bucket >= len(self.histogram):
+            self.histogram.extend([0] * (bucket + 1 - len(self.histogram)))
+        self.histogram[bucket] += 1
+        self.payload += payload
+
+    def percentile(self, fraction):
+        """
+        Return an upper bound of the given percentile of the durations, in
+        seconds, from the histogram.
+        """
+        target = fraction * self.count
+        seen = 0
+        for bucket, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** bucket * 1e-6, self.longest)
+        return self.longest
+
+
+def _payload_size(args, kwargs):
+    """
+    Size of the marshalled arguments, leaving out the COM object that is
+    the first argument of every hycohanz function.
+    """
+    return len(encode((list(args[1:]), sorted(kwargs.items()))))
+
+
+def _record(name, category, start, end, args, kwargs):
+    payload = _payload_size(args, kwargs)
+    with _lock:
+        try:
+            stats = _stats[name]
+        except KeyError:
+            stats = _stats[name] = CallStats()
+        stats.add(end - start, payload)
+        if len(_events) < MAX_EVENTS:
+            _events.append((name, category, start, end, threading.current_thread().ident, payload))
+
+
+def _wrap(name, category, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = _clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(name, category, start, _clock(), args, kwargs)
+
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def _targets(module):
+    """
+    Yield (namespace, attribute name, qualified name) for the public
+    functions defined in module and the public methods of its classes.
+    """
+    short = module.__name__.rsplit('.', 1)[-1]
+    for attr, value in sorted(vars(module).items()):
+        if attr.startswith('_') or getattr(value, '__module__', None) != module.__name__:
+            continue
+        if isinstance(value, types.FunctionType):
+            yield module, attr, '{0}.{1}'.format(short, attr)
+        elif isinstance(value, type):
+            for method, function in sorted(vars(value).items()):
+                if not method.startswith('_') and isinstance(function, types.FunctionType):
+                    yield value, method, '{0}.{1}.{2}'.format(short, attr, method)
+
+
+def is_enabled():
+    """Whether instrumentation is enabled."""
+    return bool(_patches)
+
+
+def enable(modules=DEFAULT_MODULES):
+    """
+    Start instrumenting the functions of the given modules.
+
+    The wrappers are also installed wherever the hycohanz package re-exports
+    the functions, e.g. as hycohanz.create_box.
+
+    Parameters
+    ----------
+    modules : list of str
+        Names of the modules to instrument.
+    """
+    global _start
+
+    if is_enabled():
+        disable()
+    if _start is None:
+        _start = _clock()
+
+    wrappers = {}
+    for modulename in modules:
+        module = importlib.import_module(modulename)
+        category = module.__name__.rsplit('.', 1)[-1]
+        for namespace, attr, name in _targets(module):
+            original = vars(namespace)[attr]
+            wrapper = _wrap(name, category, original)
+            wrappers[id(original)] = wrapper
+            setattr(namespace, attr, wrapper)
+            _patches.append((namespace, attr, original))
+
+    # Re-exports, e.g. "from hycohanz.modeler3d import *" in hycohanz.hycohanz.
+    for modulename, module in list(sys.modules.items()):
+        if module is None or not (modulename == 'hycohanz' or modulename.startswith('hycohanz.')):
+            continue
+        for attr, value in list(vars(module).items()):
+            wrapper = wrappers.get(id(value))
+            if wrapper is not None and getattr(wrapper, '__wrapped__', None) is value:
+                setattr(module, attr, wrapper)
+                _patches.append((module, attr, value))
+
+
+def disable():
+    """Restore the original functions.  The statistics are kept."""
+    while _patches:
+        namespace, attr, original = _patches.pop()
+        setattr(namespace, attr, original)
+
+
+def reset():
+    """Forget all statistics and trace events."""
+    global _start
+
+    with _lock:
+        _stats.clear()
+        del _events[:]
+        _start = _clock() if is_enabled() else None
+
+
+def stats():
+    """
+    Return a dict of CallStats keyed by qualified function name, e.g.
+    "modeler3d.create_box".
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def summary(sort='total'):
+    """
+    Return a text table of the call statistics.
+
+    Parameters
+    ----------
+    sort : str
+        Attribute of CallStats to sort by, largest first.
+    """
+    rows = sorted(stats().items(), key=lambda item: getattr(item[1], sort), reverse=True)
+    width = max([len(name) for name, s in rows] + [8])
+    lines = ['{0:<{w}}  {1:>8}  {2:>10}  {3:>9}  {4:>9}  {5:>9}  {6:>9}'.format(
+             'function', 'calls', 'total ms', 'mean us', 'p90 us', 'max us', 'bytes', w=width)]
+    for name, s in rows:
+        lines.append('{0:<{w}}  {1:>8d}  {2:>10.2f}  {3:>9.1f}  {4:>9.1f}  {5:>9.1f}  {6:>9.0f}'.format(
+                     name, s.count, 1e3 * s.total, 1e6 * s.total / s.count, 1e6 * s.percentile(0.9),
+                     1e6 * s.longest, s.payload / s.count, w=width))
+    return '\n'.join(lines)
+
+
+def write_trace(filename):
+    """
+    Write the recorded calls as a Chrome trace event file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the JSON file to write.
+    """
+    with _lock:
+        events = list(_events)
+        start = _start or 0.0
+
+    pid = os.getpid()
+    trace = [{'name': name,
+              'cat': category,
+              'ph': 'X',
+              'ts': 1e6 * (begin - start),
+              'dur': 1e6 * (end - begin),
+              'pid': pid,
+              'tid': tid,
+              'args': {'bytes': payload}}
+             for name, category, begin, end, tid, payload in events]
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import timeit
+
+    from hycohanz import modeler3d
+    from hycohanz.standin import RecordingEditor
+
+    def build(oEditor, N):
+        for n in range(N):
+            name = modeler3d.create_box(oEditor, "{0}mm".format(2 * n), 0, 0, "1mm", "1mm", "1mm",
+                                        Name="Element{0}".format(n))
+            modeler3d.create_cylinder(oEditor, "{0}mm".format(2 * n), 0, "1mm", "0.2mm", "1mm",
+                                      Name="Via{0}".format(n))
+            modeler3d.unite(oEditor, [name, "Via{0}".format(n)])
+
+    N = 2000
+    original = modeler3d.create_box
+    disabled = min(timeit.repeat(lambda: build(RecordingEditor(), N), number=1, repeat=3))
+    enable()
+    enabled = min(timeit.repeat(lambda: build(RecordingEditor(), N), number=1, repeat=3))
+    print(summary())
+    filename = os.path.join(tempfile.gettempdir(), 'hycohanz_trace.json')
+    write_trace(filename)
+    disable()
+    restored = min(timeit.repeat(lambda: build(RecordingEditor(), N), number=1, repeat=3))
+    assert modeler3d.create_box is original
+
+    print('\nTrace written to {0}'.format(filename))
+    print('{0} builds:  {1:.1f} ms before enable(), {2:.1f} ms enabled, {3:.1f} ms after disable()'.format(
+          N, 1e3 * disabled, 1e3 * enabled, 1e3 * restored))
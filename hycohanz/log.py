@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Logging for hycohanz.
+
+hycohanz modules log through standard library loggers named after the
+module, e.g. "hycohanz.fieldscalculator", under a "hycohanz" logger that has
+no output of its own until configure() is called.  Messages are given as
+format strings and arguments, so the argument arrays of COM calls are only
+rendered when the message's level is enabled; with logging off, a debug
+message costs about as much as a function call.
+
+Levels can be set for the whole package or per module, and records can be
+handed to a background thread through a queue, so that a slow log file or
+console doesn't hold up the script.
+
+Example Usage
+-------------
+>>> from hycohanz import log
+>>> log.configure('INFO')
+>>> log.set_level('DEBUG', 'fieldscalculator')
+>>> listener = log.configure('DEBUG', filename='run.log', structured=True, queue=True)
+>>> ...
+>>> log.shutdown()
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import json
+import logging
+import logging.handlers
+import sys
+
+try:
+    import queue as _queue
+except ImportError:
+    import Queue as _queue
+
+PACKAGE = 'hycohanz'
+
+DEFAULT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_root = logging.getLogger(PACKAGE)
+_root.addHandler(logging.NullHandler())
+
+# Handlers and queue listener installed by configure().
+_handlers = []
+_listener = None
+
+
+def get_logger(name):
+    """
+    Return the logger of a hycohanz module.
+
+    Parameters
+    ----------
+    name : str
+        The module's __name__, e.g. "hycohanz.modeler3d", or its short name.
+    """
+    if name == '__main__':
+        name = 'main'
+    if name != PACKAGE and not name.startswith(PACKAGE + '.'):
+        name = '{0}.{1}'.format(PACKAGE, name)
+    return logging.getLogger(name)
+
+
+def set_level(level, module=None):
+    """
+    Set the level of the package logger or of one module's logger.
+
+    Parameters
+    ----------
+    level : str or int
+        A level name, e.g. "DEBUG", or number.
+    module : str
+        A module name, e.g. "modeler3d".  Defaults to the whole package.
+    """
+    logger = _root if module is None else get_logger(module)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Format records as JSON lines, with the message arguments kept as
+    separate fields.
+    """
+    def format(self, record):
+        entry = {'time': record.created,
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            entry['args'] = [arg if isinstance(arg, (int, float, str)) else repr(arg) for arg in args]
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure(level='INFO', stream=None, filename=None, fmt=DEFAULT_FORMAT, structured=False,
+              queue=False):
+    """
+    Send hycohanz log records to a stream or file.
+
+    Calling configure() again replaces the previous configuration.
+
+    Parameters
+    ----------
+    level : str or int
+        Level of the package logger.
+    stream : file
+        Stream to write to.  Defaults to sys.stderr unless filename is given.
+    filename : str
+        File to append to.
+    fmt : str
+        logging format string, for unstructured output.
+    structured : bool
+        Write JSON lines instead of text.
+    queue : bool
+        Format and write the records in a background thread.
+
+    Returns
+    -------
+    listener : logging.handlers.QueueListener or None
+        The background thread's listener, if queue is True.
+    """
+    global _listener
+
+    shutdown()
+    if filename is not None:
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter() if structured else logging.Formatter(fmt))
+
+    if queue:
+        records = _queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        _handlers.append(handler)
+        handler = logging.handlers.QueueHandler(records)
+
+    _root.addHandler(handler)
+    _handlers.append(handler)
+    set_level(level)
+    return _listener
+
+
+def shutdown():
+    """
+    Remove the handlers installed by configure(), after the background
+    thread, if any, has written out the queued records.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    while _handlers:
+        handler = _handlers.pop()
+        _root.removeHandler(handler)
+        handler.close()
+
+
+if __name__ == "__main__":
+    import io
+    import os
+    import timeit
+    import contextlib
+
+    from hycohanz.fieldscalculator import get_top_entry_value
+    from hycohanz.standin import RecordingEditor
+
+    oModule = RecordingEditor({'GetTopEntryValue': ['1.5']})
+    variables = dict(('var{0}'.format(n), '{0}mm'.format(n)) for n in range(10))
+    logger = get_logger('fieldscalculator')
+    variablesarray = ["Freq:=", "1e9Hz", "Phase:=", "0deg"] * 6
+
+    def printed():
+        print('variablesarray: ' + str(variablesarray))
+
+    N = 100000
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        t_print = timeit.timeit(printed, number=N) / N
+    t_disabled = timeit.timeit(lambda: logger.debug('variablesarray: %s', variablesarray), number=N) / N
+    t_call = timeit.timeit(lambda: get_top_entry_value(oModule, 'Setup1', 'LastAdaptive', 1e9, 0, variables),
+                           number=N) / N
+
+    configure('DEBUG', stream=io.StringIO(), queue=True)
+    t_queued = timeit.timeit(lambda: logger.debug('variablesarray: %s', variablesarray), number=N) / N
+    shutdown()
+
+    print('print() of an argument array to /dev/null:  {0:.2f} us'.format(1e6 * t_print))
+    print('logger.debug(), disabled:                   {0:.2f} us'.format(1e6 * t_disabled))
+    print('logger.debug(), enabled, queued:            {0:.2f} us'.format(1e6 * t_queued))
+    print('get_top_entry_value() on a stand-in, logging disabled:  {0:.2f} us'.format(1e6 * t_call))
@@ -4,24 +4,54 @@ HFSS functions that use the 3D modeler. Functions in this module correspond
 more or less to the functions described in the HFSS Scripting Guide, 
 Section "3D Modeler Editor Script Commands".
 
-At last count there were 31 functions implemented out of 93.
+At last count there were 47 functions implemented out of 93.
 """
 
 from __future__ import division, print_function, unicode_literals, absolute_import
 
+import sys
 import warnings
 
 from hycohanz.expression import Expression as Ex
+from hycohanz.log import get_logger
 from . import utils
 
 warnings.simplefilter('default')
 
+_logger = get_logger(__name__)
+
 DEFAULT_ATTRIBUTES = {
     'partCoordinateSystem':     'Global',
     'materialName':             'vacuum',
     'solveInside':              'True',
 }
 
+# Number format of the coordinates emitted by create_polyline_points(): the
+# shortest text that reads back as the same float, as str() gives in
+# create_polyline().
+COORDINATE_FORMAT = '%r'
+
+# Argument layouts of the functions built on utils.ArgumentSchema, compiled
+# once at import time.
+_RELATIVE_CS_SCHEMA = utils.ArgumentSchema('RelativeCSParameters', 'CreateRelativeCS',
+                                           ('originX', 'originY', 'originZ',
+                                            'xAxisXvec', 'xAxisYvec', 'xAxisZvec',
+                                            'yAxisXvec', 'yAxisYvec', 'yAxisZvec'),
+                                           DEFAULT_ATTRIBUTES)
+
+_WORKING_CS_SCHEMA = utils.ArgumentSchema('SetWCS Parameter', 'SetWCS',
+                                          ('working_coordinate_system',))
+
+_RECTANGLE_SCHEMA = utils.ArgumentSchema('RectangleParameters', 'CreateRectangle',
+                                         ('xStart', 'yStart', 'zStart',
+                                          'width', 'height', 'whichAxis'),
+                                         DEFAULT_ATTRIBUTES)
+
+_CYLINDER_SCHEMA = utils.ArgumentSchema('CylinderParameters', 'CreateCylinder',
+                                        ('xCenter', 'yCenter', 'zCenter',
+                                         'radius', 'height', 'whichAxis', 'numSides'),
+                                        DEFAULT_ATTRIBUTES)
+
 def get_matched_object_name(oEditor, name_filter="*"):
     """
     Returns a list of objects that match the input filter.
@@ -87,23 +117,13 @@ def create_relative_cs(comObj, originX, originY, originZ, xAxisXvec, xAxisYvec,
     :param attributes:
     :return:
     """
-    parameters = locals()
-    parameters_name = 'RelativeCSParameters'
-    function_name = 'CreateRelativeCS'
+    values = (originX, originY, originZ, xAxisXvec, xAxisYvec, xAxisZvec, yAxisXvec, yAxisYvec, yAxisZvec)
 
-    for k,v in DEFAULT_ATTRIBUTES.items():
-        if k not in attributes:
-            attributes[k] = v
-
-    return utils.hfss_com_wrapper(comObj, parameters, attributes, parameters_name, function_name)
+    return _RELATIVE_CS_SCHEMA.call(comObj, values, attributes)
 
     
 def set_working_cs(comObj, working_coordinate_system):
-    parameters = locals()
-    parameters_name = 'SetWCS Parameter'
-    function_name = 'SetWCS'
-
-    return utils.hfss_com_wrapper(comObj, parameters, None, parameters_name, function_name)
+    return _WORKING_CS_SCHEMA.call(comObj, (working_coordinate_system,))
 
 
 def create_rectangle(comObj, xStart, yStart, zStart, width, height, whichAxis='z', **attributes):
@@ -149,28 +169,16 @@ def create_rectangle(comObj, xStart, yStart, zStart, width, height, whichAxis='z
     str
         The actual name of the created object.
     """
-    parameters = locals()
-    parameters_name = 'RectangleParameters'
-    function_name = 'CreateRectangle'
-
-    for k,v in DEFAULT_ATTRIBUTES.items():
-        if k not in attributes:
-            attributes[k] = v
+    values = (xStart, yStart, zStart, width, height, whichAxis)
 
-    return utils.hfss_com_wrapper(comObj, parameters, attributes, parameters_name, function_name)
+    return _RECTANGLE_SCHEMA.call(comObj, values, attributes)
 
 
 def create_cylinder(comObj, xCenter, yCenter, zCenter, radius, height, whichAxis='z', numSides=10, **attributes):
 
-    parameters = locals()
-    parameters_name = 'CylinderParameters'
-    function_name = 'CreateCylinder'
+    values = (xCenter, yCenter, zCenter, radius, height, whichAxis, numSides)
 
-    for k, v in DEFAULT_ATTRIBUTES.items():
-        if k not in attributes:
-            attributes[k] = v
-
-    return utils.hfss_com_wrapper(comObj, parameters, attributes, parameters_name, function_name)
+    return _CYLINDER_SCHEMA.call(comObj, values, attributes)
 
 def create_EQbasedcurve(   oEditor, 
                         xt, 
@@ -541,6 +549,27 @@ def create_polyline(oEditor, x, y, z, Name="Polyline1",
     >>> oEditor = hfss.set_active_editor(oDesign, "3D Modeler")
     >>> tri = hfss.create_polyline(oEditor, [0, 1, 0], [0, 0, 1], [0, 0, 0])
     """
+    if (SegmentType == "Line" and NoOfPoints == 2
+            and _is_numeric_array(x) and _is_numeric_array(y) and _is_numeric_array(z)):
+        numpy = sys.modules['numpy']
+        points = numpy.column_stack((x, y, z))
+        # The first point is always repeated at the end below, while
+        # create_polyline_points() repeats it only for closed polylines.
+        if not IsPolylineClosed:
+            points = numpy.vstack((points, points[:1]))
+        return create_polyline_points(oEditor, points,
+                                      units="meter",
+                                      Name=Name,
+                                      Flags=Flags,
+                                      Color=Color,
+                                      Transparency=Transparency,
+                                      PartCoordinateSystem=PartCoordinateSystem,
+                                      UDMId=UDMId,
+                                      MaterialValue=MaterialValue,
+                                      SolveInside=SolveInside,
+                                      IsPolylineCovered=IsPolylineCovered,
+                                      IsPolylineClosed=IsPolylineClosed)
+
     # Augment the polyline points vector by appending the first element to 
     # the last.  This gives polyline points and N - 1 segments
     xv = list(x) + [list(x)[0]]
@@ -655,6 +684,128 @@ def create_polyline(oEditor, x, y, z, Name="Polyline1",
 
     return polyname
 
+def _is_numeric_array(a):
+    """
+    Whether a is a NumPy array of numbers.  NumPy isn't imported here: if it
+    hasn't been imported yet, a can't be an array.
+    """
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(a, numpy.ndarray) and a.dtype.kind in 'iuf'
+
+def _polyline_segments(Npts, SegmentType):
+    """
+    Return the "NAME:PLSegment" arrays for Npts polyline points.
+
+    "Line" gives Npts - 1 two-point segments, "Arc" gives three-point
+    segments sharing their end points, and "Spline" gives a single segment
+    through all points.
+    """
+    if SegmentType == "Line":
+        return [["NAME:PLSegment", "SegmentType:=", "Line", "StartIndex:=", n, "NoOfPoints:=", 2]
+                for n in range(Npts - 1)]
+    elif SegmentType == "Arc":
+        if Npts < 3 or (Npts - 1) % 2:
+            raise ValueError('Arc segments need an odd number of points (at least 3), got {0}'.format(Npts))
+        return [["NAME:PLSegment", "SegmentType:=", "Arc", "StartIndex:=", n, "NoOfPoints:=", 3]
+                for n in range(0, Npts - 1, 2)]
+    elif SegmentType == "Spline":
+        return [["NAME:PLSegment", "SegmentType:=", "Spline", "StartIndex:=", 0, "NoOfPoints:=", Npts]]
+    else:
+        raise ValueError('SegmentType must be "Line", "Arc" or "Spline", got {0!r}'.format(SegmentType))
+
+def create_polyline_points(oEditor, points, units="meter",
+                           Name="Polyline1",
+                           Flags="",
+                           Color="(132 132 193)",
+                           Transparency=0,
+                           PartCoordinateSystem="Global",
+                           UDMId="",
+                           MaterialValue='"vacuum"',
+                           SolveInside=True,
+                           IsPolylineCovered=True,
+                           IsPolylineClosed=True,
+                           SegmentType="Line",
+                           segments=None):
+    """
+    Draw a polyline from an N x 3 array of vertex coordinates.
+
+    This is the fast path of create_polyline() for large numeric point sets
+    such as meander lines and spline approximations.  All coordinates are
+    formatted in one vectorized pass, without per-point type checks, using
+    COORDINATE_FORMAT, which round-trips every float.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which to perform the operation
+    points : array_like, shape (N, 3)
+        The x, y and z coordinates of the polyline vertices.
+    units : str
+        The length unit of the coordinates, e.g. "meter", "mm" or "mil".
+    IsPolylineClosed : bool
+        Whether the polyline should be considered closed.  If True, the
+        first vertex is repeated at the end.
+    SegmentType : str
+        "Line" for straight segments between consecutive vertices, "Arc" for
+        three-point arcs (needs an odd number of vertices), or "Spline" for
+        a single spline through all vertices.
+    segments : list of (str, int, int), optional
+        Explicit (SegmentType, StartIndex, NoOfPoints) segments, overriding
+        SegmentType.
+
+    See create_polyline() for the remaining parameters.
+
+    Returns
+    -------
+    polyname : str
+        Actual name of the polyline
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('create_polyline_points() requires NumPy')
+
+    points = numpy.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError('points must have shape (N, 3), got {0}'.format(points.shape))
+
+    if IsPolylineClosed:
+        points = numpy.vstack((points, points[:1]))
+
+    # Format all coordinates with a single string-formatting operation,
+    # which is much faster than formatting each float separately.
+    flat = points.ravel().tolist()
+    coords = iter(((COORDINATE_FORMAT + units + '\n') * len(flat) % tuple(flat)).split('\n'))
+
+    polylinepoints = ["NAME:PolylinePoints"]
+    polylinepoints += [[["NAME:PLPoint", "X:=", xpt, "Y:=", ypt, "Z:=", zpt]]
+                       for xpt, ypt, zpt in zip(coords, coords, coords)]
+
+    polylinesegments = ["NAME:PolylineSegments"]
+    if segments is None:
+        polylinesegments += _polyline_segments(len(points), SegmentType)
+    else:
+        polylinesegments += [["NAME:PLSegment", "SegmentType:=", segtype, "StartIndex:=", start, "NoOfPoints:=", npoints]
+                             for segtype, start, npoints in segments]
+
+    polylineparams = ["NAME:PolylineParameters", 
+                      "IsPolylineCovered:=", IsPolylineCovered, 
+                      "IsPolylineClosed:=", IsPolylineClosed, 
+                      polylinepoints, 
+                      polylinesegments]
+
+    polylineattribs = ["NAME:Attributes", 
+                       "Name:=", Name, 
+                       "Flags:=", Flags, 
+                       "Color:=", Color,
+                       "Transparency:=", Transparency, 
+                       "PartCoordinateSystem:=", PartCoordinateSystem, 
+                       "UDMId:=", UDMId, 
+                       "MaterialValue:=", MaterialValue, 
+                       "SolveInside:=",  SolveInside]
+
+    return oEditor.CreatePolyline(polylineparams, polylineattribs)
+
 def get_selections(oEditor):
     """
     Get a list of the currently-selected objects in the design.  
@@ -873,6 +1024,87 @@ def rotate(oEditor, partlist, axis, angle):
                              
     oEditor.Rotate(selectionsarray, rotateparametersarray)
 
+def duplicate_along_line(oEditor, partlist, x, y, z, NumClones, NewPartsModelFlag="Model",
+                         DuplicateAssignments=False):
+    """
+    Duplicate parts along a line.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    partlist : list
+        List of part name strings to be duplicated.
+    x : float
+        x component of the vector between successive clones.
+    y : float
+        y component of the vector between successive clones.
+    z : float
+        z component of the vector between successive clones.
+    NumClones : int
+        Total number of instances, including the originals.
+    DuplicateAssignments : bool
+        Whether boundaries and excitations are duplicated too.
+
+    Returns
+    -------
+    result
+        What HFSS returns; newer versions return the names of the clones.
+    """
+    selectionsarray = ["NAME:Selections",
+                       "Selections:=", ','.join(partlist),
+                       "NewPartsModelFlag:=", NewPartsModelFlag]
+
+    duplicateparametersarray = ["NAME:DuplicateToAlongLineParameters",
+                                "CreateNewObjects:=", True,
+                                "XComponent:=", Ex(x).expr,
+                                "YComponent:=", Ex(y).expr,
+                                "ZComponent:=", Ex(z).expr,
+                                "NumClones:=", str(NumClones)]
+
+    optionsarray = ["NAME:Options", "DuplicateAssignments:=", DuplicateAssignments]
+
+    return oEditor.DuplicateAlongLine(selectionsarray, duplicateparametersarray, optionsarray)
+
+def duplicate_around_axis(oEditor, partlist, axis, angle, NumClones, NewPartsModelFlag="Model",
+                          DuplicateAssignments=False):
+    """
+    Duplicate parts around a coordinate axis.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    partlist : list
+        List of part name strings to be duplicated.
+    axis : str
+        Rotation axis, "X", "Y" or "Z".
+    angle : str
+        Angle between successive clones, e.g. "30deg".
+    NumClones : int
+        Total number of instances, including the originals.
+    DuplicateAssignments : bool
+        Whether boundaries and excitations are duplicated too.
+
+    Returns
+    -------
+    result
+        What HFSS returns; newer versions return the names of the clones.
+    """
+    selectionsarray = ["NAME:Selections",
+                       "Selections:=", ','.join(partlist),
+                       "NewPartsModelFlag:=", NewPartsModelFlag]
+
+    duplicateparametersarray = ["NAME:DuplicateAroundAxisParameters",
+                                "CreateNewObjects:=", True,
+                                "WhichAxis:=", axis,
+                                "AngleStr:=", Ex(angle).expr,
+                                "NumClones:=", str(NumClones)]
+
+    optionsarray = ["NAME:Options", "DuplicateAssignments:=", DuplicateAssignments]
+
+    return oEditor.DuplicateAroundAxis(selectionsarray, duplicateparametersarray, optionsarray)
+
 def subtract(oEditor, blanklist, toollist, KeepOriginals=False):
     """
     Subtract the specified objects.
@@ -1291,8 +1523,8 @@ def uncover_faces(oEditor, partlist, dictoffacelists):
     for part in partlist:
         uncoverparametersarray += [["NAME:UncoverFacesParameters", "FacesToUncover:=", dictoffacelists[part]]]
 
-    print('selectionsarray:  {s}'.format(s=selectionsarray))
-    print('uncoverparametersarray:  {s}'.format(s=uncoverparametersarray))
+    _logger.debug('selectionsarray:  %s', selectionsarray)
+    _logger.debug('uncoverparametersarray:  %s', uncoverparametersarray)
 
     oEditor.UncoverFaces(selectionsarray, uncoverparametersarray)
     
@@ -1370,3 +1602,168 @@ def get_face_ids(oEditor, body_name):
     face_id_list = list(oEditor.GetFaceIDs(body_name))
     return map(int,face_id_list)
 
+def get_edge_ids(oEditor, body_name):
+    """
+    Get the edge id list of a given body name.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    body_name : str
+        Name of the body whose edge id list will be returned
+        
+    Returns
+    -------
+    edge_id_list : list of int
+        list with edge Id numbers of body_name
+    """
+    return [int(edgeid) for edgeid in oEditor.GetEdgeIDsFromObject(body_name)]
+
+def get_vertex_ids(oEditor, body_name):
+    """
+    Get the vertex id list of a given body name.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    body_name : str
+        Name of the body whose vertex id list will be returned
+
+    Returns
+    -------
+    vertex_id_list : list of int
+        list with vertex Id numbers of body_name
+    """
+    return [int(vertexid) for vertexid in oEditor.GetVertexIDsFromObject(body_name)]
+
+def get_vertex_ids_from_face(oEditor, faceid):
+    """
+    Get the ids of the vertices of a given face.  Faces bounded only by 
+    closed curves, such as the faces of a cylinder, have no vertices.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    faceid : int
+        Id number of the face
+        
+    Returns
+    -------
+    vertex_id_list : list of int
+        list with the vertex Id numbers of the face
+    """
+    return [int(vertexid) for vertexid in oEditor.GetVertexIDsFromFace(faceid)]
+
+def get_edge_ids_from_face(oEditor, faceid):
+    """
+    Get the ids of the edges of a given face.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    faceid : int
+        Id number of the face
+        
+    Returns
+    -------
+    edge_id_list : list of int
+        list with the edge Id numbers of the face
+    """
+    return [int(edgeid) for edgeid in oEditor.GetEdgeIDsFromFace(faceid)]
+
+def get_face_area(oEditor, faceid):
+    """
+    Get the area of a given face.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    faceid : int
+        Id number of the face
+        
+    Returns
+    -------
+    area : float
+        The area of the face, in square model units
+    """
+    return float(oEditor.GetFaceArea(faceid))
+
+def get_vertex_ids_from_edge(oEditor, edgeid):
+    """
+    Get the ids of the vertices of a given edge.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    edgeid : int
+        Id number of the edge
+        
+    Returns
+    -------
+    vertex_id_list : list of int
+        list with the vertex Id numbers of the edge
+    """
+    return [int(vertexid) for vertexid in oEditor.GetVertexIDsFromEdge(edgeid)]
+
+def get_vertex_position(oEditor, vertexid):
+    """
+    Get the position of a given vertex.
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    vertexid : int
+        Id number of the vertex
+        
+    Returns
+    -------
+    position : list of float
+        [x, y, z] position of the vertex, in model units
+    """
+    return [float(coordinate) for coordinate in oEditor.GetVertexPosition(vertexid)]
+
+def get_model_units(oEditor):
+    """
+    Get the model length units, e.g. "mm".
+    
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+        
+    Returns
+    -------
+    units : str
+        The model units
+    """
+    return oEditor.GetModelUnits()
+
+
+if __name__ == "__main__":
+    import timeit
+
+    import numpy
+
+    from hycohanz.standin import RecordingEditor
+
+    N = 100000
+    t = numpy.linspace(0, 100 * numpy.pi, N)
+    points = numpy.column_stack((1e-3 * numpy.cos(t), 1e-3 * numpy.sin(t), 1e-5 * t))
+    x, y, z = (list(col) for col in points.T)
+
+    oEditor = RecordingEditor()
+    before = min(timeit.repeat(lambda: create_polyline(oEditor, x, y, z), number=1, repeat=3))
+    after = min(timeit.repeat(lambda: create_polyline_points(oEditor, points), number=1, repeat=3))
+    spline = min(timeit.repeat(lambda: create_polyline_points(oEditor, points, SegmentType="Spline"),
+                               number=1, repeat=3))
+    print('{0}-point polyline:'.format(N))
+    print('  create_polyline(), lists:          {0:.3f} s'.format(before))
+    print('  create_polyline_points(), lines:   {0:.3f} s'.format(after))
+    print('  create_polyline_points(), spline:  {0:.3f} s'.format(spline))
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Arrays of parts built with HFSS's duplicate operations.
+
+Building an N-element array with copy(), paste() and move() costs three COM
+calls per element.  The functions in this module duplicate a seed part with
+modeler3d.duplicate_along_line() and duplicate_around_axis() instead:
+
+- linear() and circular() take a single call for the whole array;
+- rectangular() takes one call for the first column and one per row;
+- offsets() places clones at arbitrary offsets.  Offsets that are the
+  multiples 1, 2, 3, ... of a common step are placed with one call; any
+  other offset, or one that uses design variables, takes a call of its own.
+
+Each function returns the part names in grid order, the seed first.  Newer
+HFSS versions return the names of the clones from the duplicate call.  The
+parts are listed once per function call, before its first duplicate, so
+that with older versions the new names can be found by listing the parts
+again after each duplicate, one more call each, and ordering the new names
+by their numeric suffixes, which HFSS assigns in clone order.  Functions
+that have nothing to duplicate make no calls at all.
+
+Example Usage
+-------------
+>>> from hycohanz import pattern
+>>> patch = hfss.create_box(oEditor, 0, 0, 0, '3mm', '3mm', '0.035mm', Name='Patch')
+>>> rows = pattern.rectangular(oEditor, patch, 64, 64, ('5mm', 0, 0), (0, '5mm', 0))
+>>> rows[0][:3]
+['Patch', 'Patch_1', 'Patch_2']
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import re
+
+from hycohanz.evaluator import evaluate
+from hycohanz.expression import Expression
+from hycohanz.modeler3d import (duplicate_along_line,
+                                duplicate_around_axis,
+                                get_matched_object_name)
+
+# Number of significant digits to which an offset must be a multiple of a
+# step.
+SIGNIFICANT_DIGITS = 9
+
+# A number immediately followed by a unit, e.g. "0.5mm".
+_QUANTITY = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[A-Za-z]')
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def _components(vector):
+    """
+    Return the (value, with units) of each component of an offset, where
+    values with units are in meters and others in model units, or None if a
+    component can't be evaluated without the design variables.
+    """
+    components = []
+    for value in vector:
+        if isinstance(value, (int, float)):
+            components.append((float(value), False))
+            continue
+        text = Expression(value).expr
+        try:
+            components.append((float(evaluate(text)), bool(_QUANTITY.search(text))))
+        except (KeyError, ValueError):
+            return None
+    return tuple(components)
+
+
+def _key(components, k=1):
+    """
+    A hashable key of k times an offset given by _components(), equal for
+    offsets that agree to SIGNIFICANT_DIGITS digits.
+    """
+    return tuple((float('{0:.{1}g}'.format(k * value, SIGNIFICANT_DIGITS)) + 0.0, units and value != 0)
+                 for value, units in components)
+
+
+def _chains(vectors):
+    """
+    Group offsets into chains [i1, i2, ..., im] of indices of vectors such
+    that vectors[ik] is k times vectors[i1], shortest steps first.  Offsets
+    that can't be evaluated, or are zero, form chains of their own.
+    """
+    components = [_components(vector) for vector in vectors]
+    norms = dict((i, sum(value * value for value, units in c)) for i, c in enumerate(components)
+                 if c is not None and any(value != 0 for value, units in c))
+    chains = [[i] for i in range(len(vectors)) if i not in norms]
+
+    unused = {}
+    for i in sorted(norms, reverse=True):
+        unused.setdefault(_key(components[i]), []).append(i)
+    for first in sorted(norms, key=lambda i: (norms[i], i)):
+        indices = unused.get(_key(components[first]))
+        if not indices or first not in indices:
+            continue
+        indices.remove(first)
+        chain = [first]
+        while unused.get(_key(components[first], len(chain) + 1)):
+            chain.append(unused[_key(components[first], len(chain) + 1)].pop())
+        chains.append(chain)
+    return chains
+
+
+class _Names(object):
+    """Finds the names of the clones made by duplicate calls on a seed part."""
+    def __init__(self, oEditor, seed):
+        self.oEditor = oEditor
+        self.pattern = seed + '*'
+        self.known = None
+
+    def _listed(self):
+        return get_matched_object_name(self.oEditor, self.pattern)
+
+    def before(self):
+        """Called before each duplicate call; lists the parts the first time."""
+        if self.known is None:
+            self.known = set(self._listed())
+
+    def clones(self, result, count):
+        """The names of the count clones made by a duplicate call."""
+        if isinstance(result, (list, tuple)) and len(result) == count:
+            names = [str(name) for name in result]
+        else:
+            listed = self._listed()
+            names = sorted((name for name in listed if name not in self.known), key=_natural_key)
+            if len(names) != count:
+                raise RuntimeError('Expected {0} new parts named {1}, found {2}'.format(
+                                   count, self.pattern, len(names)))
+        self.known.update(names)
+        return names
+
+
+def linear(oEditor, part, count, x, y, z):
+    """
+    Duplicate a part into a row of count parts.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    part : str
+        Name of the seed part.
+    count : int
+        Number of parts in the row, including the seed.
+    x, y, z : float or str
+        Vector between neighbouring parts.
+
+    Returns
+    -------
+    names : list of str
+        The part names, seed first.
+    """
+    if count < 2:
+        return [part]
+    names = _Names(oEditor, part)
+    names.before()
+    result = duplicate_along_line(oEditor, [part], x, y, z, count)
+    return [part] + names.clones(result, count - 1)
+
+
+def rectangular(oEditor, part, nx, ny, xstep, ystep):
+    """
+    Duplicate a part into an ny x nx grid.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    part : str
+        Name of the seed part, which becomes element [0][0].
+    nx, ny : int
+        Number of columns and rows.
+    xstep, ystep : tuple
+        (x, y, z) vectors between neighbouring columns and rows.
+
+    Returns
+    -------
+    rows : list of list of str
+        rows[j][i] is the name of the part in row j and column i.
+    """
+    names = _Names(oEditor, part)
+    column = [part]
+    if ny > 1:
+        names.before()
+        result = duplicate_along_line(oEditor, [part], ystep[0], ystep[1], ystep[2], ny)
+        column += names.clones(result, ny - 1)
+    rows = []
+    for first in column:
+        row = [first]
+        if nx > 1:
+            names.before()
+            result = duplicate_along_line(oEditor, [first], xstep[0], xstep[1], xstep[2], nx)
+            row += names.clones(result, nx - 1)
+        rows.append(row)
+    return rows
+
+
+def circular(oEditor, part, count, angle, axis='Z'):
+    """
+    Duplicate a part around a coordinate axis.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    part : str
+        Name of the seed part.
+    count : int
+        Number of parts, including the seed.
+    angle : str
+        Angle between neighbouring parts, e.g. "30deg".
+    axis : str
+        "X", "Y" or "Z".
+
+    Returns
+    -------
+    names : list of str
+        The part names, seed first, in the direction of rotation.
+    """
+    if count < 2:
+        return [part]
+    names = _Names(oEditor, part)
+    names.before()
+    result = duplicate_around_axis(oEditor, [part], axis, angle, count)
+    return [part] + names.clones(result, count - 1)
+
+
+def offsets(oEditor, part, vectors):
+    """
+    Place clones of a part at arbitrary offsets from it.
+
+    Offsets that are the multiples 1, 2, ..., m of a common step, in any
+    order, are placed with a single duplicate along that step.  Other
+    offsets take one call each.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the operation will be performed.
+    part : str
+        Name of the seed part.
+    vectors : list of tuple
+        (x, y, z) offset of each clone from the seed.
+
+    Returns
+    -------
+    names : list of str
+        The seed's name followed by the clones' names, in the order of
+        vectors.
+    """
+    vectors = list(vectors)
+    names = _Names(oEditor, part)
+    clones = [None] * len(vectors)
+    for chain in _chains(vectors):
+        x, y, z = vectors[chain[0]]
+        names.before()
+        result = duplicate_along_line(oEditor, [part], x, y, z, len(chain) + 1)
+        for i, name in zip(chain, names.clones(result, len(chain))):
+            clones[i] = name
+    return [part] + clones
+
+
+class _ArrayEditor(object):
+    """A stand-in editor that names clones like HFSS does."""
+    def __init__(self, return_names):
+        from hycohanz.standin import RecordingEditor
+
+        self.return_names = return_names
+        self.parts = []
+        self.counter = {}
+        self.oEditor = RecordingEditor({'CreateBox': self.create,
+                                        'DuplicateAlongLine': self.duplicate,
+                                        'DuplicateAroundAxis': self.duplicate,
+                                        'Paste': lambda: self.clone(self.copied, 1),
+                                        'Copy': self.copy,
+                                        'GetMatchedObjectName': self.matched})
+
+    def create(self, parameters, attributes):
+        name = attributes[attributes.index('Name:=') + 1]
+        self.parts.append(name)
+        return name
+
+    def clone(self, part, count):
+        clones = []
+        for n in range(count):
+            self.counter[part] = self.counter.get(part, 0) + 1
+            clones.append('{0}_{1}'.format(part, self.counter[part]))
+        self.parts.extend(clones)
+        return clones
+
+    def duplicate(self, selections, parameters, options):
+        count = int(parameters[parameters.index('NumClones:=') + 1]) - 1
+        clones = self.clone(selections[2], count)
+        return clones if self.return_names else None
+
+    def copy(self, selections):
+        self.copied = selections[2]
+
+    def matched(self, pattern):
+        return [part for part in self.parts if part.startswith(pattern.rstrip('*'))]
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from hycohanz.modeler3d import copy, create_box, move, paste
+
+    N = 64
+
+    def loop(oEditor):
+        names = []
+        for j in range(N):
+            for i in range(N):
+                copy(oEditor, ['Patch'])
+                names.append(paste(oEditor)[0])
+                move(oEditor, names[-1:], '{0}mm'.format(5 * i), '{0}mm'.format(5 * j), 0)
+        return names
+
+    editors = []
+    for build in (loop,
+                  lambda oEditor: rectangular(oEditor, 'Patch', N, N, ('5mm', 0, 0), (0, '5mm', 0))):
+        for return_names in (True, False):
+            array = _ArrayEditor(return_names)
+            create_box(array.oEditor, 0, 0, 0, '3mm', '3mm', '0.035mm', Name='Patch')
+            array.oEditor.reset()
+            t = timeit.timeit(lambda: build(array.oEditor), number=1)
+            editors.append((array.oEditor.round_trips, t))
+
+    print('{0}x{0} array:'.format(N))
+    print('  copy/paste/move loop:                    {0:6d} COM calls, {1:.3f} s'.format(*editors[0]))
+    print('  rectangular(), clone names returned:     {0:6d} COM calls, {1:.3f} s'.format(*editors[2]))
+    print('  rectangular(), clone names listed:       {0:6d} COM calls, {1:.3f} s'.format(*editors[3]))
+
+    # The same grid given as offsets: each offset (i, j) with i and j
+    # coprime starts a chain through its multiples.
+    vectors = [('{0}mm'.format(5 * i), '{0}mm'.format(5 * j), 0) for j in range(N) for i in range(N) if i or j]
+    array = _ArrayEditor(True)
+    create_box(array.oEditor, 0, 0, 0, '3mm', '3mm', '0.035mm', Name='Patch')
+    array.oEditor.reset()
+    t = timeit.timeit(lambda: offsets(array.oEditor, 'Patch', vectors), number=1)
+    print('  offsets(), clone names returned:         {0:6d} COM calls, {1:.3f} s'.format(
+          array.oEditor.round_trips, t))
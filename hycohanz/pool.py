@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Run design variations on a pool of HFSS processes.
+
+A WorkerPool starts N Python worker processes.  Each one opens its own
+session on a backend, e.g. an HFSS desktop with its own copy of the
+project, and evaluates design variations: a variation is a dict of
+variable values that the session applies with property.set_variable()
+before calling design.solve() and collecting the results.
+
+Variations are handed out one at a time to whichever worker is idle, so
+fast workers take over the work that slow ones haven't started yet.  If a
+worker process dies, or a variation raises an exception, the variation is
+retried, on a fresh worker process in the case of a crash.
+
+Backends are objects with an open() method that is called in the worker
+process and returns a session with evaluate(variables) and close()
+methods.  Backends must be picklable.  HFSSBackend drives real HFSS
+desktops; StandinBackend uses standin.FakeSolver, so that pools can be
+exercised without HFSS.
+
+Example Usage
+-------------
+>>> import hycohanz as hfss
+>>> backend = hfss.HFSSBackend(r"C:\\work\\patch.hfss", "HFSSDesign1", "Setup1",
+...                            collect=export_s_parameters)
+>>> with hfss.WorkerPool(backend, processes=4) as pool:
+...     results = pool.map([{'w': '{0}mm'.format(w)} for w in range(1, 41)])
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import collections
+import multiprocessing.connection
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+from hycohanz.design import solve
+from hycohanz.property import set_variable
+
+VariationResult = collections.namedtuple('VariationResult',
+                                         ['index', 'variables', 'result', 'error', 'attempts'])
+VariationResult.__doc__ = """
+The outcome of one variation run by a WorkerPool.
+
+index is the position of the variation in the list given to run(), result
+the value returned by the backend session, or None if the variation failed
+on every attempt, in which case error is the formatted traceback of the last
+failure.  attempts counts how many times the variation was started.
+"""
+
+
+class PoolError(RuntimeError):
+    """One or more variations failed on every attempt."""
+
+
+def _apply_and_solve(oProject, oDesign, setups, variables):
+    """Apply a variation to a design and solve it."""
+    for name, value in sorted(variables.items()):
+        set_variable(oProject, name, value)
+    return solve(oDesign, setups)
+
+
+class HFSSBackend(object):
+    """
+    Run variations on HFSS desktops, one per worker process.
+
+    Each worker starts its own HFSS process and opens a private copy of the
+    project, so that the workers don't fight over the project lock.
+
+    Parameters
+    ----------
+    projectfile : str
+        Path of the HFSS project.
+    designname : str
+        Name of the design to solve.
+    setup_name_list : str or list
+        The setups to solve, as given to design.solve().
+    collect : callable
+        Called in the worker process as collect(oProject, oDesign) after each
+        solve.  Its return value, which must be picklable, is the result of
+        the variation.  It must be a module-level function.
+    progid : str
+        The COM ProgID of the HFSS version to start.
+    """
+    def __init__(self, projectfile, designname, setup_name_list, collect=None,
+                 progid='AnsoftHfss.HfssScriptInterface'):
+        self.projectfile = os.path.abspath(projectfile)
+        self.designname = designname
+        self.setup_name_list = setup_name_list
+        self.collect = collect
+        self.progid = progid
+
+    def open(self):
+        return _HFSSSession(self)
+
+
+class _HFSSSession(object):
+    def __init__(self, backend):
+        import pythoncom
+        import win32com.client
+
+        from hycohanz.desktop import open_project
+        from hycohanz.project import set_active_design
+
+        self.backend = backend
+        pythoncom.CoInitialize()
+        # DispatchEx starts a new HFSS process instead of attaching to a
+        # running one.
+        self.oAnsoftApp = win32com.client.DispatchEx(backend.progid)
+        self.oDesktop = self.oAnsoftApp.GetAppDesktop()
+
+        self.workdir = tempfile.mkdtemp(prefix='hycohanz-worker-')
+        projectfile = os.path.join(self.workdir, os.path.basename(backend.projectfile))
+        shutil.copy(backend.projectfile, projectfile)
+        self.oProject = open_project(self.oDesktop, projectfile)
+        self.oDesign = set_active_design(self.oProject, backend.designname)
+
+    def evaluate(self, variables):
+        _apply_and_solve(self.oProject, self.oDesign, self.backend.setup_name_list, variables)
+        if self.backend.collect is None:
+            return None
+        return self.backend.collect(self.oProject, self.oDesign)
+
+    def close(self):
+        import pythoncom
+
+        from hycohanz.desktop import quit_application
+
+        try:
+            quit_application(self.oDesktop)
+        finally:
+            pythoncom.CoUninitialize()
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class StandinBackend(object):
+    """
+    Run variations on standin.FakeSolver objects instead of HFSS.
+
+    Parameters
+    ----------
+    duration : float
+        Time each solve takes, in seconds.
+    collect : callable
+        Called in the worker process as collect(variables) after each solve.
+        Its return value is the result of the variation.  By default the
+        result is a dict of the variables and the worker's process id.
+    crash : callable
+        Called in the worker process as crash(variables) before each solve.
+        If it returns True, the worker process exits abruptly, like a
+        crashed HFSS.
+    """
+    def __init__(self, duration=0.0, collect=None, crash=None):
+        self.duration = duration
+        self.collect = collect
+        self.crash = crash
+
+    def open(self):
+        return _StandinSession(self)
+
+
+class _StandinSession(object):
+    def __init__(self, backend):
+        from hycohanz.standin import FakeSolver
+
+        self.backend = backend
+        self.oSolver = FakeSolver(duration=backend.duration,
+                                  returns={'GetActiveDesign': lambda: self.oSolver})
+
+    def evaluate(self, variables):
+        if self.backend.crash is not None and self.backend.crash(variables):
+            os._exit(3)
+        _apply_and_solve(self.oSolver, self.oSolver, "Setup1", variables)
+        if self.backend.collect is not None:
+            return self.backend.collect(variables)
+        return {'variables': dict(variables), 'pid': os.getpid()}
+
+    def close(self):
+        pass
+
+
+def _worker(backend, workerid, inbox, outbox):
+    """
+    Main function of the worker processes: evaluate the variations sent to
+    inbox until None is received, and report to outbox, the worker's end of
+    a pipe.
+    """
+    try:
+        session = backend.open()
+    except Exception:
+        outbox.send(('failed', workerid, None, traceback.format_exc()))
+        return
+
+    try:
+        while True:
+            task = inbox.get()
+            if task is None:
+                break
+            index, variables = task
+            try:
+                result = session.evaluate(variables)
+            except Exception:
+                outbox.send(('error', workerid, index, traceback.format_exc()))
+            else:
+                outbox.send(('done', workerid, index, result))
+    finally:
+        session.close()
+
+
+class WorkerPool(object):
+    """
+    Evaluate design variations in parallel on a pool of worker processes.
+
+    Parameters
+    ----------
+    backend : object
+        The backend whose sessions evaluate the variations.  See the module
+        documentation.
+    processes : int
+        Number of worker processes.
+    retries : int
+        How many times a variation is retried after its worker crashed or it
+        raised an exception.
+    context : multiprocessing context
+        Used to start the worker processes.  Defaults to the 'spawn'
+        context, which is what Windows uses anyway.
+    """
+    def __init__(self, backend, processes=2, retries=2, context=None):
+        self.backend = backend
+        self.processes = processes
+        self.retries = retries
+        self.context = context or multiprocessing.get_context('spawn')
+        # Worker id -> [process, inbox, index of the variation it's running,
+        # outbox].  Each worker reports through its own pipe, so that a
+        # crashing worker can't leave a lock shared with the others held.
+        self.workers = {}
+        self.nextid = 0
+        self.crashes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, traceback):
+        self.close()
+
+    def _spawn(self):
+        workerid = self.nextid
+        self.nextid += 1
+        inbox = self.context.Queue()
+        outbox, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=_worker, args=(self.backend, workerid, inbox, sender),
+                                       name='hycohanz-worker-{0}'.format(workerid))
+        process.daemon = True
+        process.start()
+        sender.close()
+        self.workers[workerid] = [process, inbox, None, outbox]
+
+    def run(self, variations, callback=None):
+        """
+        Evaluate variations and return a VariationResult for each, in order.
+
+        Parameters
+        ----------
+        variations : list of dict
+            Each dict maps variable names to values.
+        callback : callable
+            Called with each VariationResult as soon as it is final.
+
+        Returns
+        -------
+        results : list of VariationResult
+        """
+        variations = [dict(variables) for variables in variations]
+        pending = collections.deque(range(len(variations)))
+        attempts = [0] * len(variations)
+        errors = [None] * len(variations)
+        results = [None] * len(variations)
+        remaining = len(variations)
+
+        def finish(index, result, error):
+            results[index] = VariationResult(index, variations[index], result, error, attempts[index])
+            if callback is not None:
+                callback(results[index])
+
+        def fail(index, error):
+            errors[index] = error
+            if attempts[index] > self.retries:
+                finish(index, None, error)
+                return 1
+            pending.appendleft(index)
+            return 0
+
+        def dispatch(workerid):
+            worker = self.workers[workerid]
+            if pending and worker[2] is None:
+                index = pending.popleft()
+                attempts[index] += 1
+                worker[2] = index
+                worker[1].put((index, variations[index]))
+
+        def handle(message):
+            """Process a worker message; returns the number of variations it finished."""
+            kind, workerid, index, payload = message
+            if kind == 'failed':
+                raise PoolError('Worker failed to open a backend session:\n' + payload)
+            # The worker may have been given up for dead already, and the
+            # variation finished or queued again meanwhile.
+            worker = self.workers.get(workerid)
+            current = worker is not None and worker[2] == index
+            if current:
+                worker[2] = None
+            if results[index] is not None:
+                return 0
+            if kind == 'done':
+                if index in pending:
+                    pending.remove(index)
+                finish(index, payload, None)
+                return 1
+            if current:
+                return fail(index, payload)
+            return 0
+
+        def receive(outbox):
+            """Handle the messages waiting in a worker's outbox."""
+            finished = 0
+            try:
+                while outbox.poll():
+                    finished += handle(outbox.recv())
+            except (EOFError, OSError):
+                # The worker exited; its sentinel is checked below.
+                pass
+            return finished
+
+        while len(self.workers) < self.processes:
+            self._spawn()
+
+        while remaining:
+            for workerid in self.workers:
+                dispatch(workerid)
+
+            outboxes = [worker[3] for worker in self.workers.values()]
+            for outbox in multiprocessing.connection.wait(outboxes, timeout=0.5):
+                remaining -= receive(outbox)
+
+            for workerid, (process, inbox, index, outbox) in list(self.workers.items()):
+                if process.is_alive():
+                    continue
+                # A worker can post its result and exit before the result
+                # is read; read everything it posted before declaring a
+                # crash.
+                remaining -= receive(outbox)
+                index = self.workers.pop(workerid)[2]
+                outbox.close()
+                self.crashes += 1
+                if index is not None and results[index] is None:
+                    remaining -= fail(index, 'Worker process exited with code {0}'.format(process.exitcode))
+                self._spawn()
+
+        return results
+
+    def map(self, variations):
+        """
+        Evaluate variations and return their results, in order.
+
+        Raises
+        ------
+        PoolError
+            If any variation failed on every attempt.
+        """
+        results = self.run(variations)
+        failed = [result for result in results if result.error is not None]
+        if failed:
+            raise PoolError('{0} of {1} variations failed; first failure, variation {2}:\n{3}'.format(
+                            len(failed), len(results), failed[0].index, failed[0].error))
+        return [result.result for result in results]
+
+    def close(self):
+        """Stop the worker processes."""
+        for process, inbox, index, outbox in self.workers.values():
+            inbox.put(None)
+        deadline = time.time() + 10
+        for process, inbox, index, outbox in self.workers.values():
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+            outbox.close()
+        self.workers.clear()
+
+
+class _CrashOnce(object):
+    """Crash the first time a variation with the given width is evaluated."""
+    def __init__(self, directory, width):
+        self.marker = os.path.join(directory, 'crashed')
+        self.width = width
+
+    def __call__(self, variables):
+        if variables['w'] != self.width or os.path.exists(self.marker):
+            return False
+        open(self.marker, 'w').close()
+        return True
+
+
+if __name__ == "__main__":
+    variations = [{'w': '{0}mm'.format(w), '$h': '1.6mm'} for w in range(1, 25)]
+    directory = tempfile.mkdtemp()
+    try:
+        for processes in (1, 4):
+            backend = StandinBackend(duration=0.2, crash=_CrashOnce(directory, '7mm'))
+            if os.path.exists(os.path.join(directory, 'crashed')):
+                os.remove(os.path.join(directory, 'crashed'))
+            with WorkerPool(backend, processes=processes) as pool:
+                t0 = time.time()
+                results = pool.run(variations)
+                t = time.time() - t0
+            pids = set(result.result['pid'] for result in results)
+            print('{0} variations of 0.2 s on {1} worker(s):  {2:.2f} s, {3} processes used, '
+                  '{4} crash(es) retried, all ok: {5}'.format(
+                  len(variations), processes, t, len(pids), pool.crashes,
+                  all(result.error is None for result in results)))
+    finally:
+        shutil.rmtree(directory)
@@ -5,11 +5,132 @@ more or less to the functions described in the HFSS Scripting Guide,
 Section "Property Script Commands".
 
 At last count there were 1 functions implemented out of 7.
+
+add_properties(), set_variables() and change_variables() add and change
+any number of variables in a single ChangeProperty call per project or
+design.  add_properties() and set_variables() remember the values they
+wrote, by project and design name, and skip writes that wouldn't change
+anything; call forget_variables() if the variables are changed other than
+through this module.
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 
 from hycohanz.expression import Expression
 
+# Last known variable values, by project name for project variables and by
+# (project name, design name) for local variables: key -> {name: expression
+# string}.  Names rather than handles are used, as HFSS returns a new handle
+# for the same design on every GetActiveDesign() call.
+_known = {}
+
+def _is_project_variable(name):
+    """Project variables are the ones whose names start with '$'."""
+    return name.startswith('$')
+
+def _forget_names(names):
+    for values in _known.values():
+        for name in names:
+            values.pop(name, None)
+
+def forget_variables(oProject=None, oDesign=None):
+    """
+    Forget the variable values remembered by add_properties() and
+    set_variables(), e.g. after the variables were changed in the HFSS user
+    interface.
+
+    Parameters
+    ----------
+    oProject : pywin32 COMObject
+        The project whose values, and those of its designs, are forgotten.
+        By default all are forgotten.
+    oDesign : pywin32 COMObject
+        If given, only the local variable values of this design of oProject
+        are forgotten.
+
+    Returns
+    -------
+    None
+    """
+    if oProject is None:
+        _known.clear()
+        return
+    projectname = oProject.GetName()
+    if oDesign is not None:
+        _known.pop((projectname, oDesign.GetName()), None)
+        return
+    for key in list(_known):
+        if key == projectname or (isinstance(key, tuple) and key[0] == projectname):
+            del _known[key]
+
+def _change_properties(oObject, tabname, servername, new, changed, known=None):
+    """
+    Add and change variables of a design or project in one ChangeProperty
+    call.  Their values are remembered in known if it is given, and
+    forgotten everywhere otherwise.
+    """
+    propserversarray = ["NAME:PropServers", servername]
+    proptabarray = ["NAME:" + tabname, propserversarray]
+
+    if new:
+        newpropsarray = ["NAME:NewProps"]
+        for name, value in new.items():
+            newpropsarray.append(["NAME:" + name,
+                                  "PropType:=", "VariableProp",
+                                  "UserDef:=", True,
+                                  "Value:=", Expression(value).expr])
+        proptabarray.append(newpropsarray)
+
+    if changed:
+        changedpropsarray = ["NAME:ChangedProps"]
+        for name, value in changed.items():
+            changedpropsarray.append(["NAME:" + name, "Value:=", Expression(value).expr])
+        proptabarray.append(changedpropsarray)
+
+    if len(proptabarray) > 2:
+        names = list(new or {}) + list(changed or {})
+        if known is None:
+            _forget_names(names)
+        oObject.ChangeProperty(["NAME:AllTabs", proptabarray])
+        if known is not None:
+            for values in (new, changed):
+                for name, value in (values or {}).items():
+                    known[name] = Expression(value).expr
+
+def _write_variables(oProject, variables, oDesign, create):
+    """
+    Split variables into project and local ones, leave out those whose
+    remembered value is unchanged, and write each group in one call.
+    """
+    groups = [("ProjectVariableTab", "ProjectVariables", {}),
+              ("LocalVariableTab", "LocalVariables", {})]
+    for name, value in variables.items():
+        groups[0 if _is_project_variable(name) else 1][2][name] = value
+    if not variables:
+        return
+
+    projectname = oProject.GetName()
+    for tabname, servername, values in groups:
+        if not values:
+            continue
+        if tabname == "ProjectVariableTab":
+            oObject = oProject
+            key = projectname
+        else:
+            if oDesign is None:
+                oDesign = oProject.GetActiveDesign()
+            oObject = oDesign
+            key = (projectname, oDesign.GetName())
+        known = _known.setdefault(key, {})
+        new = {}
+        changed = {}
+        for name, value in sorted(values.items()):
+            expr = Expression(value).expr
+            if name not in known:
+                (new if create else changed)[name] = expr
+            elif known[name] != expr:
+                changed[name] = expr
+        _change_properties(oObject, tabname, servername, new, changed, known)
+
 def add_property(oDesign, name, value):
     """
     Add a design property.
@@ -28,24 +149,61 @@ def add_property(oDesign, name, value):
     None
     
     """
-    propserversarray = ["NAME:PropServers", "LocalVariables"]
-
-    newpropsarray = ["NAME:NewProps", ["NAME:" + name, 
-                                       "PropType:=", "VariableProp", 
-                                       "UserDef:=", True, 
-                                       "Value:=", Expression(value).expr]]
-    
-    proptabarray = ["NAME:LocalVariableTab", propserversarray, newpropsarray]
-          
-    oDesign.ChangeProperty(["NAME:AllTabs", proptabarray])
+    _change_properties(oDesign, "LocalVariableTab", "LocalVariables", {name: value}, None)
     return Expression(name)
 
+def add_properties(oProject, properties, oDesign=None):
+    """
+    Add many variables in as few ChangeProperty calls as possible: one for
+    the project variables, whose names start with '$', and one for the
+    local variables of the design.
+
+    Variables that were already added or set through this module are
+    changed instead if their value differs, and left alone otherwise.
+
+    Parameters
+    ----------
+    oProject : pywin32 COMObject
+        The HFSS project.
+    properties : dict
+        Maps variable names to values.
+    oDesign : pywin32 COMObject
+        The design whose local variables are added.  Defaults to the active
+        design.
+
+    Returns
+    -------
+    expressions : dict
+        Maps the variable names to Expressions of them.
+    """
+    _write_variables(oProject, properties, oDesign, create=True)
+    return dict((name, Expression(name)) for name in properties)
+
+def change_variables(oDesign, new=None, changed=None):
+    """
+    Add and change local variables of a design in one ChangeProperty call.
+
+    Parameters
+    ----------
+    oDesign : pywin32 COMObject
+        The HFSS design whose variables are edited.
+    new : dict
+        Maps the names of variables to add to their values.
+    changed : dict
+        Maps the names of existing variables to their new values.
+
+    Returns
+    -------
+    None
+    """
+    _change_properties(oDesign, "LocalVariableTab", "LocalVariables", new, changed)
+
 def set_variable(oProject, name, value):
     """
     Change a design property.  This function differs significantly from 
     SetVariableValue() in that it makes the reasonable assumption that 
-    if the variable contains '$', then the variable is global; otherwise, 
-    it is assumed to be a local variable.
+    if the variable name starts with '$', then the variable is global; 
+    otherwise, it is assumed to be a local variable.
     
     Parameters
     ----------
@@ -61,11 +219,37 @@ def set_variable(oProject, name, value):
     None
     
     """
-    if '$' in name: 
-        oProject.SetVariableValue(name,Expression(value)._raw_string)
+    _forget_names([name])
+    if _is_project_variable(name):
+        oProject.SetVariableValue(name,Expression(value).expr)
     else:
         oDesign = oProject.GetActiveDesign()
-        oDesign.SetVariableValue(name,Expression(value)._raw_string)
+        oDesign.SetVariableValue(name,Expression(value).expr)
+
+def set_variables(oProject, variables, oDesign=None):
+    """
+    Change many variables in as few ChangeProperty calls as possible: one
+    for the project variables, whose names start with '$', and one for the
+    local variables of the design.
+
+    Variables whose value was last added or set through this module and
+    hasn't changed are left out, so no call is made if nothing changed.
+
+    Parameters
+    ----------
+    oProject : pywin32 COMObject
+        The HFSS project.
+    variables : dict
+        Maps existing variable names to their new values.
+    oDesign : pywin32 COMObject
+        The design whose local variables are changed.  Defaults to the
+        active design.
+
+    Returns
+    -------
+    None
+    """
+    _write_variables(oProject, variables, oDesign, create=False)
 
 def get_variables(oProject,oDesign=''):
     """
@@ -92,3 +276,48 @@ def get_variables(oProject,oDesign=''):
     return map(str,variable_list)
 
 
+if __name__ == "__main__":
+    import timeit
+
+    from hycohanz.standin import RecordingEditor
+
+    N = 300
+    variables = dict(('w{0}'.format(n), '{0}mm'.format(n)) for n in range(N))
+    variables.update(('$h{0}'.format(n), '{0}mil'.format(n)) for n in range(N // 10))
+
+    oProject, oDesign = RecordingEditor({'GetName': 'Project1'}), RecordingEditor({'GetName': 'HFSSDesign1'})
+    oProject.returns['GetActiveDesign'] = oDesign
+
+    def one_by_one():
+        for name, value in sorted(variables.items()):
+            if name.startswith('$'):
+                set_variable(oProject, name, value)
+            else:
+                add_property(oDesign, name, value)
+
+    t_loop = timeit.timeit(one_by_one, number=1)
+    calls_loop = oProject.count('ChangeProperty') + oDesign.count('ChangeProperty') + \
+        oProject.count('SetVariableValue')
+    forget_variables()
+    oProject.reset()
+    oDesign.reset()
+
+    t_bulk = timeit.timeit(lambda: add_properties(oProject, variables), number=1)
+    calls_bulk = oProject.count('ChangeProperty') + oDesign.count('ChangeProperty')
+    updated = dict(variables, w7='7.5mm', w8='8.5mm', **{'$h3': '4mil'})
+    # A new design handle on every call, as GetActiveDesign() returns.
+    oProject.reset()
+    handles = []
+
+    def active_design():
+        handles.append(RecordingEditor({'GetName': 'HFSSDesign1'}))
+        return handles[-1]
+
+    oProject.returns['GetActiveDesign'] = active_design
+    for n in range(5):
+        set_variables(oProject, updated)
+    calls_set = oProject.count('ChangeProperty') + sum(h.count('ChangeProperty') for h in handles)
+    print('{0} variables:'.format(len(variables)))
+    print('  add_property()/set_variable() loop:  {0} writes, {1:.1f} ms'.format(calls_loop, 1e3 * t_loop))
+    print('  add_properties():                    {0} writes, {1:.1f} ms'.format(calls_bulk, 1e3 * t_bulk))
+    print('  set_variables() changing 3, 5 times: {0} writes, {1} cache entries'.format(calls_set, len(_known)))
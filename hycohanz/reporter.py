@@ -3,10 +3,14 @@
 Functions in this module correspond more or less to the functions described 
 in the HFSS Scripting Guide, Section "Reporter Editor Script Commands"
 
-At last count there were 5 functions implemented out of 28.
+At last count there were 6 functions implemented out of 28.
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 
+import os
+import shutil
+import tempfile
+
 from hycohanz.design import get_module
 from hycohanz.analysis_setup import get_setups, get_sweeps
 
@@ -114,6 +118,60 @@ def export_to_file(design, report_name, filename):
     module.ExportToFile(report_name, filename)
 
 
+def export_reports(oDesign, report_names=None, directory=None, extension=".csv", threads=4):
+    """
+    Export several reports and read their data into NumPy arrays.
+
+    The reports are exported one after the other, since HFSS handles one 
+    COM call at a time, but each file is parsed in a thread pool as soon as 
+    it has been written, while the next reports are being exported.
+
+    Parameters
+    ----------
+    oDesign : pywin32 COMObject
+        The HFSS design object upon which to operate.
+    report_names : list of str
+        The reports to export.  Defaults to get_all_report_names(oDesign).
+    directory : str
+        Directory in which the files are written, and kept.  By default a 
+        temporary directory is used and deleted afterwards.
+    extension : str
+        ".csv" or ".tab".
+    threads : int
+        Number of parser threads.
+
+    Returns
+    -------
+    reports : dict
+        Maps report names to hycohanz.reportfile.Report objects, which map 
+        trace names to arrays.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from hycohanz.reportfile import read_report
+
+    if report_names is None:
+        report_names = get_all_report_names(oDesign)
+
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix='hycohanz-reports-')
+
+    module = get_module(oDesign, "ReportSetup")
+    try:
+        with ThreadPoolExecutor(threads) as executor:
+            futures = []
+            for n, report_name in enumerate(report_names):
+                # Report names can contain characters that aren't allowed 
+                # in file names.
+                filename = os.path.join(directory, 'report{0:04d}{1}'.format(n, extension))
+                module.ExportToFile(report_name, filename)
+                futures.append((report_name, executor.submit(read_report, filename)))
+            return dict((report_name, future.result()) for report_name, future in futures)
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
 def get_all_report_names(design):
     """
     Gets the names of existing reports in a design.
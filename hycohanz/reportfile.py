@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Read report data exported by HFSS into NumPy arrays.
+
+reporter.export_to_file() writes report data as comma-separated (.csv) or
+tab-separated (.tab) text: one header line of quoted column names with
+units, e.g. "Freq [GHz]","dB(S(1,1)) []", followed by one line of numbers
+per point.  read_report() parses such a file into a Report, which maps each
+column (trace) name to a float array.
+
+The numbers are parsed by NumPy's C reader straight from the file, in
+blocks, without reading the file into a Python string first.
+
+Example Usage
+-------------
+>>> from hycohanz.reportfile import read_report
+>>> report = read_report('S11.csv')
+>>> report.names
+['Freq', 'dB(S(1,1))']
+>>> report.units['Freq']
+'GHz'
+>>> report['dB(S(1,1))'].min()
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import csv
+import io
+import os
+import re
+
+# "name [unit]" in a column header.
+_HEADER = re.compile(r'^(?P<name>.*?)\s*\[(?P<unit>[^\]]*)\]\s*$')
+
+_DELIMITERS = {'.csv': ',', '.tab': '\t'}
+
+
+class Report(object):
+    """
+    The columns of an exported report.
+
+    A Report behaves like a read-only dict that maps column names to 1-D
+    float arrays.
+
+    Attributes
+    ----------
+    names : list of str
+        The column names, without units, in file order.
+    units : dict
+        Maps column names to their units ('' if none).
+    data : numpy.ndarray
+        The values, one column per name.
+    """
+    def __init__(self, names, units, data):
+        self.names = names
+        self.units = units
+        self.data = data
+        self._columns = dict((name, n) for n, name in enumerate(names))
+
+    def __getitem__(self, name):
+        return self.data[:, self._columns[name]]
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def items(self):
+        return [(name, self[name]) for name in self.names]
+
+    def __repr__(self):
+        return 'Report({0}, {1} rows)'.format(self.names, len(self.data))
+
+
+def parse_header(line, delimiter):
+    """
+    Split a header line into column names and units.
+
+    Returns
+    -------
+    names : list of str
+    units : dict
+    """
+    names = []
+    units = {}
+    for field in next(csv.reader([line], delimiter=delimiter)):
+        match = _HEADER.match(field)
+        if match is None:
+            name, unit = field.strip(), ''
+        else:
+            name, unit = match.group('name'), match.group('unit')
+        # Repeated names, e.g. several traces with the same expression in
+        # different contexts, get a numeric suffix.
+        unique = name
+        n = 1
+        while unique in units:
+            n += 1
+            unique = '{0}#{1}'.format(name, n)
+        names.append(unique)
+        units[unique] = unit
+    return names, units
+
+
+def _read_rows(f, delimiter, ncolumns, filename):
+    """Parse data rows in which empty fields are missing values."""
+    import numpy
+
+    rows = []
+    for lineno, row in enumerate(csv.reader(f, delimiter=delimiter), 2):
+        if not row:
+            continue
+        if len(row) != ncolumns:
+            raise ValueError('{0}, line {1}: {2} columns instead of {3}'.format(filename, lineno, len(row), ncolumns))
+        try:
+            rows.append([float(value) if value.strip() else numpy.nan for value in row])
+        except ValueError:
+            raise ValueError('{0}, line {1}: not a number in {2!r}'.format(filename, lineno, delimiter.join(row)))
+    return numpy.array(rows, dtype=float).reshape(-1, ncolumns)
+
+
+def read_report(filename, delimiter=None):
+    """
+    Read a .csv or .tab report file exported by HFSS.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file.
+    delimiter : str
+        Column delimiter.  By default it is chosen from the file extension.
+
+    Returns
+    -------
+    report : Report
+
+    Raises
+    ------
+    ValueError
+        If the file has no header line, or a row has the wrong number of
+        columns or a field that is neither a number nor empty.  Empty
+        fields are read as NaN.
+    """
+    import numpy
+
+    if delimiter is None:
+        extension = os.path.splitext(filename)[1].lower()
+        try:
+            delimiter = _DELIMITERS[extension]
+        except KeyError:
+            raise ValueError('Unknown report file type {0!r}; give the delimiter'.format(extension))
+
+    with io.open(filename, 'r', newline='') as f:
+        header = f.readline()
+        if not header.strip():
+            raise ValueError('{0} has no header line'.format(filename))
+        names, units = parse_header(header.rstrip('\r\n'), delimiter)
+        try:
+            data = numpy.loadtxt(f, delimiter=delimiter, dtype=float, ndmin=2)
+        except ValueError:
+            # Missing values: fall back to a slower reader that fills them
+            # with NaN, and still rejects anything else that isn't a number.
+            f.seek(0)
+            f.readline()
+            data = _read_rows(f, delimiter, len(names), filename)
+
+    if data.size == 0:
+        data = data.reshape(0, len(names))
+    if data.shape[1] != len(names):
+        raise ValueError('{0} has {1} column names but {2} columns of data'.format(
+                         filename, len(names), data.shape[1]))
+    return Report(names, units, data)
+
+
+def read_reports(filenames, threads=4):
+    """
+    Read several report files in a thread pool.
+
+    Parameters
+    ----------
+    filenames : dict
+        Maps keys, e.g. report names, to file names.
+    threads : int
+        Number of threads.
+
+    Returns
+    -------
+    reports : dict
+        Maps the same keys to Report objects.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(threads) as executor:
+        futures = [(key, executor.submit(read_report, filename)) for key, filename in filenames.items()]
+        return dict((key, future.result()) for key, future in futures)
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import timeit
+
+    import numpy
+
+    directory = tempfile.mkdtemp()
+    try:
+        nreports, nrows = 50, 20000
+        freq = numpy.linspace(1, 20, nrows)
+        filenames = {}
+        for n in range(nreports):
+            filename = os.path.join(directory, 'report{0}.csv'.format(n))
+            columns = [freq] + [numpy.sin(freq * k + n) for k in range(1, 5)]
+            with open(filename, 'w') as f:
+                f.write('"Freq [GHz]","dB(S(1,1)) []","dB(S(2,1)) []","ang_deg(S(2,1)) [deg]","Re(Z(1,1)) [ohm]"\n')
+                numpy.savetxt(f, numpy.column_stack(columns), delimiter=',', fmt='%.15g')
+            filenames['Report{0}'.format(n)] = filename
+
+        def csv_module():
+            reports = {}
+            for key, filename in filenames.items():
+                with open(filename) as f:
+                    rows = csv.reader(f)
+                    header = next(rows)
+                    reports[key] = [[float(value) for value in row] for row in rows]
+            return reports
+
+        baseline = timeit.timeit(csv_module, number=1)
+        serial = timeit.timeit(lambda: read_reports(filenames, threads=1), number=1)
+        threaded = timeit.timeit(lambda: read_reports(filenames, threads=4), number=1)
+        print('{0} reports of {1} rows x 5 columns:'.format(nreports, nrows))
+        print('  csv module, lists of floats:  {0:.3f} s'.format(baseline))
+        print('  read_reports(), 1 thread:     {0:.3f} s'.format(serial))
+        print('  read_reports(), 4 threads:    {0:.3f} s'.format(threaded))
+    finally:
+        shutil.rmtree(directory)
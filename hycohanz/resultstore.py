@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+A columnar on-disk store for the results of parametric sweeps.
+
+Each variation (a dict of design variable values) contributes a block of
+rows, e.g. one row per frequency point, to a fixed set of columns, e.g.
+"Freq" and "dB(S(1,1))".  Rows are buffered and written in chunks: each
+chunk of each column is a .npy file, optionally compressed with zlib.  A
+JSON index maps each variation's key to its rows.
+
+Reading a variation, or a slice of its rows, only loads the chunks that hold
+them, and uncompressed chunks are memory-mapped, so only the pages that are
+actually used are read from disk.  Compressed chunks have to be decompressed
+whole; the most recently used ones are kept in memory.
+
+Layout of a store directory::
+
+    index.json
+    <column>-<hash>/<chunk number>.npy      (or .npy.z when compressed)
+
+where <column> is the column name with unsafe characters escaped and <hash>
+a hash of the exact name, so that names differing only in case get
+different directories on case-insensitive file systems, as on Windows.
+
+Example Usage
+-------------
+>>> from hycohanz.resultstore import ResultStore
+>>> with ResultStore('sweep') as store:
+...     for variables in variations:
+...         report = run(variables)
+...         store.append(variables, {'Freq': report['Freq'], 'S11': report['dB(S(1,1))']})
+>>> store = ResultStore('sweep', mode='r')
+>>> s11 = store.read({'w': '2mm', '$h': '1.6mm'}, ['S11'], start=100, stop=200)['S11']
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import bisect
+import collections
+import hashlib
+import io
+import json
+import os
+import re
+import zlib
+
+from hycohanz.expression import Expression
+
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+
+# Default number of rows per chunk.
+CHUNK_ROWS = 65536
+
+# Number of decompressed chunks kept in memory by a store.
+CACHED_CHUNKS = 8
+
+# Characters allowed in column directory names; others are escaped.
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.\-]')
+
+
+def variation_key(variables):
+    """
+    Return a canonical string key for a dict of variable values.
+
+    Values are converted to their expression strings, so that 2, "2" and
+    Expression(2) give the same key, and names are sorted.
+    """
+    return json.dumps(sorted((str(name), Expression(value).expr) for name, value in variables.items()),
+                      separators=(',', ':'))
+
+
+def _column_directory(column):
+    """A file-system-safe directory name for a column, e.g. dB(S(1,1))."""
+    escaped = _UNSAFE.sub(lambda match: '%{0:02X}'.format(ord(match.group())), column)
+    return '{0}-{1}'.format(escaped, hashlib.sha1(column.encode('utf-8')).hexdigest()[:8])
+
+
+class ResultStore(object):
+    """
+    Append-only columnar storage of per-variation results.
+
+    Parameters
+    ----------
+    directory : str
+        The store directory.  It is created if needed.
+    mode : str
+        'a' to read and append, 'r' to read only.
+    chunk_rows : int
+        Number of rows per chunk of a new store.
+    compress : bool
+        Whether chunks of a new store are compressed with zlib.  Compressed
+        chunks are smaller but are decompressed whole instead of being
+        memory-mapped.
+
+    Attributes
+    ----------
+    columns : dict
+        Maps column names to NumPy dtype strings.
+    """
+    def __init__(self, directory, mode='a', chunk_rows=CHUNK_ROWS, compress=False):
+        if mode not in ('a', 'r'):
+            raise ValueError("mode must be 'a' or 'r'")
+
+        self.directory = directory
+        self.mode = mode
+        indexfile = os.path.join(directory, INDEX_FILENAME)
+        if os.path.exists(indexfile):
+            with open(indexfile) as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                raise ValueError('{0} has an unsupported index version'.format(directory))
+        elif mode == 'r':
+            raise IOError('{0} is not a result store'.format(directory))
+        else:
+            index = {'version': INDEX_VERSION,
+                     'chunk_rows': chunk_rows,
+                     'compress': compress,
+                     'columns': {},
+                     'column_order': [],
+                     'chunks': [],
+                     'variations': []}
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.chunk_rows = index['chunk_rows']
+        self.compress = index['compress']
+        self.columns = index['columns']
+        self.column_order = index['column_order']
+        # Row ranges [start, stop) of the chunks written so far.
+        self.chunks = [tuple(chunk) for chunk in index['chunks']]
+        self.chunkstarts = [start for start, stop in self.chunks]
+        self.variations = index['variations']
+        self.keys = dict((variation['key'], n) for n, variation in enumerate(self.variations))
+
+        # Appended rows not yet written, as lists of arrays per column.
+        self.pending = dict((column, []) for column in self.column_order)
+        self.pendingrows = 0
+        self.written = self.chunks[-1][1] if self.chunks else 0
+        # (column, chunk number) -> decompressed chunk, least recently used
+        # first.
+        self.cache = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.variations)
+
+    def __contains__(self, variables):
+        return variation_key(variables) in self.keys
+
+    def append(self, variables, columns):
+        """
+        Append the results of a variation.
+
+        Parameters
+        ----------
+        variables : dict
+            The variable values of the variation.
+        columns : dict
+            Maps column names to 1-D arrays of equal length.  The first
+            variation appended fixes the set of columns and their dtypes.
+
+        Raises
+        ------
+        ValueError
+            If the variation is already in the store, or the columns don't
+            match those of the store.
+        """
+        import numpy
+
+        if self.mode == 'r':
+            raise IOError('The result store is open read-only')
+
+        key = variation_key(variables)
+        if key in self.keys:
+            raise ValueError('Variation {0} is already in the store'.format(key))
+
+        arrays = dict((name, numpy.atleast_1d(numpy.asarray(values))) for name, values in columns.items())
+        lengths = set(len(array) for array in arrays.values())
+        if len(lengths) != 1:
+            raise ValueError('All columns must have the same length')
+        nrows = lengths.pop()
+
+        if not self.column_order:
+            self.column_order.extend(sorted(arrays))
+            for name in self.column_order:
+                self.columns[name] = arrays[name].dtype.str
+                self.pending[name] = []
+        elif set(arrays) != set(self.column_order):
+            raise ValueError('Columns {0} do not match the store columns {1}'.format(
+                             sorted(arrays), self.column_order))
+
+        start = self.written + self.pendingrows
+        for name in self.column_order:
+            self.pending[name].append(arrays[name].astype(self.columns[name], copy=False))
+        self.pendingrows += nrows
+
+        self.keys[key] = len(self.variations)
+        self.variations.append({'key': key,
+                                'variables': dict((str(name), Expression(value).expr)
+                                                  for name, value in variables.items()),
+                                'start': start,
+                                'stop': start + nrows})
+
+        while self.pendingrows >= self.chunk_rows:
+            self._write_chunk(self.chunk_rows)
+
+    def _write_chunk(self, nrows):
+        import numpy
+
+        number = len(self.chunks)
+        for name in self.column_order:
+            data = numpy.concatenate(self.pending[name])
+            chunk, rest = data[:nrows], data[nrows:]
+            self.pending[name] = [rest] if len(rest) else []
+
+            directory = os.path.join(self.directory, _column_directory(name))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            filename = os.path.join(directory, '{0}.npy'.format(number))
+            if self.compress:
+                buf = io.BytesIO()
+                numpy.save(buf, chunk)
+                with open(filename + '.z', 'wb') as f:
+                    f.write(zlib.compress(buf.getvalue()))
+            else:
+                numpy.save(filename, chunk)
+
+        self.chunks.append((self.written, self.written + nrows))
+        self.chunkstarts.append(self.written)
+        self.written += nrows
+        self.pendingrows -= nrows
+
+    def flush(self):
+        """Write the pending rows and the index to disk."""
+        if self.mode == 'r':
+            return
+        if self.pendingrows:
+            self._write_chunk(self.pendingrows)
+
+        index = {'version': INDEX_VERSION,
+                 'chunk_rows': self.chunk_rows,
+                 'compress': self.compress,
+                 'columns': self.columns,
+                 'column_order': self.column_order,
+                 'chunks': self.chunks,
+                 'variations': self.variations}
+        indexfile = os.path.join(self.directory, INDEX_FILENAME)
+        with open(indexfile + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(indexfile + '.tmp', indexfile)
+
+    def close(self):
+        self.flush()
+
+    def _load_chunk(self, column, number):
+        import numpy
+
+        filename = os.path.join(self.directory, _column_directory(column), '{0}.npy'.format(number))
+        if not self.compress:
+            return numpy.load(filename, mmap_mode='r')
+        try:
+            chunk = self.cache.pop((column, number))
+        except KeyError:
+            with open(filename + '.z', 'rb') as f:
+                chunk = numpy.load(io.BytesIO(zlib.decompress(f.read())))
+            chunk.flags.writeable = False
+            if len(self.cache) >= CACHED_CHUNKS:
+                self.cache.popitem(last=False)
+        self.cache[column, number] = chunk
+        return chunk
+
+    def _rows(self, column, start, stop):
+        """
+        Return the rows [start, stop) of a column.  Rows that haven't been
+        written yet are served from the buffer of appended rows.
+        """
+        import numpy
+
+        pieces = []
+        number = bisect.bisect_right(self.chunkstarts, start) - 1
+        while start < min(stop, self.written):
+            chunkstart, chunkstop = self.chunks[number]
+            chunk = self._load_chunk(column, number)
+            piece = chunk[start - chunkstart:min(stop, chunkstop) - chunkstart]
+            pieces.append(piece)
+            start += len(piece)
+            number += 1
+        if start < stop:
+            pending = numpy.concatenate(self.pending[column])
+            pieces.append(pending[start - self.written:stop - self.written])
+        if len(pieces) == 1:
+            return pieces[0]
+        if not pieces:
+            return numpy.empty(0, dtype=self.columns[column])
+        return numpy.concatenate(pieces)
+
+    def variables(self):
+        """Return the variable dicts of the stored variations, in order."""
+        return [dict(variation['variables']) for variation in self.variations]
+
+    def read(self, variables, columns=None, start=None, stop=None):
+        """
+        Read the results of a variation.
+
+        Parameters
+        ----------
+        variables : dict
+            The variable values of the variation.
+        columns : list of str
+            The columns to read.  Defaults to all of them.
+        start, stop : int
+            Read only rows [start, stop) of the variation, e.g. a range of
+            frequency points.
+
+        Returns
+        -------
+        columns : dict
+            Maps column names to arrays.  Arrays from uncompressed stores
+            that lie within one chunk are read-only memory-mapped views.
+
+        Raises
+        ------
+        KeyError
+            If the variation isn't in the store.
+        """
+        variation = self.variations[self.keys[variation_key(variables)]]
+        first, last = variation['start'], variation['stop']
+        rows = range(first, last)[slice(start, stop)]
+        if columns is None:
+            columns = self.column_order
+        return dict((column, self._rows(column, rows.start, max(rows.start, rows.stop)))
+                    for column in columns)
+
+    def read_column(self, column):
+        """
+        Read a column for all variations, e.g. to plot a quantity across the
+        sweep.  Use the variations' "start" and "stop" rows to split it.
+        """
+        return self._rows(column, 0, self.written + self.pendingrows)
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import timeit
+
+    import numpy
+
+    directory = tempfile.mkdtemp()
+    try:
+        nvariations, nfreq = 1000, 401
+        freq = numpy.linspace(1e9, 20e9, nfreq)
+        variations = [{'w': '{0}mm'.format(1 + 0.01 * n), '$h': '1.6mm'} for n in range(nvariations)]
+
+        # Baseline: one CSV file per variation.
+        csvdir = os.path.join(directory, 'csv')
+        os.makedirs(csvdir)
+        for n, variables in enumerate(variations):
+            numpy.savetxt(os.path.join(csvdir, '{0}.csv'.format(n)),
+                          numpy.column_stack((freq, numpy.sin(freq * n), numpy.cos(freq * n))),
+                          delimiter=',', header='Freq,S11,S21')
+
+        for compress in (False, True):
+            storedir = os.path.join(directory, 'store{0}'.format(int(compress)))
+            t0 = timeit.default_timer()
+            with ResultStore(storedir, compress=compress) as store:
+                for n, variables in enumerate(variations):
+                    store.append(variables, {'Freq': freq, 'S11': numpy.sin(freq * n),
+                                             'S21': numpy.cos(freq * n)})
+            t1 = timeit.default_timer()
+            store = ResultStore(storedir, mode='r')
+            size = sum(os.path.getsize(os.path.join(root, name))
+                       for root, dirs, names in os.walk(storedir) for name in names)
+
+            n = 0
+            def read_one():
+                global n
+                n = (n + 337) % nvariations
+                return store.read(variations[n], ['S11'], start=100, stop=200)['S11']
+            t = timeit.timeit(read_one, number=1000) / 1000
+            print('ResultStore(compress={0}): {1:.2f} s to write, {2:.1f} MB, '
+                  '{3:.1f} us per 100-point read'.format(compress, t1 - t0, size / 1e6, 1e6 * t))
+
+        def read_csv():
+            global n
+            n = (n + 337) % nvariations
+            return numpy.loadtxt(os.path.join(csvdir, '{0}.csv'.format(n)), delimiter=',')[100:200, 1]
+        t = timeit.timeit(read_csv, number=100) / 100
+        size = sum(os.path.getsize(os.path.join(csvdir, name)) for name in os.listdir(csvdir))
+        print('CSV per variation:  {0:.1f} MB, {1:.1f} us per 100-point read'.format(size / 1e6, 1e6 * t))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+A client-side shadow of the HFSS 3D Modeler that caches geometry queries.
+
+Queries such as get_face_ids(), get_object_id_by_name() and
+get_face_by_position() each cost a synchronous COM call, even when the
+geometry hasn't changed since the last time the same question was asked.
+ShadowEditor wraps an oEditor handle, remembers the answers to these queries,
+and forgets exactly the answers that a modeler operation can change:
+
+- Move, Rotate, Mirror and Scale forget the positions of the selected parts
+  (face-by-position lookups, face centers, ...) but keep their ids.
+- Boolean and other topology-changing operations (Subtract, Unite, Delete,
+  Fillet, RenamePart, ...) forget everything about the parts involved.
+- Creating parts forgets the model-wide lists of object names.
+- Changing the working coordinate system or model units forgets all positions.
+- Anything unrecognized forgets everything.
+
+A ShadowEditor can be passed anywhere an oEditor is expected:
+
+>>> import hycohanz as hfss
+>>> oShadow = hfss.ShadowEditor(oEditor)
+>>> for port in ports:
+...     faceid = hfss.get_face_by_position(oShadow, "Substrate", *port)
+>>> oShadow.hits, oShadow.misses
+
+The shadow only sees operations made through it.  If the model is changed
+some other way, call clear().
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import functools
+
+# How a cached answer depends on the model: on the parts' topology (names,
+# ids, faces, edges) or also on their placement (positions).
+TOPOLOGY = 'topology'
+PLACEMENT = 'placement'
+
+# Cached queries, mapped to (kind, argument) where argument says how to find
+# the part the answer is about: 'name' for a part name argument, 'body' for
+# a "BodyName:=" entry in a parameters array, 'face' for a face id argument,
+# 'result' for the part name returned, and None for model-wide answers.
+CACHED_QUERIES = {
+    'GetObjectIDByName':        (TOPOLOGY, 'name'),
+    'GetFaceIDs':               (TOPOLOGY, 'name'),
+    'GetEdgeIDsFromObject':     (TOPOLOGY, 'name'),
+    'GetVertexIDsFromObject':   (TOPOLOGY, 'name'),
+    'GetEdgeIDsFromFace':       (TOPOLOGY, 'face'),
+    'GetVertexIDsFromFace':     (TOPOLOGY, 'face'),
+    'GetVertexIDsFromEdge':     (TOPOLOGY, None),
+    'GetObjectNameByFaceID':    (TOPOLOGY, 'result'),
+    'GetObjectName':            (TOPOLOGY, None),
+    'GetMatchedObjectName':     (TOPOLOGY, None),
+    'GetNumObjects':            (TOPOLOGY, None),
+    'GetFaceByPosition':        (PLACEMENT, 'body'),
+    'GetEdgeByPosition':        (PLACEMENT, 'body'),
+    'GetFaceCenter':            (PLACEMENT, 'face'),
+    'GetFaceArea':              (PLACEMENT, 'face'),
+    'GetVertexPosition':        (PLACEMENT, None),
+    'GetModelUnits':            (PLACEMENT, None),
+}
+
+# Operations that only change the placement of the selected parts.
+PLACEMENT_OPERATIONS = ('Move', 'Rotate', 'Mirror', 'Scale')
+
+# Operations that don't change any geometry.
+NEUTRAL_OPERATIONS = ('AssignMaterial', 'Copy')
+
+# Operations that change the frame in which positions are given.
+FRAME_OPERATIONS = ('SetWCS', 'CreateRelativeCS', 'CreateFaceCS', 'SetModelUnits')
+
+# Operations that add parts without touching existing ones.
+CREATION_OPERATIONS = ('Paste', 'Import', 'DuplicateAlongLine', 'DuplicateAroundAxis')
+
+# Keys of the part names in the selections array of a modeler operation.
+_SELECTION_KEYS = ('Selections:=', 'Blank Parts:=', 'Tool Parts:=', 'Old Name:=', 'New Name:=')
+
+
+def _selected_parts(args):
+    """
+    Return the set of part names selected by a modeler operation, or None if
+    the selection can't be determined.
+    """
+    if not args or not isinstance(args[0], list):
+        return None
+
+    selectionsarray = args[0]
+    parts = set()
+    for n, item in enumerate(selectionsarray[:-1]):
+        if item in _SELECTION_KEYS:
+            parts.update(part.strip() for part in str(selectionsarray[n + 1]).split(',')
+                         if part.strip())
+    return parts or None
+
+
+def _body_name(args):
+    """
+    Return the "BodyName:=" value of a position query's parameters array.
+    """
+    parameters = args[0]
+    return parameters[parameters.index("BodyName:=") + 1]
+
+
+class ShadowEditor(object):
+    """
+    Cache HFSS 3D Modeler queries, invalidating them on modeler operations.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor to which calls are forwarded.
+
+    Attributes
+    ----------
+    hits : int
+        Number of queries answered from the cache.
+    misses : int
+        Number of queries forwarded to oEditor.
+    invalidations : int
+        Number of cached answers forgotten because of modeler operations.
+    """
+    def __init__(self, oEditor):
+        self.oEditor = oEditor
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Cached answers by (method, repr(args)), and the keys of the cached
+        # answers by (part name or None, kind).
+        self.cache = {}
+        self.tags = {}
+        # Known owners of face ids, from GetFaceIDs and GetObjectNameByFaceID.
+        self.owners = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name in CACHED_QUERIES:
+            return functools.partial(self._query, name)
+
+        return functools.partial(self._operation, name)
+
+    @property
+    def hit_rate(self):
+        """The fraction of queries answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        """Forget all cached answers."""
+        self.invalidations += len(self.cache)
+        self.cache.clear()
+        self.tags.clear()
+        self.owners.clear()
+
+    def _query(self, name, *args):
+        key = (name, repr(args))
+        try:
+            value = self.cache[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = getattr(self.oEditor, name)(*args)
+
+        kind, argument = CACHED_QUERIES[name]
+        if argument == 'name':
+            part = args[0]
+        elif argument == 'body':
+            part = _body_name(args)
+        elif argument == 'face':
+            part = self.owners.get(args[0])
+        elif argument == 'result':
+            part = value
+            self.owners[args[0]] = value
+        else:
+            part = None
+
+        if name == 'GetFaceIDs':
+            for faceid in value:
+                self.owners[faceid] = part
+
+        self.cache[key] = value
+        self.tags.setdefault((part, kind), set()).add(key)
+        return value
+
+    def _forget(self, part, kind):
+        keys = self.tags.pop((part, kind), ())
+        for key in keys:
+            # A key is filed under a single tag, so it is still cached here.
+            del self.cache[key]
+        self.invalidations += len(keys)
+
+    def _forget_kind(self, kind):
+        for part, tagkind in list(self.tags):
+            if tagkind == kind:
+                self._forget(part, kind)
+
+    def _operation(self, name, *args):
+        if name in NEUTRAL_OPERATIONS or (name.startswith('Get') and name not in CACHED_QUERIES):
+            pass
+        elif name in FRAME_OPERATIONS:
+            self._forget_kind(PLACEMENT)
+        elif name.startswith('Create') or name in CREATION_OPERATIONS:
+            self._forget(None, TOPOLOGY)
+        else:
+            parts = _selected_parts(args)
+            if parts is None:
+                self.clear()
+            elif name in PLACEMENT_OPERATIONS:
+                self._forget(None, PLACEMENT)
+                for part in parts:
+                    self._forget(part, PLACEMENT)
+            else:
+                self._forget(None, TOPOLOGY)
+                self._forget(None, PLACEMENT)
+                for part in parts:
+                    self._forget(part, TOPOLOGY)
+                    self._forget(part, PLACEMENT)
+                for faceid in [faceid for faceid, owner in self.owners.items() if owner in parts]:
+                    del self.owners[faceid]
+
+        return getattr(self.oEditor, name)(*args)
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from hycohanz import modeler3d
+    from hycohanz.standin import RecordingEditor
+
+    def label_ports(oEditor, N, passes):
+        """Look up the same faces repeatedly, moving one part in between."""
+        for n in range(N):
+            modeler3d.create_box(oEditor, 0, 0, 0, "1mm", "1mm", "1mm", Name="Cell{0}".format(n))
+        for p in range(passes):
+            for n in range(N):
+                name = "Cell{0}".format(n)
+                modeler3d.get_object_id_by_name(oEditor, name)
+                list(modeler3d.get_face_ids(oEditor, name))
+                modeler3d.get_face_by_position(oEditor, name, "0.5mm", "0.5mm", "1mm")
+            modeler3d.move(oEditor, ["Cell{0}".format(p % N)], "1mm", 0, 0)
+
+    returns = {'GetFaceIDs': lambda name: (1, 2, 3, 4, 5, 6),
+               'GetObjectIDByName': 7,
+               'GetFaceByPosition': 6}
+
+    for N in (64, 1024):
+        oEditor = RecordingEditor(returns)
+        label_ports(oEditor, N, 10)
+        direct = oEditor.round_trips
+
+        oEditor = RecordingEditor(returns)
+        oShadow = ShadowEditor(oEditor)
+        label_ports(oShadow, N, 10)
+        print('N = {0:4d}, 10 passes:  {1:6d} COM calls direct, {2:6d} through ShadowEditor '
+              '({3} hits, {4} misses)'.format(N, direct, oEditor.round_trips, oShadow.hits, oShadow.misses))
+
+    oShadow = ShadowEditor(RecordingEditor(returns))
+    modeler3d.get_face_ids(oShadow, "Cell0")
+    t = timeit.timeit(lambda: modeler3d.get_face_ids(oShadow, "Cell0"), number=100000) / 100000
+    print('Cached get_face_ids():  {0:.2f} us/call'.format(1e6 * t))
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Run HFSS solves in the background.
+
+design.solve() blocks the calling thread until HFSS has finished solving.
+A Solver runs the solves on a dedicated worker thread instead, and returns
+a future for each one, so that the calling thread can prepare the next
+variation or post-process the previous one in the meantime.
+
+COM objects can only be used from the thread (apartment) that created them,
+so the Solver marshals the design into its worker thread, and the desktop
+into a second monitor thread.  While a solve is running the monitor polls
+oDesktop.AreThereSimulationsRunning() to report progress, and calls
+oDesktop.StopSimulations() when the solve is cancelled or times out.
+
+Example Usage
+-------------
+>>> import hycohanz as hfss
+>>> with hfss.Solver(oDesktop, oDesign) as solver:
+...     future = solver.submit("Setup1", timeout=3600)
+...     prepare_next_variation()
+...     future.result()
+
+With asyncio:
+
+>>> async def run(solver):
+...     await solver.solve_async("Setup1")
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import collections
+import threading
+import time
+import warnings
+
+from concurrent import futures
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from hycohanz.design import solve
+
+SolveProgress = collections.namedtuple('SolveProgress', ['setups', 'elapsed', 'running'])
+SolveProgress.__doc__ = """
+Progress report passed to the progress callback of Solver.submit().
+
+setups is the setup name list being solved, elapsed the time since the
+solve started in seconds, and running the result of
+oDesktop.AreThereSimulationsRunning().
+"""
+
+
+class SolveCancelled(RuntimeError):
+    """The solve was stopped because its future was cancelled."""
+
+
+class SolveTimeout(RuntimeError):
+    """The solve was stopped because it took longer than its timeout."""
+
+
+class SolveFuture(futures.Future):
+    """
+    The future of a solve submitted to a Solver.
+
+    A pending solve is cancelled like any other future.  A running solve
+    can't be cancelled in the concurrent.futures sense, so cancel() returns
+    False, but it also stops the simulation, and the future then raises
+    SolveCancelled.
+    """
+    def __init__(self, setups, timeout, progress):
+        super(SolveFuture, self).__init__()
+        self.setups = setups
+        self.timeout = timeout
+        self.progress = progress
+        # Why the simulation was stopped, if it was.
+        self.reason = None
+        # Set when the solve finishes or a stop is requested, to wake the
+        # monitor thread.
+        self.changed = threading.Event()
+        self.finished = False
+
+    def cancel(self):
+        if super(SolveFuture, self).cancel():
+            return True
+        if not self.finished and self.reason is None:
+            self.reason = SolveCancelled
+            self.changed.set()
+        return False
+
+
+class _Apartment(object):
+    """
+    Hands a COM object over to another thread.
+
+    pywin32 COM objects are marshalled through a stream and re-created in
+    the target thread after initializing COM there.  Other objects, such as
+    the stand-ins, are passed through unchanged.
+    """
+    def __init__(self, obj):
+        if hasattr(obj, '_oleobj_'):
+            import pythoncom
+
+            self.obj = None
+            self.stream = pythoncom.CoMarshalInterThreadInterfaceInStream(pythoncom.IID_IDispatch,
+                                                                          obj._oleobj_)
+        else:
+            self.obj = obj
+            self.stream = None
+
+    def enter(self):
+        """Return the object for use in the calling thread."""
+        if self.stream is None:
+            return self.obj
+
+        import pythoncom
+        import win32com.client
+
+        pythoncom.CoInitialize()
+        dispatch = pythoncom.CoGetInterfaceAndReleaseStream(self.stream, pythoncom.IID_IDispatch)
+        return win32com.client.Dispatch(dispatch)
+
+    def leave(self):
+        if self.stream is not None:
+            import pythoncom
+
+            pythoncom.CoUninitialize()
+
+
+class Solver(object):
+    """
+    Solve setups of an HFSS design on a dedicated worker thread.
+
+    Solves are run one at a time, in the order they were submitted.
+
+    Parameters
+    ----------
+    oDesktop : pywin32 COMObject
+        The HFSS desktop, used to poll and stop simulations.
+    oDesign : pywin32 COMObject
+        The HFSS design to solve.
+    poll_interval : float
+        Time between progress polls, in seconds.
+    """
+    def __init__(self, oDesktop, oDesign, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._jobs = queue.Queue()
+        self._running = queue.Queue()
+
+        self._worker = threading.Thread(target=self._work, args=(_Apartment(oDesign),),
+                                        name='hycohanz-solver')
+        self._monitor = threading.Thread(target=self._watch, args=(_Apartment(oDesktop),),
+                                         name='hycohanz-solver-monitor')
+        for thread in (self._worker, self._monitor):
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, traceback):
+        self.shutdown()
+
+    def submit(self, setup_name_list, timeout=None, progress=None):
+        """
+        Queue a solve.
+
+        Parameters
+        ----------
+        setup_name_list : str or list
+            The setups to solve, as given to design.solve().
+        timeout : float
+            Stop the simulation if it runs for longer than this many seconds.
+            The future then raises SolveTimeout.
+        progress : callable
+            Called with a SolveProgress every poll interval while the solve
+            runs.  It is called from the monitor thread.
+
+        Returns
+        -------
+        future : SolveFuture
+            Its result is the return value of oDesign.Solve().
+        """
+        future = SolveFuture(setup_name_list, timeout, progress)
+        self._jobs.put(future)
+        return future
+
+    def solve_async(self, setup_name_list, timeout=None, progress=None, loop=None):
+        """
+        Queue a solve and return an asyncio future for it.  See submit().
+
+        Cancelling the asyncio future stops the simulation.
+        """
+        import asyncio
+
+        return asyncio.wrap_future(self.submit(setup_name_list, timeout=timeout, progress=progress),
+                                   loop=loop)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads after the queued solves have run.
+        """
+        self._jobs.put(None)
+        if wait:
+            self._worker.join()
+            self._monitor.join()
+
+    def _work(self, apartment):
+        oDesign = apartment.enter()
+        try:
+            while True:
+                future = self._jobs.get()
+                if future is None:
+                    break
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                self._running.put(future)
+                try:
+                    result = solve(oDesign, future.setups)
+                except Exception as e:
+                    future.finished = True
+                    future.changed.set()
+                    future.set_exception(e)
+                    continue
+
+                future.finished = True
+                future.changed.set()
+                if future.reason is SolveTimeout:
+                    future.set_exception(SolveTimeout('Solve of {0!r} timed out after {1} s'.format(
+                                                      future.setups, future.timeout)))
+                elif future.reason is SolveCancelled:
+                    future.set_exception(SolveCancelled('Solve of {0!r} was cancelled'.format(future.setups)))
+                else:
+                    future.set_result(result)
+        finally:
+            self._running.put(None)
+            apartment.leave()
+
+    def _watch(self, apartment):
+        oDesktop = apartment.enter()
+        try:
+            while True:
+                future = self._running.get()
+                if future is None:
+                    break
+                self._monitor_solve(oDesktop, future)
+        finally:
+            apartment.leave()
+
+    def _monitor_solve(self, oDesktop, future):
+        start = time.time()
+        nextpoll = start + self.poll_interval
+        stopped = False
+        while True:
+            now = time.time()
+            wakeup = nextpoll
+            if future.timeout is not None and not stopped:
+                wakeup = min(wakeup, start + future.timeout)
+            future.changed.wait(max(0.0, wakeup - now))
+            future.changed.clear()
+            if future.finished:
+                return
+
+            now = time.time()
+            if not stopped and future.reason is None and future.timeout is not None \
+                    and now - start >= future.timeout:
+                future.reason = SolveTimeout
+            if not stopped and future.reason is not None:
+                oDesktop.StopSimulations()
+                stopped = True
+
+            if now >= nextpoll:
+                nextpoll = now + self.poll_interval
+                running = oDesktop.AreThereSimulationsRunning()
+                if future.progress is not None:
+                    try:
+                        future.progress(SolveProgress(future.setups, now - start, running))
+                    except Exception as e:
+                        warnings.warn('Solve progress callback failed: {0!r}'.format(e))
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from hycohanz.standin import FakeSolver
+
+    def report(status):
+        print('  {0}: {1:.1f} s, running = {2}'.format(status.setups, status.elapsed, status.running))
+
+    oSolver = FakeSolver(duration=1.0)
+    with Solver(oSolver, oSolver, poll_interval=0.25) as solver:
+        t0 = time.time()
+        first = solver.submit("Setup1", progress=report)
+        second = solver.submit("Setup2", timeout=0.5)
+        third = solver.submit("Setup3")
+        third.cancel()
+        print('Submitted three solves in {0:.3f} s'.format(time.time() - t0))
+
+        print('Setup1 result: {0} after {1:.2f} s'.format(first.result(), time.time() - t0))
+        try:
+            second.result()
+        except SolveTimeout as e:
+            print('Setup2: {0} after {1:.2f} s'.format(e, time.time() - t0))
+        print('Setup3 cancelled before running: {0}'.format(third.cancelled()))
+
+        async def pipeline():
+            solving = solver.solve_async("Setup4")
+            postprocessed = 0
+            while not solving.done():
+                await asyncio.sleep(0.1)
+                postprocessed += 1
+            print('Setup4 result: {0}, {1} post-processing steps done meanwhile'.format(
+                  await solving, postprocessed))
+
+            solving = solver.solve_async("Setup5")
+            await asyncio.sleep(0.2)
+            solving.cancel()
+            await asyncio.sleep(0.1)
+
+        asyncio.run(pipeline())
+
+    print('COM calls: {0}'.format(', '.join('{0} x {1}'.format(oSolver.count(name), name)
+          for name in ('Solve', 'AreThereSimulationsRunning', 'StopSimulations'))))
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+"""
+Local spatial indexes for face-by-position and edge-by-position lookups.
+
+get_face_by_position() and get_edge_by_position() make one COM call per
+lookup.  A FaceIndex or EdgeIndex fetches the vertices of a body's faces or
+edges once, builds a bounding volume hierarchy over their bounding boxes, and
+then answers position lookups locally.  A lookup is sent to HFSS only when
+the local answer is ambiguous: the position lies on more than one face or
+edge, on none of them, or can't be evaluated without the design variables.
+
+Only planar faces and straight edges are indexed.  Curved faces and edges
+have no vertices, or vertices that don't bound them, so positions on them
+always fall back to HFSS.  A face is indexed by the polygons of its edge
+loops, holes included.  HFSS has no bulk geometry query, so rather than
+asking for the vertices of every edge, the edges are inferred from the
+faces' vertices: two faces that share exactly two vertices share the edge
+between them.  The first time a lookup lands on a face, its area is checked
+against the one HFSS reports, which rules out faces bounded by arcs between
+two vertices.
+
+Building a FaceIndex costs one COM call per face and one per vertex, and
+each face that answers a lookup costs one more.  An EdgeIndex costs one
+call per edge and one per vertex.  An index pays off when several positions
+are looked up on each face or edge of a body, e.g. when assigning boundaries
+on an imported model.  Pass a ShadowEditor to share the fetched data with
+other queries.
+
+Example Usage
+-------------
+>>> import hycohanz as hfss
+>>> index = hfss.FaceIndex(oEditor, "Chassis")
+>>> faceids = index.lookup_many([("1mm", 0, 0), ("0", "2mm", "3mm")])
+>>> index.local, index.remote
+(2, 0)
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import math
+import re
+
+from hycohanz import modeler3d
+from hycohanz.evaluator import UNITS, evaluate
+from hycohanz.expression import Expression
+
+# Maximum number of elements in a leaf of the bounding volume hierarchy.
+LEAF_SIZE = 4
+
+# Default tolerance, relative to the size of the body.
+RELATIVE_TOLERANCE = 1e-6
+
+# Relative difference allowed between a face's area and that of its edge
+# polygons.
+AREA_TOLERANCE = 1e-6
+
+# A number immediately followed by a unit, e.g. "0.5mm".
+_QUANTITY = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[A-Za-z]')
+
+
+def _bounds(points):
+    """Return the (lower, upper) corners of the bounding box of points."""
+    return (tuple(min(p[k] for p in points) for k in range(3)),
+            tuple(max(p[k] for p in points) for k in range(3)))
+
+
+def _build(items):
+    """
+    Build a bounding volume hierarchy over items, a list of
+    (lower, upper, element) tuples.
+
+    Nodes are (lower, upper, children, items) tuples, where leaves have
+    children None.  Each node is split at the median of its items along the
+    longest axis of its bounding box.
+    """
+    lower = tuple(min(item[0][k] for item in items) for k in range(3))
+    upper = tuple(max(item[1][k] for item in items) for k in range(3))
+    if len(items) <= LEAF_SIZE:
+        return (lower, upper, None, items)
+
+    axis = max(range(3), key=lambda k: upper[k] - lower[k])
+    items = sorted(items, key=lambda item: item[0][axis] + item[1][axis])
+    half = len(items) // 2
+    return (lower, upper, (_build(items[:half]), _build(items[half:])), None)
+
+
+def _search(root, point, tolerance):
+    """
+    Return the elements of the hierarchy whose bounding boxes, grown by
+    tolerance, contain point.
+    """
+    found = []
+    stack = [root]
+    while stack:
+        lower, upper, children, items = stack.pop()
+        if any(point[k] < lower[k] - tolerance or point[k] > upper[k] + tolerance for k in range(3)):
+            continue
+        if children is not None:
+            stack.extend(children)
+            continue
+        for itemlower, itemupper, element in items:
+            if all(itemlower[k] - tolerance <= point[k] <= itemupper[k] + tolerance for k in range(3)):
+                found.append(element)
+    return found
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _norm(a):
+    return math.sqrt(_dot(a, a))
+
+
+def _newell(loop):
+    """The normal of a polygon, as long as twice its area."""
+    normal = [0.0, 0.0, 0.0]
+    for p, q in zip(loop, loop[1:] + loop[:1]):
+        normal[0] += (p[1] - q[1]) * (p[2] + q[2])
+        normal[1] += (p[2] - q[2]) * (p[0] + q[0])
+        normal[2] += (p[0] - q[0]) * (p[1] + q[1])
+    return tuple(normal)
+
+
+def _shoelace(loop):
+    """The signed area of a 2D polygon."""
+    return sum(p[0] * q[1] - q[0] * p[1] for p, q in zip(loop, loop[1:] + loop[:1])) / 2
+
+
+def _inside(p, loops):
+    """Whether a 2D point lies inside the polygons by the even-odd rule."""
+    inside = False
+    for loop in loops:
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            if (a[1] > p[1]) != (b[1] > p[1]) and p[0] < a[0] + (p[1] - a[1]) * (b[0] - a[0]) / (b[1] - a[1]):
+                inside = not inside
+    return inside
+
+
+def _segment_distance(p, a, b):
+    """The distance from a 2D point to the segment from a to b."""
+    d = (b[0] - a[0], b[1] - a[1])
+    t = ((p[0] - a[0]) * d[0] + (p[1] - a[1]) * d[1]) / (d[0] * d[0] + d[1] * d[1] or 1.0)
+    t = min(1.0, max(0.0, t))
+    return math.hypot(p[0] - a[0] - t * d[0], p[1] - a[1] - t * d[1])
+
+
+def _loops(edges):
+    """
+    Chain edges, given as pairs of vertex ids, into closed loops of vertex
+    ids.  Returns None unless every vertex joins exactly two edges.
+    """
+    neighbours = {}
+    for a, b in edges:
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+    if any(len(ends) != 2 or ends[0] == ends[1] for ends in neighbours.values()):
+        return None
+    loops = []
+    unvisited = set(neighbours)
+    while unvisited:
+        start = min(unvisited)
+        loop = [start]
+        previous, current = start, neighbours[start][0]
+        while current != start:
+            loop.append(current)
+            previous, current = current, [v for v in neighbours[current] if v != previous][0]
+        unvisited.difference_update(loop)
+        loops.append(loop)
+    return loops
+
+
+class _PositionIndex(object):
+    """
+    Base class of FaceIndex and EdgeIndex.
+
+    Subclasses implement _elements(), which returns a list of
+    (element id, vertex ids), _shape(), which is called with the element id,
+    its vertex ids and their positions and returns the data used by
+    _distance() or None if the element can't be indexed, and _remote(), the
+    COM lookup.  They may override _check(), which is called the first time
+    an element lies at a looked up position and returns whether it really
+    can be answered locally.
+    """
+    def __init__(self, oEditor, bodyname, units=None, tolerance=None):
+        self.oEditor = oEditor
+        self.bodyname = bodyname
+        self.local = 0
+        self.remote = 0
+
+        if units is None:
+            units = modeler3d.get_model_units(oEditor)
+        self.units = units
+        self.scale = UNITS[units.lower()]
+
+        positions = {}
+
+        def position(vertexid):
+            try:
+                return positions[vertexid]
+            except KeyError:
+                pass
+            p = tuple(self.scale * c for c in modeler3d.get_vertex_position(oEditor, vertexid))
+            positions[vertexid] = p
+            return p
+
+        items = []
+        self.shapes = {}
+        self.checked = set()
+        self.unindexed = []
+        for element, vertexids in self._elements():
+            points = [position(vertexid) for vertexid in vertexids]
+            shape = self._shape(element, vertexids, points)
+            if shape is None:
+                self.unindexed.append(element)
+                continue
+            self.shapes[element] = shape
+            lower, upper = _bounds(points)
+            items.append((lower, upper, element))
+
+        if tolerance is None:
+            if positions:
+                lower, upper = _bounds(list(positions.values()))
+                size = _norm(_sub(upper, lower))
+            else:
+                size = 0.0
+            tolerance = RELATIVE_TOLERANCE * size or 1e-12
+        self.tolerance = tolerance
+
+        self.root = _build(items) if items else None
+
+    def _point(self, x, y, z):
+        """
+        Convert a position to meters, or return None if it can't be evaluated
+        locally.  Like HFSS, numbers without units are in model units.
+        """
+        point = []
+        for value in (x, y, z):
+            if isinstance(value, (int, float)):
+                point.append(self.scale * value)
+                continue
+            text = Expression(value).expr
+            try:
+                coordinate = float(evaluate(text))
+            except (KeyError, ValueError):
+                return None
+            if not _QUANTITY.search(text):
+                coordinate *= self.scale
+            point.append(coordinate)
+        return tuple(point)
+
+    def candidates(self, x, y, z):
+        """
+        Return the ids of the indexed elements that lie at the given position,
+        or None if the position can't be evaluated locally.
+        """
+        point = self._point(x, y, z)
+        if point is None:
+            return None
+        if self.root is None:
+            return []
+        found = []
+        for element in _search(self.root, point, self.tolerance):
+            shape = self.shapes.get(element)
+            if shape is None or self._distance(shape, point) > self.tolerance:
+                continue
+            if element not in self.checked:
+                if not self._check(element, shape):
+                    del self.shapes[element]
+                    self.unindexed.append(element)
+                    continue
+                self.checked.add(element)
+            found.append(element)
+        return found
+
+    def _check(self, element, shape):
+        return True
+
+    def lookup(self, x, y, z):
+        """
+        Return the id of the element at the given position, asking HFSS only
+        if the position doesn't identify exactly one indexed element.
+        """
+        found = self.candidates(x, y, z)
+        if found is not None and len(found) == 1:
+            self.local += 1
+            return found[0]
+
+        self.remote += 1
+        return self._remote(x, y, z)
+
+    def lookup_many(self, positions):
+        """
+        Return the ids of the elements at each of a sequence of (x, y, z)
+        positions.
+        """
+        return [self.lookup(x, y, z) for x, y, z in positions]
+
+
+class FaceIndex(_PositionIndex):
+    """
+    Index the planar faces of a body for get_face_by_position() lookups.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the body lives.
+    bodyname : str
+        Name of the body whose faces are indexed.
+    units : str
+        The model units.  If None, they are asked from HFSS.
+    tolerance : float
+        Distance in meters within which a position is considered to lie on a
+        face.  Defaults to a millionth of the size of the body.
+
+    Attributes
+    ----------
+    local : int
+        Number of lookups answered locally.
+    remote : int
+        Number of lookups sent to HFSS.
+    unindexed : list of int
+        Ids of the faces that couldn't be indexed because they aren't planar
+        or their edges couldn't be inferred.
+    """
+    def _elements(self):
+        elements = [(faceid, modeler3d.get_vertex_ids_from_face(self.oEditor, faceid))
+                    for faceid in modeler3d.get_face_ids(self.oEditor, self.bodyname)]
+
+        # Count the vertices each pair of faces shares.
+        faces = {}
+        for faceid, vertexids in elements:
+            for vertexid in set(vertexids):
+                faces.setdefault(vertexid, []).append(faceid)
+        shared = {}
+        for vertexid, faceids in faces.items():
+            for n, a in enumerate(faceids):
+                for b in faceids[n + 1:]:
+                    shared.setdefault((a, b), []).append(vertexid)
+
+        # Faces that share exactly two vertices share the edge between them.
+        # Other edges are missing, so the faces they bound can't be chained
+        # into loops and aren't indexed.
+        self.edges = dict((faceid, []) for faceid, vertexids in elements)
+        for (a, b), vertexids in shared.items():
+            if len(vertexids) == 2:
+                self.edges[a].append(tuple(vertexids))
+                self.edges[b].append(tuple(vertexids))
+        return elements
+
+    def _shape(self, faceid, vertexids, points):
+        """
+        Return the (unit normal, origin, projection axes, loops, area) of a
+        planar face, where the loops are the face's edge polygons projected
+        on the two axes.
+        """
+        if len(points) < 3:
+            return None
+        loops = _loops(self.edges[faceid])
+        if loops is None or sum(len(loop) for loop in loops) != len(set(vertexids)):
+            return None
+        positions = dict(zip(vertexids, points))
+        loops = [[positions[vertexid] for vertexid in loop] for loop in loops]
+
+        # Newell's method gives a robust normal for any simple polygon; the
+        # outer loop has the largest one.
+        normal = max((_newell(loop) for loop in loops), key=_norm)
+        length = _norm(normal)
+        if length == 0.0:
+            return None
+        normal = tuple(c / length for c in normal)
+
+        origin = points[0]
+        lower, upper = _bounds(points)
+        flatness = RELATIVE_TOLERANCE * _norm(_sub(upper, lower))
+        if any(abs(_dot(normal, _sub(p, origin))) > flatness for p in points):
+            return None
+
+        # Project on the coordinate plane most parallel to the face.
+        dropped = max(range(3), key=lambda k: abs(normal[k]))
+        axes = tuple(k for k in range(3) if k != dropped)
+        loops = [[(p[axes[0]], p[axes[1]]) for p in loop] for loop in loops]
+
+        # The area enclosed by the polygons, holes subtracted.
+        area = 0.0
+        for n, loop in enumerate(loops):
+            depth = sum(1 for m, other in enumerate(loops) if m != n and _inside(loop[0], [other]))
+            area += (-1) ** depth * abs(_shoelace(loop))
+        area /= abs(normal[dropped])
+        return (normal, origin, axes, loops, area)
+
+    def _check(self, faceid, shape):
+        """
+        The area of the face's polygons must be the face area, or some edges
+        aren't straight.
+        """
+        area = shape[4]
+        facearea = modeler3d.get_face_area(self.oEditor, faceid) * self.scale ** 2
+        return abs(area - facearea) <= AREA_TOLERANCE * facearea
+
+    def _distance(self, shape, point):
+        normal, origin, axes, loops, area = shape
+        distance = abs(_dot(normal, _sub(point, origin)))
+        if distance > self.tolerance:
+            return distance
+        p = (point[axes[0]], point[axes[1]])
+        # Positions on an edge are on both faces that share it.
+        if _inside(p, loops) or any(_segment_distance(p, a, b) <= self.tolerance
+                                    for loop in loops for a, b in zip(loop, loop[1:] + loop[:1])):
+            return distance
+        return float('inf')
+
+    def _remote(self, x, y, z):
+        return modeler3d.get_face_by_position(self.oEditor, self.bodyname, x, y, z)
+
+
+class EdgeIndex(_PositionIndex):
+    """
+    Index the straight edges of a body for get_edge_by_position() lookups.
+
+    Parameters
+    ----------
+    oEditor : pywin32 COMObject
+        The HFSS editor in which the body lives.
+    bodyname : str
+        Name of the body whose edges are indexed.
+    units : str
+        The model units.  If None, they are asked from HFSS.
+    tolerance : float
+        Distance in meters within which a position is considered to lie on an
+        edge.  Defaults to a millionth of the size of the body.
+
+    Attributes
+    ----------
+    local : int
+        Number of lookups answered locally.
+    remote : int
+        Number of lookups sent to HFSS.
+    unindexed : list of int
+        Ids of the edges that couldn't be indexed because they aren't
+        bounded by two vertices.
+    """
+    def _elements(self):
+        return [(edgeid, modeler3d.get_vertex_ids_from_edge(self.oEditor, edgeid))
+                for edgeid in modeler3d.get_edge_ids(self.oEditor, self.bodyname)]
+
+    def _shape(self, edgeid, vertexids, points):
+        """Return the (start, end) of the edge."""
+        if len(points) != 2 or points[0] == points[1]:
+            return None
+        return tuple(points)
+
+    @staticmethod
+    def _distance(shape, point):
+        start, end = shape
+        direction = _sub(end, start)
+        t = _dot(_sub(point, start), direction) / _dot(direction, direction)
+        t = min(1.0, max(0.0, t))
+        closest = tuple(start[k] + t * direction[k] for k in range(3))
+        return _norm(_sub(point, closest))
+
+    def _remote(self, x, y, z):
+        return modeler3d.get_edge_by_position(self.oEditor, self.bodyname, x, y, z)
+
+
+if __name__ == "__main__":
+    import itertools
+    import timeit
+
+    from hycohanz.standin import RecordingEditor
+
+    def body(faces, areas=None):
+        """
+        A stand-in editor whose body "Plate" has the given planar faces, each
+        a list of vertex loops in mm, outer loop first.  areas overrides the
+        area HFSS reports for some faces, e.g. to make an edge an arc.
+        """
+        vertices = {}
+        facevertices = {}
+        areas = dict(areas or {})
+
+        for faceid, loops in enumerate(faces, 1):
+            facevertices[faceid] = tuple(sorted(set(vertices.setdefault(p, len(vertices) + 1)
+                                                    for loop in loops for p in loop)))
+            areas.setdefault(faceid, _norm(_newell(loops[0])) / 2 - sum(_norm(_newell(loop)) / 2
+                                                                          for loop in loops[1:]))
+        positions = dict((v, tuple(str(c) for c in p)) for p, v in vertices.items())
+
+        return RecordingEditor({'GetModelUnits': 'mm',
+                                'GetFaceIDs': lambda name: tuple(facevertices),
+                                'GetVertexIDsFromFace': lambda faceid: facevertices[faceid],
+                                'GetFaceArea': lambda faceid: areas[faceid],
+                                'GetVertexPosition': lambda vertexid: positions[vertexid],
+                                'GetFaceByPosition': 0})
+
+    def prism(loops, z0, z1):
+        """The faces of a prism with the given (x, y) loops as its ends."""
+        faces = [[[(x, y, z) for x, y in loop] for loop in loops] for z in (z0, z1)]
+        for loop in loops:
+            for (xa, ya), (xb, yb) in zip(loop, loop[1:] + loop[:1]):
+                faces.append([[(xa, ya, z0), (xb, yb, z0), (xb, yb, z1), (xa, ya, z1)]])
+        return faces
+
+    def tiled_plate(N):
+        """
+        A 1 mm-thick plate of N x N unit-square top faces, a bottom face and
+        four sides.
+        """
+        faces = [[[(i, j, 1), (i + 1, j, 1), (i + 1, j + 1, 1), (i, j + 1, 1)]]
+                 for i, j in itertools.product(range(N), repeat=2)]
+        faces.append([[(0, 0, 0), (N, 0, 0), (N, N, 0), (0, N, 0)]])
+        for corner, step in (((0, 0), (1, 0)), ((N, 0), (0, 1)), ((N, N), (-1, 0)), ((0, N), (0, -1))):
+            top = [(corner[0] + n * step[0], corner[1] + n * step[1], 1) for n in range(N + 1)]
+            faces.append([top + [(top[-1][0], top[-1][1], 0), (top[0][0], top[0][1], 0)]])
+        return body(faces)
+
+    # An L-shaped prism and a square prism with a square hole: positions in
+    # the notch and in the hole are not on their end faces, 1 and 9, so they
+    # go to HFSS.
+    faces = prism([[(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)]], 0, -1)
+    faces += prism([[(0, 0), (3, 0), (3, 3), (0, 3)], [(1, 1), (2, 1), (2, 2), (1, 2)]], 1, 2)
+    index = FaceIndex(body(faces), "Plate")
+    assert index.candidates("0.5mm", "1.5mm", 0) == [1]
+    assert index.candidates("1.5mm", "1.5mm", 0) == []
+    assert index.candidates("0.5mm", "0.5mm", "1mm") == [9]
+    assert index.candidates("1.5mm", "1.5mm", "1mm") == []
+    # On the edge of the hole: the face and a side of the hole.
+    assert len(index.candidates("1mm", "1.5mm", "1mm")) == 2
+    assert 9 in index.candidates("1mm", "1.5mm", "1mm")
+    assert not index.unindexed
+
+    # A face whose area doesn't match its polygon has an arc for an edge.
+    index = FaceIndex(body(prism([[(0, 0), (1, 0), (1, 1), (0, 1)]], 0, 1), areas={1: 1.2}), "Plate")
+    assert index.candidates("0.5mm", "0.5mm", 0) == []
+    assert index.unindexed == [1]
+
+    # Four lookups per face, e.g. a port, a boundary and two field probes.
+    N = 32
+    queries = [("{0}mm".format(i + di), "{0}mm".format(j + dj), "1mm")
+               for i, j in itertools.product(range(N), repeat=2)
+               for di, dj in ((0.25, 0.25), (0.75, 0.25), (0.25, 0.75), (0.75, 0.75))]
+
+    oEditor = tiled_plate(N)
+    for x, y, z in queries:
+        modeler3d.get_face_by_position(oEditor, "Plate", x, y, z)
+    direct = oEditor.round_trips
+
+    oEditor = tiled_plate(N)
+    index = FaceIndex(oEditor, "Plate")
+    build = oEditor.round_trips
+    index.lookup_many(queries)
+    print('{0} face lookups on {1} faces:'.format(len(queries), N * N + 5))
+    print('  direct:     {0:5d} COM calls'.format(direct))
+    print('  FaceIndex:  {0:5d} COM calls ({1} to build, {2} to check faces; {3} lookups local)'.format(
+          oEditor.round_trips, build, oEditor.round_trips - build, index.local))
+    assert oEditor.round_trips < direct
+
+    t = timeit.timeit(lambda: index.lookup_many(queries), number=5) / 5 / len(queries)
+    print('  local lookup:  {0:.1f} us each'.format(1e6 * t))
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in objects that mimic the HFSS COM objects closely enough to exercise
+hycohanz without a running HFSS process.
+
+These are intended for benchmarking and for checking the number and content
+of the COM calls issued by hycohanz functions.  They perform no geometry
+work at all.
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+import threading
+
+from hycohanz.appobject import register_backend
+
+
+class ComError(RuntimeError):
+    """
+    Raised by the stand-ins where HFSS raises pywintypes.com_error, i.e. when
+    it fails an operation.
+    """
+
+
+def _requested_name(args):
+    """
+    Return the "Name:=" value of the first attributes array in args, if any.
+    """
+    for arg in args:
+        if isinstance(arg, list) and arg and arg[0] == "NAME:Attributes":
+            try:
+                return arg[arg.index("Name:=") + 1]
+            except ValueError:
+                return None
+    return None
+
+
+class RecordingEditor(object):
+    """
+    A stand-in for an HFSS COM object (usually the "3D Modeler" editor) that
+    records every method call instead of performing it.
+
+    Each call counts as one COM round-trip.  Calls to Create*() methods return
+    the requested object name, calls to Get*() methods return an empty tuple,
+    and everything else returns None, unless a different return value is
+    registered in `returns`.
+
+    Parameters
+    ----------
+    returns : dict
+        Maps method names to return values.  A callable value is called with
+        the method arguments and its result is returned.
+
+    Attributes
+    ----------
+    calls : list of tuple
+        (method name, argument tuple) for every call, in call order.
+    """
+    def __init__(self, returns=None):
+        self.calls = []
+        self.returns = dict(returns or {})
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def method(*args):
+            self.calls.append((name, args))
+            if name in self.returns:
+                value = self.returns[name]
+                return value(*args) if callable(value) else value
+            if name.startswith('Create'):
+                return _requested_name(args)
+            if name.startswith('Get'):
+                return ()
+            return None
+
+        return method
+
+    @property
+    def round_trips(self):
+        """The number of COM calls made so far."""
+        return len(self.calls)
+
+    def count(self, name):
+        """Return the number of calls made to the given method."""
+        return sum(1 for called, _ in self.calls if called == name)
+
+    def reset(self):
+        """Forget all recorded calls."""
+        del self.calls[:]
+
+
+class FakeSolver(RecordingEditor):
+    """
+    A stand-in for both the HFSS desktop and design objects whose Solve()
+    takes a fixed amount of time instead of solving anything.
+
+    Solve() blocks for `duration` seconds, or until StopSimulations() is
+    called from another thread, and returns 0 if it ran to completion and 1
+    if it was stopped, like HFSS.  AreThereSimulationsRunning() reports
+    whether a Solve() is in progress.  All calls are recorded.
+
+    Parameters
+    ----------
+    duration : float
+        Duration of each Solve() call, in seconds.
+    returns : dict
+        See RecordingEditor.
+    """
+    def __init__(self, duration=1.0, returns=None):
+        super(FakeSolver, self).__init__(returns)
+        self.duration = duration
+        self.stopped = threading.Event()
+        self.running = threading.Event()
+
+    def Solve(self, setups):
+        self.calls.append(('Solve', (setups,)))
+        self.stopped.clear()
+        self.running.set()
+        try:
+            stopped = self.stopped.wait(self.duration)
+        finally:
+            self.running.clear()
+        return 1 if stopped else 0
+
+    def AreThereSimulationsRunning(self):
+        self.calls.append(('AreThereSimulationsRunning', ()))
+        return self.running.is_set()
+
+    def StopSimulations(self):
+        self.calls.append(('StopSimulations', ()))
+        self.stopped.set()
+
+
+class FakeFieldsReporter(RecordingEditor):
+    """
+    A stand-in for the HFSS "FieldsReporter" module that keeps a symbolic
+    Fields Calculator stack.
+
+    Each stack entry is the text of an expression, e.g.
+    "Maximum(Mag(E), Substrate)".  Named expressions are kept by name.
+    Stack underflow and unknown named expressions raise ComError, like the
+    COM errors HFSS raises.  All calls are recorded.
+
+    Parameters
+    ----------
+    values : callable
+        Called as values(expression, solutionname, variablesarray) by
+        GetTopEntryValue() and ClcEval(), and its result returned.  By
+        default the result is ['0'].
+    returns : dict
+        See RecordingEditor.
+
+    Attributes
+    ----------
+    stack : list of str
+        The calculator stack, bottom first.
+    named : dict
+        Maps named expression names to expressions.
+    """
+    def __init__(self, values=None, returns=None):
+        super(FakeFieldsReporter, self).__init__(returns)
+        self.values = values or (lambda expression, solutionname, variablesarray: ['0'])
+        self.stack = []
+        self.named = {}
+
+    def _pop(self, n):
+        if len(self.stack) < n:
+            raise ComError('Calculator stack underflow')
+        popped = self.stack[len(self.stack) - n:]
+        del self.stack[len(self.stack) - n:]
+        return popped
+
+    def _enter(self, method, value):
+        self.calls.append((method, (value,)))
+        self.stack.append(str(value))
+
+    def EnterQty(self, FieldQuantityString):
+        self._enter('EnterQty', FieldQuantityString)
+
+    def EnterVol(self, VolumeName):
+        self._enter('EnterVol', VolumeName)
+
+    def EnterSurf(self, SurfaceName):
+        self._enter('EnterSurf', SurfaceName)
+
+    def EnterLine(self, LineName):
+        self._enter('EnterLine', LineName)
+
+    def EnterScalar(self, Scalar):
+        self._enter('EnterScalar', Scalar)
+
+    def CalcOp(self, OperationString):
+        from hycohanz.calculator import OPERATIONS
+
+        self.calls.append(('CalcOp', (OperationString,)))
+        signature = OPERATIONS.get(OperationString, {(None,): None})
+        operands = self._pop(len(next(iter(signature))))
+        self.stack.append('{0}({1})'.format(OperationString, ', '.join(operands)))
+
+    def CalcStack(self, StackOperation):
+        self.calls.append(('CalcStack', (StackOperation,)))
+        if StackOperation == 'clear':
+            del self.stack[:]
+        elif StackOperation == 'push':
+            self.stack.extend(self._pop(1) * 2)
+        elif StackOperation == 'pop':
+            self._pop(1)
+        elif StackOperation == 'exch':
+            self.stack.extend(reversed(self._pop(2)))
+        elif StackOperation == 'rlup':
+            self.stack.insert(0, self._pop(1)[0])
+        elif StackOperation == 'rldn':
+            self.stack.extend(self._pop(1))
+            self.stack.append(self.stack.pop(0))
+
+    def AddNamedExpression(self, Name, FieldType):
+        self.calls.append(('AddNamedExpression', (Name, FieldType)))
+        if not self.stack:
+            raise ComError('Calculator stack underflow')
+        self.named[Name] = self.stack[-1]
+
+    def DeleteNamedExpr(self, Name):
+        self.calls.append(('DeleteNamedExpr', (Name,)))
+        try:
+            del self.named[Name]
+        except KeyError:
+            raise ComError('No named expression {0!r}'.format(Name))
+
+    def CopyNamedExprToStack(self, Name):
+        self.calls.append(('CopyNamedExprToStack', (Name,)))
+        try:
+            self.stack.append(self.named[Name])
+        except KeyError:
+            raise ComError('No named expression {0!r}'.format(Name))
+
+    def GetTopEntryValue(self, solutionname, variablesarray):
+        self.calls.append(('GetTopEntryValue', (solutionname, variablesarray)))
+        if not self.stack:
+            raise ComError('Calculator stack underflow')
+        return self.values(self.stack[-1], solutionname, variablesarray)
+
+    def ClcEval(self, solutionname, variablesarray):
+        self.calls.append(('ClcEval', (solutionname, variablesarray)))
+        if not self.stack:
+            raise ComError('Calculator stack underflow')
+        self.stack.append(str(self.values(self.stack.pop(), solutionname, variablesarray)[0]))
+
+
+def _standin_interface():
+    """
+    Return recording stand-ins for oAnsoftApp and oDesktop.
+    """
+    oDesktop = RecordingEditor()
+    return [RecordingEditor({'GetAppDesktop': oDesktop}), oDesktop]
+
+register_backend('standin', _standin_interface, errors=(ComError,))
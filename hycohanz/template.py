@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable parametric components.
+
+A Template is a function that draws a component, e.g. a patch with its
+feed, in terms of named design variables, together with the default values
+of those variables.  Instantiating it creates the variables, prefixed so
+that several instances don't share them, in a single ChangeProperty call,
+and draws the component with its dimensions bound to the variables as
+Expressions.  Re-parameterizing an instance then changes all its variables
+in one more ChangeProperty call, instead of one set_variable() call per
+variable and without redrawing anything.
+
+Example Usage
+-------------
+>>> import hycohanz as hfss
+>>> from hycohanz.template import Template
+>>> def draw(oEditor, v, name):
+...     return [hfss.create_box(oEditor, v.x, 0, 0, v.w, v.w * 1.2, '0.035mm', Name=name)]
+>>> patch = Template(draw, x='0mm', w='3mm')
+>>> p1 = patch.instantiate(oDesign, oEditor, 'p1', x='0mm')
+>>> p2 = patch.instantiate(oDesign, oEditor, 'p2', x='10mm')
+>>> p2.set(w='3.2mm')
+
+"""
+from __future__ import division, print_function, unicode_literals, absolute_import
+
+from hycohanz.expression import Expression
+from hycohanz.property import change_variables
+
+
+class Variables(dict):
+    """
+    Maps a template's variable names to Expressions of the instance's
+    design variables.  Values can also be read as attributes, e.g. v.w.
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Template(object):
+    """
+    A component drawn as a function of named variables.
+
+    Parameters
+    ----------
+    draw : callable
+        Called as draw(oEditor, v, name), where v is a Variables mapping and
+        name the instance name, to draw the component.  It returns the names
+        of the parts it created.
+    separator : str
+        Put between the instance name and the variable name to form the
+        design variable name, e.g. "p1_w".
+    **defaults
+        The template's variables and their default values.
+    """
+    def __init__(self, draw, separator='_', **defaults):
+        self.draw = draw
+        self.separator = separator
+        self.defaults = defaults
+
+    def variable(self, name, variable):
+        """The design variable name of a template variable in an instance."""
+        return '{0}{1}{2}'.format(name, self.separator, variable)
+
+    def instantiate(self, oDesign, oEditor, name, **values):
+        """
+        Create an instance's variables and draw it.
+
+        Parameters
+        ----------
+        oDesign : pywin32 COMObject
+            The HFSS design in which the variables are created.
+        oEditor : pywin32 COMObject
+            The 3D Modeler editor in which the component is drawn.
+        name : str
+            Name of the instance, used as prefix of its variables.
+        **values
+            Values overriding the template defaults.
+
+        Returns
+        -------
+        instance : Instance
+        """
+        unknown = set(values) - set(self.defaults)
+        if unknown:
+            raise ValueError('Unknown template variables: {0}'.format(', '.join(sorted(unknown))))
+        current = dict(self.defaults, **values)
+        change_variables(oDesign, new=dict((self.variable(name, variable), value)
+                                           for variable, value in sorted(current.items())))
+        v = Variables((variable, Expression(self.variable(name, variable))) for variable in current)
+        parts = self.draw(oEditor, v, name)
+        return Instance(self, oDesign, name, current, parts)
+
+
+class Instance(object):
+    """
+    A drawn instance of a Template.
+
+    Attributes
+    ----------
+    name : str
+        The instance name.
+    values : dict
+        The current values of the template variables.
+    parts : list of str
+        The names of the parts drawn.
+    """
+    def __init__(self, template, oDesign, name, values, parts):
+        self.template = template
+        self.oDesign = oDesign
+        self.name = name
+        self.values = values
+        self.parts = parts
+
+    def set(self, **values):
+        """
+        Change template variables of this instance, in one ChangeProperty
+        call.  Variables whose value doesn't change are left out.
+        """
+        unknown = set(values) - set(self.values)
+        if unknown:
+            raise ValueError('Unknown template variables: {0}'.format(', '.join(sorted(unknown))))
+        changed = dict((variable, value) for variable, value in values.items()
+                       if Expression(value).expr != Expression(self.values[variable]).expr)
+        change_variables(self.oDesign, changed=dict((self.template.variable(self.name, variable), value)
+                                                    for variable, value in sorted(changed.items())))
+        self.values.update(changed)
+
+
+if __name__ == "__main__":
+    from hycohanz.modeler3d import create_box
+    from hycohanz.property import add_property, set_variable
+    from hycohanz.standin import RecordingEditor
+
+    N = 20
+    defaults = dict(('d{0}'.format(n), '{0}mm'.format(n + 1)) for n in range(N))
+
+    def draw(oEditor, v, name):
+        return [create_box(oEditor, v.d0, v.d1, 0, v.d2, v.d3 * 2, '0.035mm', Name=name)]
+
+    oDesign, oEditor = RecordingEditor(), RecordingEditor()
+    oDesign.returns['GetActiveDesign'] = oDesign
+    for variable, value in sorted(defaults.items()):
+        add_property(oDesign, 'p1_' + variable, value)
+    for variable in sorted(defaults):
+        set_variable(oDesign, 'p1_' + variable, '9mm')
+    before = oDesign.count('ChangeProperty'), oDesign.count('SetVariableValue')
+
+    oDesign.reset()
+    instance = Template(draw, **defaults).instantiate(oDesign, oEditor, 'p1')
+    instance.set(**dict((variable, '9mm') for variable in defaults))
+    print('Template with {0} variables, instantiated then re-parameterized:'.format(N))
+    print('  add_property() and set_variable() per variable:  {0} ChangeProperty + {1} SetVariableValue '
+          'calls'.format(*before))
+    print('  Template.instantiate() and Instance.set():       {0} ChangeProperty calls'.format(
+          oDesign.count('ChangeProperty')))
@@ -1,5 +1,6 @@
 from __future__ import division, print_function, unicode_literals, absolute_import
 
+import re
 import warnings
 from hycohanz.expression import Expression as Ex
 
@@ -40,6 +41,137 @@ def collect_parameters_and_attributes(parameters, attributes, parametersName):
     return parameterList, attributeList
 
 
+# A number with an optional unit, e.g. "2.0 mm".
+_QUANTITY = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([A-Za-z]*)\s*$')
+
+
+def canonical_value(value):
+    """
+    Return the canonical text of a variable value.
+
+    Numbers are printed with 12 significant digits, which also absorbs
+    floating point noise such as 0.1 + 0.2, directly followed by their unit.
+    Units keep their case, since HFSS units are case sensitive: "1mHz" is
+    not "1MHz".  Other expressions only lose their whitespace.
+    """
+    expr = Ex(value).expr
+    match = _QUANTITY.match(expr)
+    if match is None:
+        return ''.join(expr.split())
+    number, unit = match.groups()
+    return '{0:.12g}{1}'.format(float(number), unit)
+
+
+_PLAIN_TYPES = frozenset([float, str, int, bool])
+
+
+class ArgumentSchema(object):
+    """
+    The precomputed layout of the argument arrays of one HFSS COM function.
+
+    collect_parameters_and_attributes() rebuilds the "key:=" strings and the
+    default attributes on every call.  An ArgumentSchema does that work once,
+    so that building the COM argument arrays for a call only has to place
+    the values.
+
+    Parameters
+    ----------
+    parametersName : str
+        Name of the parameters array, e.g. 'RectangleParameters'.
+    functionName : str
+        Name of the COM method to call, e.g. 'CreateRectangle'.
+    parameterNames : sequence of str
+        The parameter names in the order their values are given.
+        Underscores are replaced by spaces in the emitted keys.
+    defaultAttributes : dict or None
+        Attributes used when the caller doesn't provide them.  If None, the
+        function takes no attributes array unless one is given.
+
+    """
+    def __init__(self, parametersName, functionName, parameterNames, defaultAttributes=None):
+        self.parametersName = parametersName
+        self.functionName = functionName
+        self.parameterNames = tuple(parameterNames)
+        self.header = "NAME:{0}".format(parametersName)
+        self.keys = tuple('{0}:='.format(k.replace('_', ' ')) for k in self.parameterNames)
+
+        if defaultAttributes is None:
+            self.defaultAttributes = None
+            self.defaultAttributeList = []
+        else:
+            self.defaultAttributes = dict(defaultAttributes)
+            self.defaultAttributeList = ['NAME:Attributes']
+            for k, v in self.defaultAttributes.items():
+                self.defaultAttributeList.extend(['{0}:='.format(k), v])
+
+    def parameters(self, values):
+        """
+        Return the parameters array for the given values, which are in the
+        order of parameterNames.  Values that aren't expressions or plain
+        numbers, strings or bools are skipped.
+        """
+        parameterList = [self.header]
+        for key, v in zip(self.keys, values):
+            cls = v.__class__
+            if cls is Ex:
+                v = v.expr
+            elif cls not in _PLAIN_TYPES:
+                if isinstance(v, Ex):
+                    v = v.expr
+                elif not isinstance(v, (float, str, int, bool)):
+                    continue
+            parameterList += (key, v)
+
+        return parameterList
+
+    def attributes(self, attributes=None):
+        """
+        Return the attributes array for the given attributes dict, filling
+        in the default attributes that it doesn't override.
+        """
+        if attributes is None or (not attributes and self.defaultAttributes is not None):
+            return self.defaultAttributeList[:]
+
+        attributeList = ['NAME:Attributes']
+        for k, v in attributes.items():
+            attributeList += ('{0}:='.format(k), v)
+
+        if self.defaultAttributes is not None:
+            for k, v in self.defaultAttributes.items():
+                if k not in attributes:
+                    attributeList += ('{0}:='.format(k), v)
+
+        return attributeList
+
+    def call(self, comObj, values, attributes=None):
+        """
+        Call the COM function on comObj with the given parameter values and
+        attributes dict.
+        """
+        attributeList = self.attributes(attributes)
+        if attributeList:
+            return getattr(comObj, self.functionName)(self.parameters(values), attributeList)
+        else:
+            return getattr(comObj, self.functionName)(self.parameters(values))
+
+
+_SCHEMAS = {}
+
+
+def get_schema(parametersName, functionName, parameterNames, defaultAttributes=None):
+    """
+    Return the ArgumentSchema for the given function, compiling it on first
+    use.  defaultAttributes is only used when the schema is compiled.
+    """
+    key = (parametersName, functionName, tuple(parameterNames))
+    try:
+        return _SCHEMAS[key]
+    except KeyError:
+        schema = ArgumentSchema(parametersName, functionName, parameterNames, defaultAttributes)
+        _SCHEMAS[key] = schema
+        return schema
+
+
 def hfss_com_wrapper(comObj, parameters, attributes, parametersName, functionName):
     """
 
@@ -50,8 +182,44 @@ def hfss_com_wrapper(comObj, parameters, attributes, parametersName, functionNam
     :param functionName:
     :return:
     """
-    parameters, attributes = collect_parameters_and_attributes(parameters, attributes, parametersName)
-    if attributes:
-        return getattr(comObj, functionName)(parameters, attributes)
-    else:
-        return getattr(comObj, functionName)(parameters)
\ No newline at end of file
+    schema = get_schema(parametersName, functionName, parameters.keys())
+    return schema.call(comObj, parameters.values(), attributes)
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from hycohanz.standin import RecordingEditor
+
+    N = 100000
+    names = ('xStart', 'yStart', 'zStart', 'width', 'height', 'whichAxis')
+    defaults = {'partCoordinateSystem': 'Global',
+                'materialName': 'vacuum',
+                'solveInside': 'True'}
+    calls = [((0.001 * n, Ex('{0}mm'.format(n)), 0, 1e-3, 2e-3, 'z'),
+              {'name': 'Rect{0}'.format(n)} if n % 2 else {})
+             for n in range(N)]
+    schema = ArgumentSchema('RectangleParameters', 'CreateRectangle', names, defaults)
+
+    def per_call_dict():
+        for values, attributes in calls:
+            attributes = dict(attributes)
+            for k, v in defaults.items():
+                if k not in attributes:
+                    attributes[k] = v
+            collect_parameters_and_attributes(dict(zip(names, values)), attributes,
+                                              'RectangleParameters')
+
+    def compiled_schema():
+        for values, attributes in calls:
+            schema.parameters(values)
+            schema.attributes(attributes)
+
+    before = min(timeit.repeat(per_call_dict, number=1, repeat=3)) / N
+    after = min(timeit.repeat(compiled_schema, number=1, repeat=3)) / N
+    print('collect_parameters_and_attributes:  {0:.2f} us/call'.format(1e6 * before))
+    print('ArgumentSchema:                     {0:.2f} us/call'.format(1e6 * after))
+
+    oEditor = RecordingEditor()
+    schema.call(oEditor, *calls[1])
+    print(oEditor.calls[0])